@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+多账号Cookie池 - 每个店小秘账号一份Cookie和独立的限流预算
+
+店小秘按账号限流，只用一个账号的Cookie时，整个服务的吞吐量就是一个账号的预算。
+在 config.COOKIE_ACCOUNTS 中配置多个账号后：
+
+- 每个账号有自己的Cookie文件（CookieManager下载和缓存）、自己的共享令牌桶
+  （SQLite中名为 account:<账号名> 的桶）和自己的自适应速率控制器，
+  一个账号被上游限流不影响其他账号，总吞吐量随账号数线性增长
+- 默认路由到负载最低的健康账号: (排队数 + 进行中请求数) / 当前速率
+- sticky: 相同的sticky键总是路由到同一个账号（rendezvous哈希），该账号不健康时换到下一个，
+  增减账号只影响原本落在该账号上的键
+- account: 指定账号名，只使用这个账号
+- 配置了 RATE_LIMIT_FAMILIES 时，每个账号每个端点族还有一个子令牌桶（account:<账号名>:<端点族>）
+- Cookie获取失败的账号在 COOKIE_ACCOUNT_RETRY_INTERVAL 秒内不参与路由
+- prepare() 之后每个账号的Cookie由后台线程在过期前刷新，请求不等待下载
+
+未配置 COOKIE_ACCOUNTS 时只有一个 'default' 账号，使用 COOKIE_URL / LOCAL_COOKIE_PATH
+和原来的 'default' 令牌桶，行为与单账号版本相同。
+"""
+import os
+import time
+import hashlib
+import threading
+
+import config
+from cookie_manager import CookieManager
+from cookie_store import get_cookie_store
+from rate_limiter import PriorityLimiter, create_family_limiters, create_rate_limiter
+from adaptive_rate import create_rate_controller
+from fair_queue import get_fair_scheduler
+
+
+DEFAULT_ACCOUNT = 'default'
+
+
+class Account:
+    """一个店小秘账号: Cookie + 限流器 + 自适应速率控制器"""
+
+    def __init__(self, name, cookie_url=None, local_path=None, rate=None):
+        """
+        Args:
+            name: 账号名
+            cookie_url: Cookie文件的远程URL
+            local_path: 本地Cookie文件路径
+            rate: 初始速率（次/秒），默认 config.RATE_LIMIT_RATE
+        """
+        self.name = name
+        self.cookie_manager = CookieManager(cookie_url=cookie_url, local_path=local_path)
+        bucket = DEFAULT_ACCOUNT if name == DEFAULT_ACCOUNT else f'account:{name}'
+        self.limiter = PriorityLimiter(create_rate_limiter(bucket, rate=rate), fair=get_fair_scheduler(),
+                                       families=create_family_limiters(bucket))
+        self.rate_controller = create_rate_controller(self.limiter)
+        self.cookie_path = None
+        self.in_flight = 0
+        self.requests = 0
+        self.cookie_failures = 0
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+
+    def ensure_cookie(self):
+        """
+        确保Cookie文件可用（首次调用可能需要下载，会阻塞）
+
+        Returns:
+            str: 本地Cookie文件路径
+
+        Raises:
+            Exception: 无法获取Cookie（账号暂停路由）
+        """
+        if self.cookie_path is None:
+            path = self.cookie_manager.get_cookie_path()
+            if not path:
+                self.mark_down()
+                raise Exception(f"账号 {self.name} 无法获取Cookie，请检查网络连接")
+            self.cookie_path = path
+        return self.cookie_path
+
+    def cookie_header(self):
+        """
+        获取Cookie请求头（来自进程内的CookieStore）
+
+        Raises:
+            Exception: 读取Cookie失败（账号暂停路由）
+        """
+        path = self.ensure_cookie()  # 失败时已经暂停路由，直接抛出
+        try:
+            return get_cookie_store(path).get_cookie_header()
+        except Exception as e:
+            self.mark_down()
+            raise Exception(f"读取Cookie失败: {e}")
+
+    def mark_down(self):
+        """Cookie不可用，暂停路由一段时间"""
+        with self._lock:
+            self.cookie_failures += 1
+            self._down_until = time.monotonic() + config.COOKIE_ACCOUNT_RETRY_INTERVAL
+        print(f"[AccountPool] ⚠️  账号 {self.name} 的Cookie不可用，"
+              f"{config.COOKIE_ACCOUNT_RETRY_INTERVAL} 秒内不再路由到该账号")
+
+    def healthy(self, now=None):
+        """账号当前是否参与路由"""
+        return (time.monotonic() if now is None else now) >= self._down_until
+
+    def load(self):
+        """负载: 排队和进行中的请求按当前速率需要多少秒处理完"""
+        return (self.limiter.waiting() + self.in_flight + 1) / max(self.limiter.rate, 0.001)
+
+    def begin(self):
+        """请求开始发往上游"""
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+
+    def end(self):
+        """请求结束"""
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        """账号统计信息"""
+        return {
+            'name': self.name,
+            'healthy': self.healthy(),
+            'cookie_available': self.cookie_path is not None,
+            'cookie_failures': self.cookie_failures,
+            'cookie_refresh': self.cookie_manager.refresher.stats(),
+            'rate': round(self.limiter.rate, 3),
+            'waiting': self.limiter.waiting(),
+            'in_flight': self.in_flight,
+            'requests': self.requests
+        }
+
+
+class AccountPool:
+    """账号池 - 为每个请求选择账号"""
+
+    def __init__(self, accounts):
+        """
+        Args:
+            accounts: Account列表（第一个为主账号）
+        """
+        if not accounts:
+            raise ValueError("账号池至少需要一个账号")
+        self.accounts = list(accounts)
+        self._by_name = {account.name: account for account in self.accounts}
+
+    @property
+    def primary(self):
+        """主账号（用于解析优先级通道等与账号无关的操作）"""
+        return self.accounts[0]
+
+    def names(self):
+        return [account.name for account in self.accounts]
+
+    def get(self, name):
+        """
+        按名称获取账号
+
+        Raises:
+            ValueError: 账号不存在
+        """
+        account = self._by_name.get(name)
+        if account is None:
+            raise ValueError(f"不存在的账号: {name}，可选值: {', '.join(self.names())}")
+        return account
+
+    def select(self, account=None, sticky=None):
+        """
+        为请求选择账号
+
+        Args:
+            account: 指定账号名，None表示自动选择
+            sticky: sticky键，相同的键总是选择同一个健康账号
+
+        Returns:
+            Account
+
+        Raises:
+            ValueError: 指定的账号不存在
+        """
+        if account:
+            return self.get(account)
+        if len(self.accounts) == 1:
+            return self.accounts[0]
+
+        now = time.monotonic()
+        candidates = [a for a in self.accounts if a.healthy(now)] or self.accounts
+        if sticky is not None and sticky != '':
+            return max(candidates, key=lambda a: _rendezvous_score(sticky, a.name))
+        return min(candidates, key=lambda a: a.load())
+
+    def prepare(self):
+        """
+        预先获取所有账号的Cookie，并启动后台刷新线程
+
+        Returns:
+            int: Cookie可用的账号数
+
+        Raises:
+            Exception: 所有账号都无法获取Cookie
+        """
+        ready = 0
+        for account in self.accounts:
+            try:
+                account.ensure_cookie()
+                ready += 1
+            except Exception as e:
+                print(f"[AccountPool] ✗ {e}")
+            # 获取失败的账号也启动，后台线程会按间隔重试下载
+            account.cookie_manager.start_refresher()
+        if not ready:
+            raise Exception("无法获取Cookie，请检查网络连接")
+        print(f"[AccountPool] ✓ {ready}/{len(self.accounts)} 个账号的Cookie可用")
+        return ready
+
+    def stats(self):
+        """各账号统计信息"""
+        return [account.stats() for account in self.accounts]
+
+    def cookie_ages(self):
+        """
+        各账号Cookie文件距上次下载的秒数（/metrics 的 dxm_cookie_age_seconds）
+
+        Returns:
+            dict: {(('account', 账号名),): 秒数}，Cookie文件不存在的账号不输出
+        """
+        ages = {}
+        for account in self.accounts:
+            age = account.cookie_manager.refresher.age()
+            if age is not None:
+                ages[(('account', account.name),)] = age
+        return ages
+
+
+def _rendezvous_score(key, name):
+    """rendezvous哈希分数（分数最高的账号胜出）"""
+    return hashlib.md5(f'{key}\0{name}'.encode('utf-8')).digest()
+
+
+def create_account_pool():
+    """
+    根据 config.COOKIE_ACCOUNTS 创建账号池
+
+    Returns:
+        AccountPool
+    """
+    specs = config.COOKIE_ACCOUNTS or [{'name': DEFAULT_ACCOUNT, 'cookie_url': config.COOKIE_URL}]
+    accounts = []
+    for spec in specs:
+        name = spec['name']
+        local_path = spec.get('local_path')
+        if local_path is None:
+            local_path = config.LOCAL_COOKIE_PATH if name == DEFAULT_ACCOUNT else \
+                os.path.join(config.COOKIE_CACHE_DIR, f'dxm_cookie_{name}.json')
+        accounts.append(Account(name, spec['cookie_url'], local_path, spec.get('rate')))
+    return AccountPool(accounts)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+自适应限流 (AIMD) - 根据店小秘的"系统繁忙"响应自动调整限流速率
+
+- 出现繁忙响应（RATE_LIMIT_KEYWORDS / HTTP 429 / 503）时速率乘以 decrease_factor（乘性减）
+- 连续 increase_interval 秒没有繁忙响应时速率增加 increase_step（加性增）
+- 速率始终在 [floor, ceiling] 之间，ceiling 默认为限流器配置的速率（RATE_LIMIT_RATE 或账号的 rate）
+
+速率保存在限流器中：SharedRateLimiter 把速率和上次调整时间写在SQLite令牌桶里，
+所有gunicorn worker和 api_service 直连路径看到的是同一个速率，
+同一波繁忙响应也只会被降速一次（cooldown 按共享的调整时间计算）。
+"""
+import time
+import threading
+
+import config
+
+
+def is_busy_response(status_code, text):
+    """
+    判断上游响应是否表示繁忙/限流
+
+    Args:
+        status_code: HTTP状态码
+        text: 响应文本（原样返回模式下为响应体bytes，不需要解码）
+
+    Returns:
+        bool
+    """
+    if status_code in (429, 503):
+        return True
+    if isinstance(text, bytes):
+        return any(keyword.encode('utf-8') in text for keyword in config.UPSTREAM_BUSY_KEYWORDS)
+    return any(keyword in text for keyword in config.UPSTREAM_BUSY_KEYWORDS)
+
+
+class AdaptiveRateController:
+    """AIMD速率控制器"""
+
+    def __init__(self, limiter, floor=None, ceiling=None, decrease_factor=None, decrease_cooldown=None,
+                 increase_step=None, increase_interval=None):
+        """
+        Args:
+            limiter: RateLimiter / SharedRateLimiter（或包装它们的 PriorityLimiter）
+            floor: 速率下限（次/秒）
+            ceiling: 速率上限（次/秒），默认 config.ADAPTIVE_RATE_CEILING，为None时使用限流器配置的速率
+            decrease_factor: 降速系数
+            decrease_cooldown: 两次降速之间的最短间隔（秒）
+            increase_step: 每次提速增加的速率
+            increase_interval: 连续多少秒没有繁忙响应才提速一次
+        """
+        self.limiter = getattr(limiter, 'limiter', limiter)
+        self.floor = config.ADAPTIVE_RATE_FLOOR if floor is None else floor
+        if ceiling is None:
+            ceiling = config.ADAPTIVE_RATE_CEILING
+        self.ceiling = self.limiter.base_rate if ceiling is None else ceiling
+        self.decrease_factor = config.ADAPTIVE_RATE_DECREASE_FACTOR if decrease_factor is None else decrease_factor
+        self.decrease_cooldown = config.ADAPTIVE_RATE_DECREASE_COOLDOWN if decrease_cooldown is None \
+            else decrease_cooldown
+        self.increase_step = config.ADAPTIVE_RATE_INCREASE_STEP if increase_step is None else increase_step
+        self.increase_interval = config.ADAPTIVE_RATE_INCREASE_INTERVAL if increase_interval is None \
+            else increase_interval
+
+        self._lock = threading.Lock()
+        self._rate, self._changed_at = self.limiter.adjust_rate(self._clamp)
+        self._last_busy = 0.0
+
+        self.busy_responses = 0
+        self.clean_responses = 0
+        self.decreases = 0
+        self.increases = 0
+
+    def _clamp(self, rate, changed_at, now):
+        """初始化时把速率限制在 [floor, ceiling] 内"""
+        clamped = min(self.ceiling, max(self.floor, rate))
+        return clamped if clamped != rate else None
+
+    def _decide(self, busy, last_busy, decision):
+        """
+        生成传给 limiter.adjust_rate 的决策函数（在限流器的锁/事务内执行）
+
+        decision['changed'] 记录本次是否真的由这个控制器调整了速率（其他worker可能已经调整过）
+        """
+
+        def decide(rate, changed_at, now):
+            if busy:
+                if rate <= self.floor or now - changed_at < self.decrease_cooldown:
+                    return None
+                new_rate = max(self.floor, rate * self.decrease_factor)
+            else:
+                if rate >= self.ceiling or now - max(changed_at, last_busy) < self.increase_interval:
+                    return None
+                new_rate = min(self.ceiling, rate + self.increase_step)
+            decision['changed'] = True
+            return new_rate
+
+        return decide
+
+    def record(self, busy):
+        """
+        记录一次上游响应
+
+        大多数调用只更新本地计数；只有本地判断到了调整时机时才访问限流器（共享后端为一次SQLite事务）。
+
+        Args:
+            busy: 响应是否表示繁忙/限流
+
+        Returns:
+            float: 当前速率
+        """
+        now = time.time()
+        with self._lock:
+            if busy:
+                self.busy_responses += 1
+                self._last_busy = now
+                due = self._rate > self.floor and now - self._changed_at >= self.decrease_cooldown
+            else:
+                self.clean_responses += 1
+                due = (self._rate < self.ceiling
+                       and now - max(self._changed_at, self._last_busy) >= self.increase_interval)
+            last_busy = self._last_busy
+            old_rate = self._rate
+
+        if not due:
+            return old_rate
+
+        decision = {'changed': False}
+        rate, changed_at = self.limiter.adjust_rate(self._decide(busy, last_busy, decision))
+        with self._lock:
+            if decision['changed'] and busy:
+                self.decreases += 1
+                print(f"[AdaptiveRate] ⚠️  上游繁忙，速率降至 {rate:.2f} 次/秒")
+            elif decision['changed']:
+                self.increases += 1
+                print(f"[AdaptiveRate] ✓ 速率提高到 {rate:.2f} 次/秒")
+            self._rate, self._changed_at = rate, changed_at
+        return rate
+
+    def stats(self):
+        """控制器统计信息"""
+        with self._lock:
+            return {
+                'rate': round(self._rate, 3),
+                'floor': self.floor,
+                'ceiling': self.ceiling,
+                'busy_responses': self.busy_responses,
+                'clean_responses': self.clean_responses,
+                'decreases': self.decreases,
+                'increases': self.increases
+            }
+
+
+def create_rate_controller(limiter):
+    """
+    根据配置创建自适应速率控制器
+
+    Args:
+        limiter: 要调整的限流器
+
+    Returns:
+        AdaptiveRateController 或 None（config.ADAPTIVE_RATE_ENABLED 为False时）
+    """
+    if not config.ADAPTIVE_RATE_ENABLED:
+        return None
+    return AdaptiveRateController(limiter)
@@ -1,15 +1,37 @@
 """
 API服务层 - 直接向店小秘服务器发送HTTP请求
-所有功能集成在一个文件中，无需外部依赖
+
+所有请求通过全局HTTP客户端 _client（_DxmClient）发送: keep-alive连接池 + 与代理服务器共用的令牌桶限流，线程安全。
+依赖项目中的以下模块:
+- config: 限流、Cookie、解析等配置
+- rate_limiter / adaptive_rate: 共享令牌桶和自适应速率控制
+- request_cost: 重接口按请求大小消耗多个令牌
+- cookie_store: Cookie文件的进程内缓存和后台刷新
+- html_extract: 商品列表页面解析（可选使用 selectolax / lxml 加速）
+- metrics: 上游重试等指标
 """
 import os
 import json
 import time
 import requests
 import re
+from requests.adapters import HTTPAdapter
+from http.cookiejar import DefaultCookiePolicy
 from datetime import datetime, timedelta
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from typing import List, Optional, Dict, Any
 
+import threading
+
+import config
+import metrics
+from cookie_store import CookieRefresher, get_cookie_store, write_cookie_file
+from rate_limiter import create_rate_limiter
+from adaptive_rate import create_rate_controller
+from request_cost import create_cost_table
+from html_extract import extract_product_page, first_match, match_variant
+
 try:
     from bs4 import BeautifulSoup
 except ImportError:
@@ -24,11 +46,33 @@ COOKIE_CACHE_MINUTES = 30
 DOWNLOAD_TIMEOUT = 30
 RETRY_TIMES = 3
 RETRY_DELAY = 2
+COOKIE_BACKGROUND_REFRESH = True  # 后台线程在过期前刷新Cookie，调用方不等待下载
+COOKIE_REFRESH_AHEAD_MINUTES = 5  # 提前刷新的分钟数
+COOKIE_REFRESH_CHECK_INTERVAL = 30  # 后台检查间隔（秒）
 
 # 限流重试配置
 RATE_LIMIT_MAX_RETRIES = 10  # 限流重试次数
 RATE_LIMIT_DELAY = 1  # 限流重试延迟（秒）
-RATE_LIMIT_KEYWORDS = ["系统繁忙", "请稍后重试"]  # 限流关键词
+RATE_LIMIT_KEYWORDS = config.UPSTREAM_BUSY_KEYWORDS  # 限流关键词（与代理服务器共用）
+
+# HTTP客户端配置
+REQUEST_TIMEOUT = 30  # 单次请求的默认超时时间（秒），各函数调用时可以覆盖
+HTTP_POOL_CONNECTIONS = 4  # 连接池缓存的主机数
+HTTP_POOL_MAXSIZE = 10  # 每个主机保持的最大keep-alive连接数（在线程池中调用时不小于线程数）
+
+# 商品搜索缓存配置
+PRODUCT_SEARCH_CACHE_SECONDS = 60  # 同一关键词的搜索结果缓存秒数（多个店铺/变体查询共用一次请求），0表示不缓存
+PRODUCT_SEARCH_CACHE_MAX_ENTRIES = 256  # 最多缓存的关键词数，超过时淘汰最久未使用的
+PRODUCT_SEARCH_PAGE_SIZE = 50  # 商品搜索每页的商品数
+PRODUCT_SEARCH_PARALLEL_PAGES = 3  # 多页搜索时同时请求的页数（仍受共享限流器限制）
+
+# 批量订单查询配置 (lookup_orders)
+ORDER_LOOKUP_BATCH_SIZE = 50  # 每次 searchPackage.json 搜索合并的订单号数，1表示逐个查询（接口不支持时自动改为逐个查询）
+ORDER_LOOKUP_SEPARATOR = ","  # 合并多个订单号时使用的分隔符（接口文档没有说明，按网页搜索框的写法）
+ORDER_LOOKUP_PAGE_SIZE = 100  # 每页包裹数（一个订单可能拆成多个包裹）
+ORDER_LOOKUP_MAX_PAGES = 20  # 每次搜索最多翻的页数
+ORDER_LOOKUP_PARALLEL = 4  # 同时请求的批数（仍受共享限流器限制）
+ORDER_LOOKUP_FALLBACK_SINGLE = True  # 批量搜索结果中没有的订单号再单独查询一次
 
 
 # ==================== Cookie管理 ====================
@@ -43,6 +87,8 @@ class _CookieManager:
         self.timeout = DOWNLOAD_TIMEOUT
         self.retry_times = RETRY_TIMES
         self.retry_delay = RETRY_DELAY
+        self.refresher = CookieRefresher(self.local_path, self._download_cookie, self.cache_minutes * 60,
+                                         COOKIE_REFRESH_AHEAD_MINUTES * 60, COOKIE_REFRESH_CHECK_INTERVAL)
         self._ensure_cache_dir()
 
     def _ensure_cache_dir(self):
@@ -54,22 +100,17 @@ class _CookieManager:
                 pass
 
     def _is_cache_valid(self):
-        """检查缓存是否有效"""
-        if not os.path.exists(self.local_path):
+        """检查缓存是否有效（文件内容由共享的CookieStore解析，未变化时不重复读取）"""
+        try:
+            file_time = datetime.fromtimestamp(os.stat(self.local_path).st_mtime)
+        except OSError:
             return False
 
-        try:
-            file_mtime = os.path.getmtime(self.local_path)
-            file_time = datetime.fromtimestamp(file_mtime)
-            if datetime.now() - file_time > timedelta(minutes=self.cache_minutes):
-                return False
-
-            with open(self.local_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return 'cookies' in data and data['cookies']
-        except:
+        if datetime.now() - file_time > timedelta(minutes=self.cache_minutes):
             return False
 
+        return get_cookie_store(self.local_path).is_valid()
+
     def _download_cookie(self):
         """下载Cookie"""
         for attempt in range(self.retry_times):
@@ -81,8 +122,8 @@ class _CookieManager:
                 if 'cookies' not in cookie_data:
                     continue
 
-                with open(self.local_path, 'w', encoding='utf-8') as f:
-                    json.dump(cookie_data, f, ensure_ascii=False, indent=2)
+                write_cookie_file(self.local_path, cookie_data)
+                get_cookie_store(self.local_path).invalidate()
                 return True
             except:
                 if attempt < self.retry_times - 1:
@@ -91,22 +132,27 @@ class _CookieManager:
 
     def get_cookies_dict(self):
         """获取Cookies字典"""
-        # 如果缓存无效则下载
+        if COOKIE_BACKGROUND_REFRESH and not self.refresher.running:
+            self.refresher.start()
+
+        # 如果缓存无效则下载（已有可用的旧Cookie时交给后台线程，多个线程同时到达时只下载一次）
         if not self._is_cache_valid():
-            if not self._download_cookie():
+            if self.refresher.running and get_cookie_store(self.local_path).is_valid():
+                self.refresher.trigger()
+            elif not self.refresher.refresh():
                 if not os.path.exists(self.local_path):
                     return None
 
-        # 读取并转换Cookie
+        # 从内存缓存读取（共享对象，不要修改）
         try:
-            with open(self.local_path, 'r', encoding='utf-8') as f:
-                cookie_data = json.load(f)
-
-            cookies = {}
-            if 'cookies' in cookie_data:
-                for cookie in cookie_data['cookies']:
-                    cookies[cookie['name']] = cookie['value']
-                return cookies
+            return get_cookie_store(self.local_path).get_cookies_dict()
+        except:
+            return None
+
+    def get_cookie_header(self):
+        """获取Cookie请求头字符串（调用前应先通过 get_cookies_dict 确认Cookie可用）"""
+        try:
+            return get_cookie_store(self.local_path).get_cookie_header()
         except:
             return None
 
@@ -120,6 +166,11 @@ def _get_cookies():
     return _cookie_manager.get_cookies_dict()
 
 
+def _get_cookie_header():
+    """获取预先拼接好的Cookie请求头（内部使用）"""
+    return _cookie_manager.get_cookie_header()
+
+
 def _is_rate_limited(response_text: str) -> bool:
     """检查响应是否为限流错误"""
     for keyword in RATE_LIMIT_KEYWORDS:
@@ -128,9 +179,88 @@ def _is_rate_limited(response_text: str) -> bool:
     return False
 
 
+# ==================== HTTP客户端 ====================
+class _DxmClient:
+    """
+    HTTP客户端 - 模块内所有函数共用（线程安全，可以在线程池中并发调用）
+
+    - keep-alive连接池: 同一个 requests.Session，省去每次请求的TCP+TLS握手
+    - 限流: 每个请求（包括重试）先从与代理服务器共用的令牌桶领取令牌（rate_limiter），
+      重接口按 request_cost.py 消耗多个令牌
+    - 自适应速率: 每次响应反馈给速率控制器，遇到"系统繁忙"时降速后重试
+    - 超时: 默认 REQUEST_TIMEOUT 秒，单次调用可以用 timeout 覆盖
+    """
+
+    def __init__(self, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE):
+        """
+        Args:
+            pool_connections: 连接池缓存的主机数
+            pool_maxsize: 每个主机保持的最大keep-alive连接数（建议不小于调用线程数）
+        """
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        # Cookie由调用方显式传入，不保存上游返回的Set-Cookie，避免和注入的Cookie冲突
+        self.session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        self.costs = create_cost_table()
+        self._limiter = None
+        self._controller = None
+        self._lock = threading.Lock()
+
+    def rate_control(self):
+        """获取共享限流器和自适应速率控制器（首次调用时创建）"""
+        with self._lock:
+            if self._limiter is None:
+                self._limiter = create_rate_limiter()
+                self._controller = create_rate_controller(self._limiter)
+        return self._limiter, self._controller
+
+    def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+        """
+        限流后发送请求，遇到限流响应时重试
+
+        Args:
+            method: 请求方法 ('get' 或 'post')
+            url: 请求URL
+            timeout: 超时时间（秒），默认 REQUEST_TIMEOUT
+            **kwargs: 传递给requests的其他参数
+
+        Returns:
+            requests.Response对象（重试次数用完时返回最后一次限流响应）
+
+        Raises:
+            requests.RequestException: 网络错误或超时
+        """
+        limiter, controller = self.rate_control()
+        cost, _ = self.costs.cost(method, url, kwargs.get('data'), kwargs.get('params'))
+        timeout = REQUEST_TIMEOUT if timeout is None else timeout
+
+        for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):  # +1 包含首次请求
+            limiter.wait_if_needed(cost=cost)
+            response = self.session.request(method.upper(), url, timeout=timeout, **kwargs)
+
+            # 检查是否为限流错误
+            rate_limited = _is_rate_limited(response.text)
+            if controller is not None:
+                controller.record(rate_limited)
+
+            if not rate_limited or attempt == RATE_LIMIT_MAX_RETRIES:
+                return response
+            # 重试仍然经过共享限流器，按降低后的速率排队，而不是所有调用方同时在固定间隔后重试
+            metrics.inc('dxm_upstream_retries_total', {'path': metrics.path_label(url)})
+            time.sleep(RATE_LIMIT_DELAY)
+
+        return response
+
+
+# 创建全局HTTP客户端
+_client = _DxmClient()
+
+
 def _request_with_retry(method: str, url: str, **kwargs) -> requests.Response:
     """
-    带限流重试的请求函数
+    带限流重试的请求函数（通过全局HTTP客户端发送，参数见 _DxmClient.request）
 
     Args:
         method: 请求方法 ('get' 或 'post')
@@ -143,55 +273,82 @@ def _request_with_retry(method: str, url: str, **kwargs) -> requests.Response:
     Raises:
         原始异常（如果重试后仍失败）
     """
-    last_response = None
+    return _client.request(method, url, **kwargs)
 
-    for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):  # +1 包含首次请求
-        if method.lower() == 'get':
-            response = requests.get(url, **kwargs)
-        else:
-            response = requests.post(url, **kwargs)
 
-        # 检查是否为限流错误
-        if _is_rate_limited(response.text):
-            last_response = response
-            if attempt < RATE_LIMIT_MAX_RETRIES:
-                time.sleep(RATE_LIMIT_DELAY)
-                continue
-            else:
-                # 已达到最大重试次数，返回最后一次响应
-                return response
+# ==================== API函数 - 直接发送HTTP请求 ====================
 
-        # 请求成功（非限流），直接返回
-        return response
+# 搜索类函数 (7个)
 
-    # 不应该到达这里，但作为保险返回最后一次响应
-    return last_response if last_response else response
+class ProductSearchResult:
+    """
+    一次商品搜索（pageList.htm）的解析结果
 
+    同一个关键词只请求和解析一次，之后按不同的店铺编码和变体从内存中查询（见 search_dxm_product_result）
+    """
 
-# ==================== API函数 - 直接发送HTTP请求 ====================
+    def __init__(self, search_value: str, rows: list, pages: int = 1, complete: bool = False):
+        """
+        Args:
+            search_value: 搜索关键词
+            rows: html_extract.extract_product_rows 的结果（多页时按页码顺序拼接）
+            pages: 已获取的页数（从第1页开始连续）
+            complete: 是否已经获取到最后一页
+        """
+        self.search_value = search_value
+        self.rows = rows
+        self.pages = pages
+        self.complete = complete
+        self.fetched_at = time.monotonic()
+
+    def first(self, shop_code: str, variant: str) -> Optional[str]:
+        """
+        第一个符合条件的SKU名称（以店铺编码开头的优先）
+
+        Returns:
+            SKU名称，未找到返回None
+        """
+        return first_match(self.rows, shop_code, variant)
+
+    def all(self, shop_code: str, variant: str) -> List[Dict[str, str]]:
+        """
+        所有符合条件的SKU（有以店铺编码开头的SKU时只返回这些）
+
+        Returns:
+            [{'sku_name': SKU名称, 'title': 匹配的title}, ...]
+        """
+        exact_results, contains_results = match_variant(self.rows, shop_code, variant)
+        return exact_results if exact_results else contains_results
 
-# 搜索类函数 (7个)
+    def has_exact(self, shop_code: str, variant: str) -> bool:
+        """是否已经有以店铺编码开头的匹配（首个匹配模式不需要再看后面的页）"""
+        return bool(match_variant(self.rows, shop_code, variant)[0])
 
-def search_dxm_product(search_value: str, shop_code: str, variant: str, debug: bool = False) -> Optional[str]:
-    """
-    搜索店小秘商品并返回符合条件的SKU名称
+    def covers(self, max_pages: int, shop_code: Optional[str] = None, variant: Optional[str] = None) -> bool:
+        """已获取的页是否足以回答 max_pages 页的查询（首个匹配模式下找到精确匹配也足够）"""
+        if self.complete or self.pages >= max_pages:
+            return True
+        return shop_code is not None and variant is not None and self.has_exact(shop_code, variant)
 
-    Args:
-        search_value: 搜索关键词
-        shop_code: 店铺编码
-        variant: 变体信息
-        debug: 是否显示调试信息
+
+# 商品搜索结果缓存: 关键词 -> ProductSearchResult（同一关键词的多个变体查询共用一次请求）
+_product_search_cache = OrderedDict()
+_product_search_lock = threading.Lock()
+# 按关键词分段加锁，多个线程同时查询同一个关键词时只请求一次
+_product_search_fetch_locks = [threading.Lock() for _ in range(16)]
+
+
+def _fetch_product_page(search_value: str, page_no: int) -> Optional[tuple]:
+    """
+    请求并解析一页商品列表
 
     Returns:
-        找到的SKU名称，未找到返回None
+        (SKU记录列表, 是否为最后一页)，失败返回None
     """
     cookies = _get_cookies()
     if not cookies:
         return None
 
-    if not BeautifulSoup:
-        return None
-
     url = "https://www.dianxiaomi.com/dxmCommodityProduct/pageList.htm"
 
     headers = {
@@ -205,8 +362,8 @@ def search_dxm_product(search_value: str, shop_code: str, variant: str, debug: b
     }
 
     data = {
-        'pageNo': '1',
-        'pageSize': '50',
+        'pageNo': str(page_no),
+        'pageSize': str(PRODUCT_SEARCH_PAGE_SIZE),
         'searchType': '6',
         'searchValue': search_value,
         'productPxId': '1',
@@ -216,124 +373,170 @@ def search_dxm_product(search_value: str, shop_code: str, variant: str, debug: b
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data)
         response.raise_for_status()
+        if _is_rate_limited(response.text):
+            return None
+        # 每个商品行只解析一次，变体只在SKU所在行的title中匹配（见 html_extract.py）
+        page = extract_product_page(response.text)
+        # 一个商品有多个SKU，按商品行数判断是否为最后一页；页面中没有商品行标记时退回按SKU数判断
+        products = page.products or len(page.rows)
+        return page.rows, products < PRODUCT_SEARCH_PAGE_SIZE
+    except:
+        return None
 
-        soup = BeautifulSoup(response.text, 'html.parser')
-        sku_elements = soup.find_all('span', class_='inline-block no-new-line maxW240 goodsSKUName white-space')
-
-        exact_results = []
-        contains_results = []
-
-        for sku_element in sku_elements:
-            sku_name = sku_element.get_text(strip=True)
-
-            if not (sku_name.startswith(shop_code) or shop_code in sku_name):
-                continue
 
-            current_element = sku_element
-            for i in range(15):
-                current_element = current_element.parent
-                if current_element is None:
-                    break
+def _fetch_product_search(search_value: str, max_pages: int = 1, shop_code: Optional[str] = None,
+                          variant: Optional[str] = None) -> Optional[ProductSearchResult]:
+    """
+    请求并解析最多 max_pages 页商品列表，失败返回None
 
-                title_elements = current_element.find_all(attrs={'title': True})
-                for title_element in title_elements:
-                    title_text = title_element.get('title', '')
-                    if title_text and variant.lower() in title_text.lower():
-                        if sku_name.startswith(shop_code):
-                            exact_results.append(sku_name)
-                        else:
-                            contains_results.append(sku_name)
+    多页时最多 PRODUCT_SEARCH_PARALLEL_PAGES 页同时请求（每个请求仍然经过共享限流器），
+    商品数少于 PRODUCT_SEARCH_PAGE_SIZE 的页是最后一页；
+    指定 shop_code 和 variant 时，前面连续的页中出现精确匹配后不再请求后面的页
+    """
+    if max_pages <= 1:
+        page = _fetch_product_page(search_value, 1)
+        if page is None:
+            return None
+        rows, last = page
+        return ProductSearchResult(search_value, rows, 1, last)
+
+    workers = min(PRODUCT_SEARCH_PARALLEL_PAGES, max_pages)
+    pool = ThreadPoolExecutor(max_workers=workers)
+    pending = {}        # future -> 页码
+    fetched = {}        # 页码 -> 该页的SKU记录
+    last_page = max_pages
+    complete = False
+    next_page = 1
+    try:
+        while True:
+            while len(pending) < workers and next_page <= last_page:
+                pending[pool.submit(_fetch_product_page, search_value, next_page)] = next_page
+                next_page += 1
+            if not any(page_no <= last_page for page_no in pending.values()):
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                page_no = pending.pop(future)
+                page = future.result()
+                if page_no > last_page:
+                    continue
+                if page is None:
+                    # 请求失败: 只保留前面连续获取成功的页
+                    last_page, complete = page_no - 1, False
+                    continue
+                fetched[page_no], last = page
+                if last:
+                    last_page, complete = page_no, True
+
+            # 某一页有精确匹配时，首个匹配一定在这一页或前面的页，只等前面的页完成
+            if shop_code is not None and variant is not None:
+                for page_no in sorted(fetched):
+                    if page_no <= last_page and match_variant(fetched[page_no], shop_code, variant)[0]:
+                        if page_no < last_page:
+                            last_page, complete = page_no, False
                         break
-                if exact_results or contains_results:
-                    break
+    finally:
+        # 已经不需要的页不再等待（正在进行的请求在后台结束）
+        pool.shutdown(wait=False, cancel_futures=True)
 
-        if exact_results:
-            return exact_results[0]
-        elif contains_results:
-            return contains_results[0]
-        return None
-    except:
+    if last_page < 1:
         return None
+    rows = []
+    for page_no in range(1, last_page + 1):
+        rows.extend(fetched[page_no])
+    return ProductSearchResult(search_value, rows, last_page, complete)
 
 
-def search_dxm_product_all(search_value: str, shop_code: str, variant: str, debug: bool = False) -> List[Dict[str, str]]:
+def search_dxm_product_result(search_value: str, refresh: bool = False, max_pages: int = 1,
+                              shop_code: Optional[str] = None,
+                              variant: Optional[str] = None) -> Optional[ProductSearchResult]:
     """
-    搜索店小秘商品并返回所有符合条件的SKU
+    搜索店小秘商品，返回可以反复查询的解析结果
+
+    PRODUCT_SEARCH_CACHE_SECONDS 秒内相同关键词的搜索直接返回缓存的结果（已获取的页足够时），不再请求上游
 
     Args:
         search_value: 搜索关键词
-        shop_code: 店铺编码
+        refresh: 忽略缓存，重新请求
+        max_pages: 最多获取的页数（每页 PRODUCT_SEARCH_PAGE_SIZE 个商品），多页时并发请求
+        shop_code: 与 variant 一起指定时为首个匹配模式，找到以店铺编码开头的匹配后不再请求后面的页
         variant: 变体信息
-        debug: 是否显示调试信息
 
     Returns:
-        所有匹配结果的列表
+        ProductSearchResult，请求失败返回None（失败不缓存）
     """
-    cookies = _get_cookies()
-    if not cookies or not BeautifulSoup:
-        return []
-
-    url = "https://www.dianxiaomi.com/dxmCommodityProduct/pageList.htm"
-
-    headers = {
-        'accept': 'text/html, */*; q=0.01',
-        'accept-language': 'zh-CN,zh;q=0.9',
-        'content-type': 'application/x-www-form-urlencoded; charset=UTF-8',
-        'origin': 'https://www.dianxiaomi.com',
-        'referer': 'https://www.dianxiaomi.com/dxmCommodityProduct/index.htm',
-        'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-        'x-requested-with': 'XMLHttpRequest'
-    }
-
-    data = {
-        'pageNo': '1',
-        'pageSize': '50',
-        'searchType': '6',
-        'searchValue': search_value,
-        'productPxId': '1',
-        'productPxSxId': '0',
-        'productMode': '-1',
-        'saleMode': '-1'
-    }
-
-    try:
-        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data, timeout=30)
-        response.raise_for_status()
+    def cached():
+        with _product_search_lock:
+            result = _product_search_cache.get(search_value)
+            if result is None:
+                return None
+            if time.monotonic() - result.fetched_at >= PRODUCT_SEARCH_CACHE_SECONDS:
+                del _product_search_cache[search_value]
+                return None
+            _product_search_cache.move_to_end(search_value)
+        return result if result.covers(max_pages, shop_code, variant) else None
+
+    if not refresh and PRODUCT_SEARCH_CACHE_SECONDS > 0:
+        result = cached()
+        if result is not None:
+            return result
 
-        soup = BeautifulSoup(response.text, 'html.parser')
-        sku_elements = soup.find_all('span', class_='inline-block no-new-line maxW240 goodsSKUName white-space')
+    with _product_search_fetch_locks[hash(search_value) % len(_product_search_fetch_locks)]:
+        # 等锁期间其他线程可能已经完成了同一个关键词的请求
+        if not refresh and PRODUCT_SEARCH_CACHE_SECONDS > 0:
+            result = cached()
+            if result is not None:
+                return result
+
+        result = _fetch_product_search(search_value, max_pages, shop_code, variant)
+        if result is not None and PRODUCT_SEARCH_CACHE_SECONDS > 0:
+            with _product_search_lock:
+                _product_search_cache[search_value] = result
+                _product_search_cache.move_to_end(search_value)
+                while len(_product_search_cache) > PRODUCT_SEARCH_CACHE_MAX_ENTRIES:
+                    _product_search_cache.popitem(last=False)
+        return result
+
+
+def search_dxm_product(search_value: str, shop_code: str, variant: str, debug: bool = False,
+                       max_pages: int = 1) -> Optional[str]:
+    """
+    搜索店小秘商品并返回符合条件的SKU名称
 
-        exact_results = []
-        contains_results = []
+    Args:
+        search_value: 搜索关键词
+        shop_code: 店铺编码
+        variant: 变体信息
+        debug: 是否显示调试信息
+        max_pages: 最多搜索的页数，多页时并发请求，找到以店铺编码开头的匹配后不再请求后面的页
 
-        for sku_element in sku_elements:
-            sku_name = sku_element.get_text(strip=True)
+    Returns:
+        找到的SKU名称，未找到返回None
+    """
+    result = search_dxm_product_result(search_value, max_pages=max_pages, shop_code=shop_code, variant=variant)
+    return result.first(shop_code, variant) if result else None
 
-            if not (sku_name.startswith(shop_code) or shop_code in sku_name):
-                continue
 
-            current_element = sku_element
-            for i in range(15):
-                current_element = current_element.parent
-                if current_element is None:
-                    break
+def search_dxm_product_all(search_value: str, shop_code: str, variant: str, debug: bool = False,
+                           max_pages: int = 1) -> List[Dict[str, str]]:
+    """
+    搜索店小秘商品并返回所有符合条件的SKU
 
-                title_elements = current_element.find_all(attrs={'title': True})
-                for title_element in title_elements:
-                    title_text = title_element.get('title', '')
-                    if title_text and variant.lower() in title_text.lower():
-                        result = {'sku_name': sku_name, 'title': title_text}
-                        if sku_name.startswith(shop_code):
-                            exact_results.append(result)
-                        else:
-                            contains_results.append(result)
-                        break
+    Args:
+        search_value: 搜索关键词
+        shop_code: 店铺编码
+        variant: 变体信息
+        debug: 是否显示调试信息
+        max_pages: 最多搜索的页数，多页时并发请求，直到最后一页或 max_pages 页
 
-        return exact_results if exact_results else contains_results
-    except:
-        return []
+    Returns:
+        所有匹配结果的列表
+    """
+    result = search_dxm_product_result(search_value, max_pages=max_pages)
+    return result.all(shop_code, variant) if result else []
 
 
 def search_package(content: str) -> Optional[str]:
@@ -375,7 +578,7 @@ def search_package(content: str) -> Optional[str]:
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data)
         tracking_matches = re.findall(r"doTrack\('([^']+)'", response.text)
         return tracking_matches[0] if tracking_matches else None
     except:
@@ -398,7 +601,7 @@ def search_package_ids(content: str) -> List[str]:
 
     url = 'https://www.dianxiaomi.com/api/package/searchPackage.json'
 
-    cookie_string = '; '.join([f"{k}={v}" for k, v in cookies.items()])
+    cookie_string = _get_cookie_header()
 
     headers = {
         'accept': 'application/json, text/plain, */*',
@@ -417,7 +620,7 @@ def search_package_ids(content: str) -> List[str]:
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, data=data, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, data=data)
         result = response.json()
 
         if result.get('code') != 0:
@@ -464,7 +667,7 @@ def search_package2(content: str) -> Optional[str]:
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data)
         match = re.search(r'data-packageNumber="([^"]+)"', response.text)
         return match.group(1) if match else None
     except:
@@ -521,7 +724,7 @@ def get_package_numbers(content: str) -> Optional[List[str]]:
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data)
         result = response.json()
 
         # 检查API返回状态
@@ -553,7 +756,7 @@ def get_dianxiaomi_order_id(content: str) -> List[Optional[str]]:
 
     url = 'https://www.dianxiaomi.com/api/package/searchPackage.json'
 
-    cookie_string = '; '.join([f"{k}={v}" for k, v in cookies.items()])
+    cookie_string = _get_cookie_header()
 
     headers = {
         'accept': 'application/json, text/plain, */*',
@@ -604,7 +807,7 @@ def get_dianxiaomi_order_id(content: str) -> List[Optional[str]]:
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, data=data, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, data=data)
         result = response.json()
 
         if result.get('code') != 0:
@@ -619,6 +822,221 @@ def get_dianxiaomi_order_id(content: str) -> List[Optional[str]]:
         return [None, None]
 
 
+class OrderPackageInfo:
+    """一个订单号在店小秘中的包裹信息（lookup_orders 的结果）"""
+
+    def __init__(self, order_id: str, packages: List[Dict[str, Any]]):
+        """
+        Args:
+            order_id: 订单号
+            packages: searchPackage.json 返回的该订单的包裹列表（原始dict）
+        """
+        self.order_id = order_id
+        self.packages = packages
+
+    @property
+    def found(self) -> bool:
+        """是否找到了包裹"""
+        return bool(self.packages)
+
+    @property
+    def package_ids(self) -> List[str]:
+        """包裹ID列表（同 search_package_ids）"""
+        return [str(pkg.get('id')) for pkg in self.packages if pkg.get('id')]
+
+    @property
+    def package_numbers(self) -> List[str]:
+        """包裹号列表（同 get_package_numbers）"""
+        return [pkg.get('packageNumber') for pkg in self.packages if pkg.get('packageNumber')]
+
+    @property
+    def tracking_numbers(self) -> List[str]:
+        """运单号列表"""
+        return [pkg.get('trackingNumber') for pkg in self.packages if pkg.get('trackingNumber')]
+
+    @property
+    def storage_id(self) -> Optional[str]:
+        """第一个包裹的仓库ID（同 get_dianxiaomi_order_id）"""
+        for pkg in self.packages:
+            if pkg.get('storageId'):
+                return str(pkg.get('storageId'))
+        return None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'order_id': self.order_id,
+            'found': self.found,
+            'package_ids': self.package_ids,
+            'package_numbers': self.package_numbers,
+            'tracking_numbers': self.tracking_numbers,
+            'storage_id': self.storage_id
+        }
+
+    def __repr__(self):
+        return f"OrderPackageInfo(order_id={self.order_id!r}, packages={len(self.packages)})"
+
+
+def _search_packages(content: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    按订单号搜索包裹，自动翻页
+
+    Args:
+        content: 一个订单号，或用 ORDER_LOOKUP_SEPARATOR 连接的多个订单号
+
+    Returns:
+        所有页的包裹列表，失败返回None
+    """
+    cookies = _get_cookies()
+    if not cookies:
+        return None
+
+    url = 'https://www.dianxiaomi.com/api/package/searchPackage.json'
+
+    headers = {
+        'accept': 'application/json, text/plain, */*',
+        'accept-language': 'zh-CN,zh;q=0.9',
+        'bx-v': '2.5.11',
+        'content-type': 'application/x-www-form-urlencoded',
+        'referer': 'https://www.dianxiaomi.com/web/order/all?go=m1-1',
+        'user-agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    }
+
+    packages = []
+    page_no = 1
+    try:
+        while page_no <= ORDER_LOOKUP_MAX_PAGES:
+            data = {
+                'pageNo': str(page_no),
+                'pageSize': str(ORDER_LOOKUP_PAGE_SIZE),
+                'state': '',
+                'shopId': '-1',
+                'history': '',
+                'searchType': 'orderId',
+                'content': content,
+                'isVoided': '-1',
+                'isRemoved': '-1',
+                'isSearch': '1',
+                'orderField': 'order_create_time',
+                'orderSearchType': '1',
+                'storageId': '0',
+                'axios_cancelToken': 'true'
+            }
+            response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data)
+            result = response.json()
+            if result.get('code') != 0:
+                return None
+
+            page = (result.get('data') or {}).get('page') or {}
+            page_list = page.get('list') or []
+            packages.extend(page_list)
+
+            total_page = page.get('totalPage')
+            if total_page is not None:
+                if page_no >= int(total_page):
+                    break
+            elif len(page_list) < ORDER_LOOKUP_PAGE_SIZE:
+                break
+            page_no += 1
+        return packages
+    except:
+        return None
+
+
+def _package_order_ids(package: Dict[str, Any]) -> List[str]:
+    """包裹对应的订单号（平台订单号和扩展订单号）"""
+    return [str(package[key]) for key in ('orderId', 'extendedOrderId') if package.get(key)]
+
+
+def _lookup_order_single(order_id: str) -> Optional[OrderPackageInfo]:
+    """单独搜索一个订单号，失败返回None"""
+    packages = _search_packages(order_id)
+    return None if packages is None else OrderPackageInfo(order_id, packages)
+
+
+def _lookup_order_chunk(order_ids: List[str]) -> tuple:
+    """
+    一次搜索多个订单号，按包裹的订单号分组；批量搜索中没有出现的订单号单独再查一次
+
+    Returns:
+        ({订单号: OrderPackageInfo 或 None}, 接口是否支持批量搜索)，
+        第二项为None表示这一批无法判断（请求失败，或者单独查询也没有找到包裹）
+    """
+    if len(order_ids) == 1:
+        return {order_ids[0]: _lookup_order_single(order_ids[0])}, None
+
+    packages = _search_packages(ORDER_LOOKUP_SEPARATOR.join(order_ids))
+    grouped = {order_id: [] for order_id in order_ids}
+    for package in packages or []:
+        for key in _package_order_ids(package):
+            if key in grouped:
+                grouped[key].append(package)
+                break
+
+    results = {}
+    single_found = False
+    for order_id in order_ids:
+        if grouped[order_id]:
+            results[order_id] = OrderPackageInfo(order_id, grouped[order_id])
+        elif ORDER_LOOKUP_FALLBACK_SINGLE:
+            # 批量搜索没有返回（订单不存在、订单号字段不一致或接口不支持多个订单号）
+            results[order_id] = _lookup_order_single(order_id)
+            single_found = single_found or bool(results[order_id] and results[order_id].found)
+        else:
+            results[order_id] = None if packages is None else OrderPackageInfo(order_id, [])
+
+    if any(grouped.values()):
+        return results, True
+    # 批量搜索一个都没有分到，单独查询却找到了包裹: 分隔符或订单号字段与接口不符
+    return results, False if single_found else None
+
+
+# 批量搜索是否可用（进程内记住第一次判断的结果）: None 未知 / True 可用 / False 不可用，改为逐个查询
+_order_batch_supported = None
+
+
+def lookup_orders(order_ids: List[str]) -> Dict[str, Optional[OrderPackageInfo]]:
+    """
+    批量查询订单的包裹信息
+
+    每 ORDER_LOOKUP_BATCH_SIZE 个订单号合并成一次 searchPackage.json 搜索（自动翻页），
+    最多 ORDER_LOOKUP_PARALLEL 批同时请求，所有请求经过共享限流器。
+
+    接口对多个订单号的写法没有文档: 在确认批量搜索可用之前每次只执行一批；
+    如果一批的结果一个都没有分到订单号，而单独查询找到了包裹，说明接口不支持这种写法，
+    剩下的订单号（以及本进程之后的查询）改为逐个查询。最坏情况下比逐个查询多出第一批的那一次搜索。
+
+    Args:
+        order_ids: 订单号列表（重复的只查一次）
+
+    Returns:
+        {订单号: OrderPackageInfo}，没有找到包裹时 found 为False，请求失败时为None
+    """
+    global _order_batch_supported
+    unique_ids = list(dict.fromkeys(str(order_id).strip() for order_id in order_ids if str(order_id).strip()))
+    if not unique_ids:
+        return {}
+
+    batch_size = 1 if _order_batch_supported is False else max(1, ORDER_LOOKUP_BATCH_SIZE)
+    pending = [unique_ids[i:i + batch_size] for i in range(0, len(unique_ids), batch_size)]
+    results = {}
+
+    # 批量搜索是否可用还不确定时，一批一批地试
+    while pending and batch_size > 1 and _order_batch_supported is None:
+        chunk_result, supported = _lookup_order_chunk(pending.pop(0))
+        results.update(chunk_result)
+        if supported is False:
+            print("[api_service] ⚠️  searchPackage.json 不支持一次搜索多个订单号，改为逐个查询")
+            pending = [[order_id] for chunk in pending for order_id in chunk]
+        if supported is not None:
+            _order_batch_supported = supported
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(ORDER_LOOKUP_PARALLEL, len(pending))) as pool:
+            for chunk_result, _ in pool.map(_lookup_order_chunk, pending):
+                results.update(chunk_result)
+    return {order_id: results.get(order_id) for order_id in unique_ids}
+
+
 # 商品管理类函数 (3个)
 
 def add_product_to_dianxiaomi(name: str, name_en: str, price: str, url: str, custom_zn: str,
@@ -691,7 +1109,7 @@ def add_product_to_dianxiaomi(name: str, name_en: str, price: str, url: str, cus
     }
 
     try:
-        response = _request_with_retry('post', url_endpoint, headers=headers, cookies=cookies, data=data, timeout=30)
+        response = _request_with_retry('post', url_endpoint, headers=headers, cookies=cookies, data=data)
         return response.text
     except:
         return None
@@ -794,7 +1212,7 @@ def add_product_sg_dxm(name: str, name_en: str, sku_code: str, sku: str, price:
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=payload, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=payload)
         result = response.json()
         return {'success': True, 'message': result}
     except Exception as e:
@@ -835,7 +1253,7 @@ def add_product_to_warehouse(sku: str) -> Optional[Dict[str, Any]]:
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data)
         result = response.json()
         return result if result.get('ret') == '1' else None
     except:
@@ -891,7 +1309,7 @@ def set_dianxiaomi_comment(package_ids: List[str]) -> Optional[Dict[str, Any]]:
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data)
         return response.json()
     except:
         return None
@@ -913,7 +1331,7 @@ def batch_commit_platform_packages(package_ids: List[str]) -> Optional[requests.
 
     url = 'https://www.dianxiaomi.com/package/batchCommitPlatform.json'
 
-    cookie_string = '; '.join([f"{k}={v}" for k, v in cookies.items()])
+    cookie_string = _get_cookie_header()
 
     headers = {
         'accept': 'application/json, text/javascript, */*; q=0.01',
@@ -936,7 +1354,7 @@ def batch_commit_platform_packages(package_ids: List[str]) -> Optional[requests.
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, data=data, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, data=data)
         return response
     except:
         return None
@@ -958,7 +1376,7 @@ def batch_set_voided(package_ids: List[str]) -> Optional[Dict[str, Any]]:
 
     url = 'https://www.dianxiaomi.com/package/batchSetVoided.json'
 
-    cookie_string = '; '.join([f"{k}={v}" for k, v in cookies.items()])
+    cookie_string = _get_cookie_header()
 
     headers = {
         'accept': 'application/json, text/javascript, */*; q=0.01',
@@ -981,7 +1399,7 @@ def batch_set_voided(package_ids: List[str]) -> Optional[Dict[str, Any]]:
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, data=data, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, data=data)
         result = response.json()
 
         # 检查登录页面
@@ -1036,7 +1454,7 @@ def update_dianxiaomi_warehouse(package_ids: List[str], storage_id: str) -> Opti
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data)
         try:
             return response.json()
         except:
@@ -1086,7 +1504,7 @@ def update_dianxiaomi_provider_batch(package_ids: List[str], auth_id: str) -> Op
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data)
         return response.json()
     except:
         return None
@@ -1127,7 +1545,7 @@ def get_supplier_ids(supplier_name: str) -> List[str]:
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data)
         soup = BeautifulSoup(response.text, 'html.parser')
 
         supplier_ids = []
@@ -1176,7 +1594,7 @@ def get_shop_dict_with_cookie() -> Dict[str, str]:
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data)
         soup = BeautifulSoup(response.text, 'html.parser')
 
         shop_dict = {}
@@ -1223,7 +1641,7 @@ def request_dianxiaomi_provider_auth() -> Dict[str, str]:
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data)
         soup = BeautifulSoup(response.text, 'html.parser')
 
         provider_dict = {}
@@ -1273,7 +1691,7 @@ def get_ail_link(product_url: str) -> Optional[str]:
     }
 
     try:
-        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data, timeout=30)
+        response = _request_with_retry('post', url, headers=headers, cookies=cookies, data=data)
         soup = BeautifulSoup(response.text, 'html.parser')
 
         name_element = soup.find('td', class_='nameBox')
@@ -1308,7 +1726,7 @@ def fetch_sku_code() -> Optional[str]:
     }
 
     try:
-        response = _request_with_retry('get', url, headers=headers, cookies=cookies, timeout=30)
+        response = _request_with_retry('get', url, headers=headers, cookies=cookies)
         soup = BeautifulSoup(response.text, 'html.parser')
 
         sku_element = soup.find('span', id='skuCode')
@@ -1404,7 +1822,7 @@ def run_scraper(days: int) -> List[Dict[str, Any]]:
 
     url = 'https://www.dianxiaomi.com/api/package/list.json'
 
-    cookie_string = '; '.join([f"{k}={v}" for k, v in cookies.items()])
+    cookie_string = _get_cookie_header()
 
     headers = {
         'authority': 'www.dianxiaomi.com',
@@ -1472,7 +1890,7 @@ def run_scraper(days: int) -> List[Dict[str, Any]]:
         }
 
         try:
-            response = _request_with_retry('post', url, headers=headers, data=data, timeout=30)
+            response = _request_with_retry('post', url, headers=headers, data=data)
             result = response.json()
 
             if result.get('code') == 0:
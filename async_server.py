@@ -0,0 +1,1211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+异步HTTP API代理服务器 - asyncio版本的 /api/execute
+使用aiohttp框架
+
+与 server.py (Flask) 的区别：
+- 等待上游响应时不占用线程，单进程即可挂起数千个排队中的请求
+- 请求先进入按优先级排序的 asyncio.PriorityQueue，由固定数量的调度协程按限流速率取出并转发
+- 上游请求使用共享的aiohttp连接池（keep-alive）
+- 请求/响应格式与 server.py 完全一致，客户端无需修改
+
+架构（见 DESIGN_RATE_LIMITING_QUEUE.md）：
+    HTTP接口层 → RequestQueueManager(asyncio.PriorityQueue) → AsyncRateLimiter → RequestExecutor → 店小秘
+
+启动方式：
+    python async_server.py
+
+    # 或使用gunicorn（限流后端为sqlite时多个worker共享同一个令牌桶）
+    gunicorn async_server:app_factory --bind 0.0.0.0:5001 --worker-class aiohttp.GunicornWebWorker
+
+Flask版本 (server.py) 保持不变，可以继续使用。
+"""
+import sys
+import os
+import math
+import time
+import json
+import asyncio
+import itertools
+import collections
+import traceback
+
+import aiohttp
+from aiohttp import web
+
+# 添加项目根目录到路径
+sys.path.insert(0, os.path.dirname(__file__))
+
+import config
+from account_pool import create_account_pool
+from generic_api_service import (deadline_result, parse_deadline, parse_max_wait, rate_limited_result, wants_raw,
+                                 raw_response_headers)
+from response_cache import CACHE_BYPASS, CACHE_DIRECTIVES, CACHE_INVALIDATE, ResponseCache, create_response_cache
+from single_flight import AsyncSingleFlight, FlightTimeout, is_read_request
+from projection import apply_select, compile_select
+from compression import GzipStream, choose_encoding, compress, decompress, should_compress
+from adaptive_rate import is_busy_response
+from job_queue import JobStore, JobQueueFull, JOB_DONE, report_orphans
+from fair_queue import client_from_headers, get_fair_scheduler
+from request_cost import create_cost_table
+import metrics
+from rate_limiter import RateLimitExceeded, SharedRateLimiter
+
+
+class QueueFullError(Exception):
+    """请求队列已满"""
+
+
+class AsyncRateLimiter:
+    """可await的限流器 - 包装 rate_limiter.PriorityLimiter（优先级通道规则与Flask版本相同）"""
+
+    def __init__(self, limiter):
+        """
+        Args:
+            limiter: PriorityLimiter
+        """
+        self.limiter = limiter
+        # SQLite预约涉及文件锁，放到线程池中执行，避免阻塞事件循环
+        self._blocking = isinstance(limiter.limiter, SharedRateLimiter)
+        self._heads = {lane: asyncio.Lock() for lane in limiter.lanes[1:]}
+
+    async def _attempt(self, lane, remaining, cost, family):
+        if self._blocking:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.limiter.attempt, lane, remaining, cost, family)
+        return self.limiter.attempt(lane, remaining, cost, family)
+
+    async def acquire(self, max_wait=None, lane=None, cost=1.0, family=None):
+        """
+        在指定通道中领取令牌并异步等待
+
+        Args:
+            max_wait: 最长允许的等待时间（秒），None表示一直等待
+            lane: 通道名（已经过 PriorityLimiter.resolve），None表示默认通道
+            cost: 消耗的令牌数（request_cost.CostTable.cost）
+            family: 端点族，配置了子预算时同时从子令牌桶领取
+
+        Returns:
+            float: 等待的秒数
+
+        Raises:
+            RateLimitExceeded: 预计等待时间超过 max_wait
+        """
+        lane = lane or self.limiter.default_lane
+        start = time.monotonic()
+        self.limiter.enter(lane)
+        waited = None
+        try:
+            head = self._heads.get(lane)
+            if head is not None:
+                if not head.locked():
+                    await head.acquire()
+                else:
+                    try:
+                        await asyncio.wait_for(head.acquire(), max_wait)
+                    except asyncio.TimeoutError:
+                        raise RateLimitExceeded(max_wait or 1.0 / self.limiter.rate)
+            try:
+                while True:
+                    remaining = None if max_wait is None else max(0.0, max_wait - (time.monotonic() - start))
+                    sleep_time, retry_in = await self._attempt(lane, remaining, cost, family)
+                    if sleep_time is not None:
+                        break
+                    await asyncio.sleep(retry_in)
+            finally:
+                if head is not None:
+                    head.release()
+
+            if sleep_time > 0:
+                await asyncio.sleep(sleep_time)
+            waited = time.monotonic() - start
+            return waited
+        finally:
+            self.limiter.leave(lane, waited)
+
+
+class RequestExecutor:
+    """执行实际的HTTP请求 - 共享aiohttp连接池，自动注入Cookie"""
+
+    def __init__(self, pool_size, timeout, accounts, response_cache=None):
+        """
+        Args:
+            pool_size: 上游连接池大小
+            timeout: 上游请求超时时间（秒）
+            accounts: AccountPool（每个账号的Cookie和自适应速率控制器）
+            response_cache: ResponseCache，None表示不缓存
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.accounts = accounts
+        self.response_cache = response_cache
+        self.session = None
+
+    @property
+    def rate_controller(self):
+        """主账号的自适应速率控制器"""
+        return self.accounts.primary.rate_controller
+
+    async def start(self):
+        """创建连接池并准备各账号的Cookie（可能需要下载，放到线程池中执行）"""
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.pool_size, ttl_dns_cache=300),
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        )
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.accounts.prepare)
+
+    async def close(self):
+        """关闭连接池"""
+        if self.session is not None:
+            await self.session.close()
+
+    async def _get_cookie_string(self, account):
+        """获取账号的Cookie字符串（已下载时来自内存缓存，不阻塞事件循环；否则在线程池中下载）"""
+        if account.cookie_path is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, account.cookie_header)
+        return account.cookie_header()
+
+    def lookup_cache(self, spec):
+        """
+        查询响应缓存，并在spec中记下缓存键（执行成功后写入缓存）
+
+        Args:
+            spec: 请求描述，spec['cache'] 为缓存控制指令
+
+        Returns:
+            dict 或 None: 命中时返回缓存的结果
+        """
+        cache = self.response_cache
+        if cache is None:
+            return None
+
+        directive = spec.get('cache')
+        if directive == CACHE_INVALIDATE:
+            cache.invalidate(spec['url'])
+        ttl = cache.ttl_for(spec['method'], spec['url'])
+        if not ttl:
+            return None
+
+        key = cache.make_key(spec['method'], spec['url'], spec.get('data'), spec.get('params'),
+                             spec.get('raw', False), spec.get('account'))
+        spec['cache_entry'] = (key, ttl)
+        if directive is None:
+            cached = cache.get(key)
+            metrics.inc('dxm_cache_requests_total', {'result': 'miss' if cached is None else 'hit'})
+            return cached
+        cache.bypassed += 1
+        metrics.inc('dxm_cache_requests_total', {'result': 'bypass'})
+        return None
+
+    def _store_cache(self, spec, result, status, body, busy):
+        """只缓存真正执行成功的响应（200且不是上游繁忙提示）"""
+        key, ttl = spec['cache_entry']
+        result['cache'] = 'miss' if spec.get('cache') is None else CACHE_BYPASS
+        if status != 200 or busy:
+            return
+        self.response_cache.put(key, spec['url'], result, ttl, len(body))
+
+    async def _record_feedback(self, rate_controller, busy):
+        """把上游响应反馈给账号的自适应速率控制器（共享后端需要访问SQLite，放到线程池中执行）"""
+        if rate_controller is None:
+            return
+        if isinstance(rate_controller.limiter, SharedRateLimiter):
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, rate_controller.record, busy)
+        else:
+            rate_controller.record(busy)
+
+    async def execute(self, spec, queue_wait, account):
+        """
+        执行一个请求，返回与 GenericAPIService.execute_request 相同格式的结果
+
+        Args:
+            spec: 请求描述 {url, headers, data, method, params}
+            queue_wait: 在队列和限流器中等待的秒数
+            account: 发送请求使用的Account
+        """
+        url = spec['url']
+        method = spec['method'].upper()
+        headers = dict(spec.get('headers') or {})
+        data = spec.get('data')
+        params = spec.get('params')
+
+        # 上游请求的超时时间不超过调用方的剩余时间
+        options = {}
+        deadline = spec.get('deadline')
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining < config.DEADLINE_MIN_UPSTREAM_TIME:
+                return deadline_result(url, method, 'upstream')
+            if remaining < self.timeout:
+                options['timeout'] = aiohttp.ClientTimeout(total=remaining)
+
+        try:
+            headers['cookie'] = await self._get_cookie_string(account)
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'Cookie注入失败: {str(e)}',
+                'request_info': {
+                    'url': url,
+                    'method': method
+                }
+            }
+
+        request_info = {
+            'url': url,
+            'method': method,
+            'headers': {k: v for k, v in headers.items() if k.lower() != 'cookie'},  # 不记录cookie
+            'data': data if method == 'POST' else None,
+            'params': params if method == 'GET' else None,
+            'timestamp': time.time()
+        }
+
+        path = metrics.path_label(url)
+        started = time.monotonic()
+        account.begin()
+        try:
+            if method == 'POST':
+                request_ctx = self.session.post(url, headers=headers, data=data, **options)
+            else:
+                request_ctx = self.session.get(url, headers=headers, params=params, **options)
+
+            async with request_ctx as response:
+                body = await response.read()
+                metrics.inc('dxm_upstream_requests_total', {'path': path, 'status': str(response.status)})
+                metrics.observe('dxm_upstream_latency_seconds', time.monotonic() - started, {'path': path})
+
+                if spec.get('raw'):
+                    # 原样返回: 不解码、不解析JSON
+                    result = {
+                        'success': True,
+                        'status_code': response.status,
+                        'content_type': response.headers.get('Content-Type', 'application/octet-stream'),
+                        'body': body,
+                        'queue_wait': round(queue_wait, 3)
+                    }
+                    text = body
+                else:
+                    text = body.decode(response.charset or 'utf-8', errors='replace')
+                    result = {
+                        'success': True,
+                        'status_code': response.status,
+                        'headers': dict(response.headers),
+                        'queue_wait': round(queue_wait, 3),
+                        'request_info': request_info
+                    }
+
+                    # 尝试解析JSON
+                    try:
+                        result['response'] = json.loads(text)
+                        result['response_type'] = 'json'
+                    except json.JSONDecodeError:
+                        result['response'] = text
+                        result['response_type'] = 'text'
+
+                result['account'] = account.name
+                busy = is_busy_response(response.status, text)
+                if busy:
+                    metrics.inc('dxm_upstream_busy_total', {'path': path})
+                await self._record_feedback(account.rate_controller, busy)
+                if spec.get('cache_entry'):
+                    self._store_cache(spec, result, response.status, body, busy)
+
+                return result
+
+        except asyncio.TimeoutError:
+            metrics.inc('dxm_upstream_requests_total', {'path': path, 'status': 'timeout'})
+            result = {
+                'success': False,
+                'error': '请求超时',
+                'request_info': request_info
+            }
+            if 'timeout' in options:
+                # 超时时间按调用方的截止时间缩短过，结果不给合并的其他请求使用
+                result['deadline_timeout'] = True
+            return result
+        except aiohttp.ClientError as e:
+            metrics.inc('dxm_upstream_requests_total', {'path': path, 'status': 'error'})
+            return {
+                'success': False,
+                'error': f'请求失败: {str(e)}',
+                'request_info': request_info
+            }
+        except Exception as e:
+            return {
+                'success': False,
+                'error': f'未知错误: {str(e)}',
+                'request_info': request_info
+            }
+        finally:
+            account.end()
+
+
+class RequestQueueManager:
+    """
+    管理所有待处理的API请求
+
+    - asyncio.PriorityQueue 按 (通道优先级, 公平排队标签, 入队顺序) 排序，排队中的请求只占一个Future；
+      启用公平排队时同一通道内按客户端加权公平排序（fair_queue.py），否则FIFO
+    - 进行中请求数达到上限的客户端，取出的请求先放到一边，它的请求完成时再放回队列
+    - 固定数量的调度协程从队列取出请求，经过限流器后交给执行器（重接口按 request_cost.py 消耗多个令牌）
+    - 相同的只读请求正在排队或执行时，后来的请求直接等待它的结果（single-flight，同一通道内），
+      等待时间受自己的 max_wait 限制；所有等待者都断开后取消排队中的请求
+    """
+
+    def __init__(self, executor, limiter, max_queue_size, dispatchers, account_limiters=None, fair=None,
+                 costs=None):
+        """
+        Args:
+            executor: RequestExecutor
+            limiter: AsyncRateLimiter（主账号，用于解析优先级通道）
+            max_queue_size: 队列最大长度（包括暂时放到一边的请求）
+            dispatchers: 调度协程数
+            account_limiters: {账号名: AsyncRateLimiter}，未列出的账号使用 limiter
+            fair: FairScheduler，None表示同一通道内按到达顺序排队
+            costs: request_cost.CostTable，默认按 config.REQUEST_COST_RULES 创建
+        """
+        self.executor = executor
+        self.limiter = limiter
+        self.account_limiters = account_limiters or {}
+        self.fair = fair
+        self.costs = create_cost_table() if costs is None else costs
+        self.max_queue_size = max_queue_size
+        self.queue = asyncio.PriorityQueue()
+        self._deferred = {}  # 客户端名 -> 因进行中请求数达到上限而暂缓的队列项
+        self._deferred_count = 0
+        self.dispatchers = dispatchers
+        self.in_flight = 0
+        self.queued = {lane: 0 for lane in limiter.limiter.lanes}
+        self._sequence = itertools.count()
+        self._tasks = []
+        self.coalesce = config.SINGLE_FLIGHT_ENABLED
+        self.flights = AsyncSingleFlight()
+
+    async def start(self):
+        """启动调度协程"""
+        self._tasks = [asyncio.create_task(self._dispatch()) for _ in range(self.dispatchers)]
+
+    async def stop(self):
+        """停止调度协程"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    async def submit(self, spec):
+        """
+        提交请求并等待结果
+
+        Args:
+            spec: 请求描述，spec['priority'] 必须是已解析的通道名
+
+        Raises:
+            QueueFullError: 队列已满
+        """
+        result = await self._submit(spec)
+        # 缓存和合并都使用完整响应，字段投影在最后对每个调用方单独执行
+        if spec.get('select') is not None:
+            result = apply_select(result, compile_select(spec['select']))
+        return result
+
+    async def _submit(self, spec):
+        """查询响应缓存 → 合并相同请求 → 排队"""
+        # 命中响应缓存时不排队，也不消耗令牌
+        cached = self.executor.lookup_cache(spec)
+        if cached is not None:
+            return cached
+
+        if not self.coalesce or not is_read_request(spec['method'], spec['url']):
+            return await self._enqueue(spec)
+
+        # 不同通道的请求不合并，交互请求不会等在排队中的批量请求后面
+        key = spec['priority'] + ':' + (spec.get('cache_entry', (None,))[0] or ResponseCache.make_key(
+            spec['method'], spec['url'], spec.get('data'), spec.get('params'), spec.get('raw', False),
+            spec.get('account')))
+        max_wait = spec.get('max_wait')
+        if max_wait is None:
+            max_wait = config.RATE_LIMIT_MAX_WAIT
+        wait_until = None if max_wait is None else time.monotonic() + max_wait
+
+        def start(admitted):
+            # 合并的请求可能先等过一个被拒绝的leader，排队时间从进入服务时算起
+            remaining = None if wait_until is None else max(0.0, wait_until - time.monotonic())
+            return self._enqueue(dict(spec, max_wait=remaining, admitted=admitted))
+
+        # 等待leader的时间受这个请求自己的 max_wait 和截止时间限制
+        deadline = spec.get('deadline')
+        queue_by, bounded = wait_until, False
+        if deadline is not None and (queue_by is None or deadline - config.DEADLINE_MIN_UPSTREAM_TIME < queue_by):
+            queue_by, bounded = deadline - config.DEADLINE_MIN_UPSTREAM_TIME, True
+        try:
+            result, shared = await self.flights.do(key, start, queue_by, deadline)
+        except FlightTimeout as e:
+            if e.admitted:
+                # leader已经发往上游，但在这个请求的截止时间前没有返回
+                return deadline_result(spec['url'], spec['method'], 'flight')
+            if bounded:
+                return deadline_result(spec['url'], spec['method'], 'queue')
+            # leader在这个请求的 max_wait 内没有领到令牌，与自己排队时一样快速失败
+            return rate_limited_result(spec['url'], spec['method'], spec['priority'],
+                                       max_wait or 1.0 / self.limiter.limiter.rate)
+        if shared:
+            metrics.inc('dxm_single_flight_coalesced_total')
+            result = dict(result, coalesced=True)
+        return result
+
+    async def _enqueue(self, spec):
+        """放入优先级队列并等待调度协程执行"""
+        lane = spec['priority']
+        if self.queue.qsize() + self._deferred_count >= self.max_queue_size:
+            raise QueueFullError(f"请求队列已满 ({self.max_queue_size})")
+        future = asyncio.get_running_loop().create_future()
+        spec['cost'], spec['family'] = self.costs.cost(spec['method'], spec['url'], spec.get('data'),
+                                                       spec.get('params'))
+        client = spec.get('client') if self.fair is not None else None
+        tag = self.fair.tag(lane, client, spec['cost']) if client is not None else 0.0
+        self.queue.put_nowait((self.limiter.limiter.rank(lane), tag, next(self._sequence), spec,
+                               time.monotonic(), future))
+        self.queued[lane] += 1
+        return await future
+
+    def _resume(self, client):
+        """客户端的一个请求完成，把它暂缓的下一个请求放回队列"""
+        deferred = self._deferred.get(client)
+        if not deferred:
+            return
+        self.queue.put_nowait(deferred.popleft())
+        self._deferred_count -= 1
+        if not deferred:
+            del self._deferred[client]
+
+    async def _dispatch(self):
+        """调度循环：取请求（高优先级通道优先，通道内按客户端公平排序） → 选择账号 → 该账号的限流器 → 执行"""
+        while True:
+            item = await self.queue.get()
+            _, tag, _, spec, enqueued_at, future = item
+            lane = spec['priority']
+            client = spec.get('client') if self.fair is not None else None
+            admitted = rejected = False
+            try:
+                # 客户端已断开，不再消耗令牌
+                if future.done():
+                    self.queued[lane] -= 1
+                    if client is not None:
+                        self.fair.cancel(client)
+                    continue
+
+                # 该客户端进行中的请求数已达上限，先放到一边（仍计入排队数）
+                if client is not None and not self.fair.can_admit(client):
+                    self._deferred.setdefault(client, collections.deque()).append(item)
+                    self._deferred_count += 1
+                    continue
+
+                self.queued[lane] -= 1
+                if client is not None:
+                    self.fair.admit(lane, client, tag)
+                    admitted = True
+
+                max_wait = spec.get('max_wait')
+                if max_wait is None:
+                    max_wait = config.RATE_LIMIT_MAX_WAIT
+                if max_wait is not None:
+                    max_wait = max(0.0, max_wait - (time.monotonic() - enqueued_at))
+
+                # 截止时间: 排队时间不能超过剩余时间（留出上游请求的时间），已经过期的请求不再领令牌
+                bounded = False
+                deadline = spec.get('deadline')
+                if deadline is not None:
+                    budget = deadline - time.monotonic() - config.DEADLINE_MIN_UPSTREAM_TIME
+                    if budget <= 0:
+                        rejected = True
+                        if not future.done():
+                            future.set_result(deadline_result(spec['url'], spec['method'], 'queue'))
+                        continue
+                    if max_wait is None or budget < max_wait:
+                        max_wait, bounded = budget, True
+
+                try:
+                    account = self.executor.accounts.select(spec.get('account'), spec.get('sticky'))
+                except ValueError as e:
+                    rejected = True
+                    if not future.done():
+                        future.set_result({'success': False, 'status_code': 400, 'error': str(e)})
+                    continue
+
+                try:
+                    await self.account_limiters.get(account.name, self.limiter).acquire(
+                        max_wait, spec['priority'], spec['cost'], spec['family'])
+                except RateLimitExceeded as e:
+                    rejected = True
+                    if bounded:
+                        if not future.done():
+                            future.set_result(deadline_result(spec['url'], spec['method'], 'queue'))
+                        continue
+                    if not future.done():
+                        future.set_result(rate_limited_result(spec['url'], spec['method'], spec['priority'],
+                                                              e.retry_after))
+                    continue
+
+                if spec.get('admitted') is not None:
+                    spec['admitted']()
+                queue_wait = time.monotonic() - enqueued_at
+                metrics.observe('dxm_limiter_wait_seconds', queue_wait, {'lane': spec['priority']})
+                metrics.inc('dxm_limiter_tokens_total', {'family': spec['family'] or 'default'}, spec['cost'])
+                if admitted:
+                    self.fair.served(client, queue_wait)
+                self.in_flight += 1
+                try:
+                    result = await self.executor.execute(spec, queue_wait, account)
+                finally:
+                    self.in_flight -= 1
+
+                if not future.done():
+                    future.set_result(result)
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.cancel()
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                if admitted:
+                    self.fair.finish(client, rejected=rejected)
+                    self._resume(client)
+                self.queue.task_done()
+
+    def stats(self):
+        """队列统计信息"""
+        return {
+            'queue_size': self.queue.qsize() + self._deferred_count,
+            'max_queue_size': self.max_queue_size,
+            'deferred': self._deferred_count,
+            'in_flight': self.in_flight,
+            'dispatchers': self.dispatchers,
+            'queued_by_lane': dict(self.queued),
+            'single_flight': self.flights.stats()
+        }
+
+
+class AsyncJobDispatcher:
+    """异步任务执行器 - 从SQLite任务表领取任务，交给 RequestQueueManager 执行"""
+
+    def __init__(self, store, manager, workers):
+        """
+        Args:
+            store: JobStore
+            manager: RequestQueueManager
+            workers: 同时执行的任务数
+        """
+        self.store = store
+        self.manager = manager
+        self.workers = workers
+        self.completed = 0
+        self.running = 0
+        self._wakeup = None
+        self._tasks = []
+
+    async def _call(self, func, *args):
+        """SQLite操作放到线程池中执行"""
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def start(self):
+        """回收中断的任务并启动执行协程"""
+        self._wakeup = asyncio.Event()
+        await self._call(self.store.heartbeat)
+        report_orphans('AsyncJobDispatcher', *await self._call(self.store.requeue_orphans))
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._housekeeping()))
+
+    async def stop(self):
+        """停止执行协程（正在执行的任务保持running，进程退出后按 JobStore.requeue_orphans 的规则处理）"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def notify(self):
+        """有新任务提交时唤醒空闲协程"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                job = await self._call(self.store.claim)
+            except Exception as e:
+                print(f"[AsyncJobDispatcher] ⚠️  领取任务失败: {e}")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), config.JOB_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            job_id, spec = job
+            spec['max_wait'] = None
+            self.running += 1
+            try:
+                try:
+                    result = await self.manager.submit(spec)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    result = {'success': False, 'error': f'未知错误: {str(e)}'}
+                await self._call(self.store.complete, job_id, result)
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[AsyncJobDispatcher] ⚠️  保存任务结果失败: {job_id} ({e})")
+            finally:
+                self.running -= 1
+
+    async def _housekeeping(self):
+        """定期发送心跳、回收中断的任务、清理过期结果"""
+        last_cleanup = time.monotonic()
+        while True:
+            await asyncio.sleep(config.JOB_HEARTBEAT_INTERVAL)
+            try:
+                await self._call(self.store.heartbeat)
+                if time.monotonic() - last_cleanup >= 60:
+                    last_cleanup = time.monotonic()
+                    report_orphans('AsyncJobDispatcher', *await self._call(self.store.requeue_orphans))
+                    await self._call(self.store.purge, config.JOB_RESULT_TTL)
+            except Exception as e:
+                print(f"[AsyncJobDispatcher] ⚠️  任务清理失败: {e}")
+
+    async def stats(self):
+        """任务统计信息"""
+        return {
+            'jobs': await self._call(self.store.counts),
+            'dispatchers': self.workers,
+            'running_in_worker': self.running,
+            'completed_in_worker': self.completed
+        }
+
+
+# ==================== HTTP接口层 ====================
+
+def _json_response(body, status=200, headers=None):
+    """返回JSON响应（保留中文）"""
+    return web.json_response(
+        body,
+        status=status,
+        headers=headers,
+        dumps=lambda obj: json.dumps(obj, ensure_ascii=False)
+    )
+
+
+async def handle_execute(request):
+    """
+    通用HTTP请求执行器 - 参数和返回格式与 server.py 的 /api/execute 相同
+    """
+    try:
+        try:
+            request_data = await _read_json(request)
+        except ValueError:
+            request_data = None
+
+        if not request_data:
+            return _json_response({
+                "success": False,
+                "error": "请求体不能为空",
+                "message": "请提供JSON格式的请求参数"
+            }, 400)
+
+        url = request_data.get('url')
+        method = request_data.get('method', 'POST')
+
+        if not url:
+            return _json_response({
+                "success": False,
+                "error": "缺少必填参数: url",
+                "message": "请提供目标API的URL"
+            }, 400)
+
+        if method.upper() not in ['POST', 'GET']:
+            return _json_response({
+                "success": False,
+                "error": f"不支持的HTTP方法: {method}",
+                "message": "仅支持POST和GET方法"
+            }, 400)
+
+        manager = request.app['queue_manager']
+        spec = _make_spec(request_data, default_priority=request.headers.get('X-Priority'),
+                          default_cache=request.headers.get('X-Cache'),
+                          default_account=request.headers.get('X-Account'),
+                          default_sticky=request.headers.get('X-Sticky-Key'))
+        spec['client'] = _request_client(request)
+        spec['deadline'] = parse_deadline(request.headers.get(config.DEADLINE_HEADER))
+        spec['raw'] = wants_raw(request_data.get('raw') or request.headers.get('X-Raw-Response'))
+        error = _validate_request_spec(request_data)
+        if error is None and spec['raw'] and spec['select'] is not None:
+            error = "select 不能与 raw 同时使用"
+        if error:
+            return _json_response({"success": False, "error": error}, 400)
+        spec['max_wait'] = parse_max_wait(spec['max_wait'])
+        try:
+            spec['priority'] = manager.limiter.limiter.resolve(spec['priority'])
+        except ValueError as e:
+            return _json_response({
+                "success": False,
+                "error": str(e),
+                "message": "请使用 config.PRIORITY_LANES 中的优先级"
+            }, 400)
+        if spec['account']:
+            try:
+                manager.executor.accounts.get(spec['account'])
+            except ValueError as e:
+                return _json_response({"success": False, "error": str(e)}, 400)
+
+        if spec['cache'] is not None and spec['cache'] not in CACHE_DIRECTIVES:
+            return _json_response({
+                "success": False,
+                "error": f"不支持的缓存指令: {spec['cache']}",
+                "message": f"可选值: {', '.join(CACHE_DIRECTIVES)}"
+            }, 400)
+
+        try:
+            result = await manager.submit(spec)
+        except QueueFullError as e:
+            rate = manager.limiter.limiter.rate
+            retry_after = manager.queue.qsize() / rate if rate else 1
+            return _json_response({
+                "success": False,
+                "status_code": 429,
+                "error": str(e),
+                "retry_after": round(retry_after, 3)
+            }, 429, headers={'Retry-After': str(max(1, math.ceil(retry_after)))})
+
+        if result.get('success') and spec['raw']:
+            return web.Response(body=result['body'], status=result['status_code'],
+                                headers=raw_response_headers(result))
+        if result.get('success'):
+            return _json_response(result, 200)
+
+        headers = None
+        if 'retry_after' in result:
+            headers = {'Retry-After': str(max(1, math.ceil(result['retry_after'])))}
+        return _json_response(result, result.get('status_code', 500), headers=headers)
+
+    except Exception as e:
+        error_trace = traceback.format_exc()
+        print(f"[AsyncServer] 错误: {error_trace}")
+
+        return _json_response({
+            "success": False,
+            "error": str(e),
+            "message": "服务器内部错误",
+            "traceback": error_trace
+        }, 500)
+
+
+async def _read_json(request):
+    """
+    读取JSON请求体（支持 Content-Encoding: gzip / zstd 的压缩请求体）
+
+    Raises:
+        ValueError: 解压失败或不是合法的JSON
+    """
+    body = await request.read()
+    body = decompress(body, request.headers.get('Content-Encoding'))
+    return json.loads(body) if body else None
+
+
+def _make_spec(request_data, default_max_wait=None, default_priority=None, default_cache=None,
+               default_account=None, default_sticky=None):
+    """把请求参数整理成队列使用的请求描述（priority 尚未解析为通道名）"""
+    return {
+        'url': request_data.get('url'),
+        'headers': request_data.get('headers', {}),
+        'data': request_data.get('data'),
+        'method': request_data.get('method', 'POST'),
+        'params': request_data.get('params'),
+        'max_wait': request_data.get('max_wait', default_max_wait),
+        'priority': request_data.get('priority') or default_priority,
+        'cache': request_data.get('cache') or default_cache,
+        'select': request_data.get('select'),
+        'account': request_data.get('account') or default_account,
+        'sticky': request_data.get('sticky') or default_sticky
+    }
+
+
+def _request_client(request):
+    """当前请求的客户端名（API Key 请求头或来源IP），未启用公平排队时返回None"""
+    return client_from_headers(request.app['queue_manager'].fair, request.headers, request.remote)
+
+
+def _validate_request_spec(spec):
+    """校验单个请求描述，返回错误信息，合法时返回None"""
+    if not isinstance(spec, dict):
+        return "请求描述必须是JSON对象"
+    if not spec.get('url'):
+        return "缺少必填参数: url"
+    method = spec.get('method', 'POST')
+    if not isinstance(method, str) or method.upper() not in ['POST', 'GET']:
+        return f"不支持的HTTP方法: {method}"
+    try:
+        parse_max_wait(spec.get('max_wait'))
+    except ValueError as e:
+        return str(e)
+    if spec.get('select') is not None:
+        try:
+            compile_select(spec['select'])
+        except ValueError as e:
+            return str(e)
+    return None
+
+
+def _ndjson_line(obj):
+    """序列化为一行NDJSON"""
+    return (json.dumps(obj, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+async def handle_execute_batch(request):
+    """
+    批量HTTP请求执行器 - 参数和返回格式与 server.py 的 /api/execute_batch 相同
+    """
+    try:
+        request_data = await _read_json(request)
+    except ValueError:
+        request_data = None
+
+    specs = request_data.get('requests') if isinstance(request_data, dict) else None
+    if not isinstance(specs, list) or not specs:
+        return _json_response({
+            "success": False,
+            "error": "缺少必填参数: requests",
+            "message": "请提供非空的请求列表"
+        }, 400)
+
+    if len(specs) > config.BATCH_MAX_REQUESTS:
+        return _json_response({
+            "success": False,
+            "error": f"请求数量超过上限: {len(specs)} > {config.BATCH_MAX_REQUESTS}",
+            "message": "请拆分成多个批次提交"
+        }, 400)
+
+    try:
+        default_max_wait = parse_max_wait(request_data.get('max_wait'))
+    except ValueError as e:
+        return _json_response({"success": False, "error": str(e)}, 400)
+
+    manager = request.app['queue_manager']
+    default_priority = (request_data.get('priority') or request.headers.get('X-Priority')
+                        or config.PRIORITY_BATCH_DEFAULT)
+    default_cache = request_data.get('cache') or request.headers.get('X-Cache')
+    client = _request_client(request)
+    deadline = parse_deadline(request.headers.get(config.DEADLINE_HEADER))
+
+    async def run(index, spec):
+        try:
+            result = await manager.submit(spec)
+        except QueueFullError as e:
+            result = {'success': False, 'status_code': 429, 'error': str(e)}
+        except Exception as e:
+            result = {'success': False, 'error': f'未知错误: {str(e)}'}
+        return dict(result, index=index)
+
+    # 结果逐行gzip压缩并立即flush，客户端仍然能逐行读取
+    headers = {'Content-Type': 'application/x-ndjson; charset=utf-8'}
+    stream = None
+    if should_compress(headers['Content-Type']) and choose_encoding(request.headers.get('Accept-Encoding'),
+                                                                    streaming=True):
+        stream = GzipStream()
+        headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+    response = web.StreamResponse(headers=headers)
+    await response.prepare(request)
+
+    async def write(line):
+        await response.write(stream.compress(line) if stream is not None else line)
+
+    tasks = []
+    try:
+        for index, raw_spec in enumerate(specs):
+            error = _validate_request_spec(raw_spec)
+            if not error:
+                spec = _make_spec(raw_spec, default_max_wait, default_priority, default_cache,
+                                  request.headers.get('X-Account'), request.headers.get('X-Sticky-Key'))
+                spec['client'] = client
+                spec['deadline'] = deadline
+                spec['max_wait'] = parse_max_wait(spec['max_wait'])
+                try:
+                    spec['priority'] = manager.limiter.limiter.resolve(spec['priority'])
+                    if spec['account']:
+                        manager.executor.accounts.get(spec['account'])
+                except ValueError as e:
+                    error = str(e)
+                if spec['cache'] is not None and spec['cache'] not in CACHE_DIRECTIVES:
+                    error = f"不支持的缓存指令: {spec['cache']}"
+            if error:
+                await write(_ndjson_line({'index': index, 'success': False, 'status_code': 400, 'error': error}))
+                continue
+            tasks.append(asyncio.ensure_future(run(index, spec)))
+
+        for next_done in asyncio.as_completed(tasks):
+            await write(_ndjson_line(await next_done))
+    finally:
+        # 客户端断开时，取消尚未完成的请求，排队中的请求不再消耗令牌
+        for task in tasks:
+            task.cancel()
+
+    if stream is not None:
+        await response.write(stream.finish())
+    await response.write_eof()
+    return response
+
+
+async def handle_submit_job(request):
+    """提交异步任务 - 参数和返回格式与 server.py 的 POST /api/jobs 相同"""
+    try:
+        request_data = await _read_json(request)
+    except ValueError:
+        request_data = None
+
+    error = _validate_request_spec(request_data)
+    if error:
+        return _json_response({
+            "success": False,
+            "error": error,
+            "message": "请提供JSON格式的请求参数"
+        }, 400)
+
+    manager = request.app['queue_manager']
+    priority_limiter = manager.limiter.limiter
+    spec = _make_spec(request_data, default_priority=request.headers.get('X-Priority'),
+                      default_cache=request.headers.get('X-Cache'),
+                      default_account=request.headers.get('X-Account'),
+                      default_sticky=request.headers.get('X-Sticky-Key'))
+    spec['client'] = _request_client(request)
+    try:
+        spec['priority'] = priority_limiter.resolve(spec['priority'])
+        if spec['account']:
+            manager.executor.accounts.get(spec['account'])
+    except ValueError as e:
+        return _json_response({"success": False, "error": str(e)}, 400)
+    if spec['cache'] is not None and spec['cache'] not in CACHE_DIRECTIVES:
+        return _json_response({"success": False, "error": f"不支持的缓存指令: {spec['cache']}"}, 400)
+
+    dispatcher = request.app['job_dispatcher']
+    loop = asyncio.get_running_loop()
+    try:
+        job_id = await loop.run_in_executor(
+            None, dispatcher.store.submit, spec, priority_limiter.rank(spec['priority']), config.JOB_MAX_QUEUED)
+    except JobQueueFull as e:
+        retry_after = max(1, math.ceil(config.JOB_MAX_QUEUED / priority_limiter.rate))
+        return _json_response({"success": False, "status_code": 429, "error": str(e)}, 429,
+                              headers={'Retry-After': str(retry_after)})
+    dispatcher.notify()
+
+    return _json_response({
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}"
+    }, 202)
+
+
+async def handle_get_job(request):
+    """查询异步任务 - 参数和返回格式与 server.py 的 GET /api/jobs/<id> 相同"""
+    job_id = request.match_info['job_id']
+    try:
+        wait = min(float(request.query.get('wait', 0)), config.JOB_MAX_LONG_POLL)
+    except ValueError:
+        return _json_response({"success": False, "error": "wait必须是数字"}, 400)
+
+    store = request.app['job_dispatcher'].store
+    loop = asyncio.get_running_loop()
+    deadline = time.monotonic() + wait
+    while True:
+        job = await loop.run_in_executor(None, store.get, job_id)
+        if job is None:
+            return _json_response({"success": False, "error": f"任务不存在: {job_id}"}, 404)
+        if job['status'] == JOB_DONE or time.monotonic() >= deadline:
+            break
+        await asyncio.sleep(config.JOB_LONG_POLL_INTERVAL)
+
+    return _json_response(dict(job, success=True))
+
+
+async def handle_health(request):
+    """健康检查endpoint"""
+    executor = request.app['executor']
+    return _json_response({
+        "status": "healthy",
+        "service": "generic-api-async",
+        "version": "2.0.0",
+        "cookie_available": executor.accounts.primary.cookie_path is not None
+    })
+
+
+async def handle_status(request):
+    """服务器状态endpoint - 队列与限流器统计"""
+    manager = request.app['queue_manager']
+    executor = request.app['executor']
+    cache = executor.response_cache
+    return _json_response({
+        "server_status": "running",
+        "queue": manager.stats(),
+        "rate_limit": manager.limiter.limiter.stats(),
+        "response_cache": cache.stats() if cache else None,
+        "adaptive_rate": executor.rate_controller.stats() if executor.rate_controller else None,
+        "accounts": executor.accounts.stats(),
+        "clients": manager.fair.stats() if manager.fair else None,
+        "jobs": await request.app['job_dispatcher'].stats()
+    })
+
+
+async def handle_metrics(request):
+    """Prometheus抓取endpoint（汇总所有worker的指标，读写快照文件放到线程池中执行）"""
+    loop = asyncio.get_running_loop()
+    text = await loop.run_in_executor(None, request.app['metrics'].render)
+    return web.Response(body=text.encode('utf-8'),
+                        headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+def _register_metrics(app):
+    """注册 /metrics 中的瞬时值"""
+    manager = app['queue_manager']
+    collector = app['metrics']
+    accounts = app['executor'].accounts
+
+    metrics.REGISTRY.register_gauge('dxm_queue_depth', lambda: {
+        (('lane', lane),): count for lane, count in manager.queued.items()
+    })
+    metrics.REGISTRY.register_gauge('dxm_in_flight_requests', lambda: manager.in_flight)
+    if manager.fair is not None:
+        metrics.REGISTRY.register_gauge('dxm_client_waiting', lambda: manager.fair.gauge('waiting'))
+        metrics.REGISTRY.register_gauge('dxm_client_in_flight', lambda: manager.fair.gauge('in_flight'))
+    collector.register_global_gauge('dxm_rate_limit_rate', lambda: {
+        (('account', account.name),): account.limiter.rate for account in accounts.accounts
+    })
+    collector.register_global_gauge('dxm_cookie_age_seconds', accounts.cookie_ages)
+    collector.register_global_gauge('dxm_jobs', lambda: {
+        (('status', status),): count for status, count in app['job_dispatcher'].store.counts().items()
+    })
+
+
+async def handle_cache_invalidate(request):
+    """清除响应缓存 - 参数和返回格式与 server.py 的 /api/cache/invalidate 相同"""
+    cache = request.app['executor'].response_cache
+    if cache is None:
+        return _json_response({"success": True, "removed": 0, "message": "响应缓存未启用"})
+
+    try:
+        request_data = await _read_json(request)
+    except ValueError:
+        request_data = None
+    url = request_data.get('url') if isinstance(request_data, dict) else None
+    loop = asyncio.get_running_loop()
+    removed = await loop.run_in_executor(None, cache.invalidate, url)
+    return _json_response({"success": True, "removed": removed, "scope": cache.scope})
+
+
+@web.middleware
+async def compression_middleware(request, handler):
+    """按 Accept-Encoding 压缩响应（与 server.py 的 compress_response 相同；流式的批量响应在handler中自行压缩）"""
+    response = await handler(request)
+    if not isinstance(response, web.Response) or not isinstance(response.body, bytes):
+        return response
+    if 'Content-Encoding' in response.headers:
+        return response
+    if not should_compress(response.headers.get('Content-Type'), len(response.body)):
+        return response
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    response.body = compress(response.body, encoding)
+    response.headers['Content-Encoding'] = encoding
+    response.headers.add('Vary', 'Accept-Encoding')
+    return response
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    """允许跨域请求（与Flask版本的CORS(app)一致）"""
+    response = await handler(request)
+    response.headers['Access-Control-Allow-Origin'] = '*'
+    return response
+
+
+async def _on_startup(app):
+    await app['executor'].start()
+    await app['queue_manager'].start()
+    await app['job_dispatcher'].start()
+    app['metrics'].start()
+    print("[AsyncServer] ✓ 服务初始化成功")
+
+
+async def _on_cleanup(app):
+    await app['job_dispatcher'].stop()
+    await app['queue_manager'].stop()
+    await app['executor'].close()
+
+
+def create_app():
+    """创建aiohttp应用"""
+    app = web.Application(middlewares=[cors_middleware, compression_middleware])
+
+    accounts = create_account_pool()
+    account_limiters = {account.name: AsyncRateLimiter(account.limiter) for account in accounts.accounts}
+    executor = RequestExecutor(
+        pool_size=config.ASYNC_POOL_SIZE,
+        timeout=config.UPSTREAM_TIMEOUT,
+        accounts=accounts,
+        response_cache=create_response_cache()
+    )
+    app['executor'] = executor
+    app['queue_manager'] = RequestQueueManager(
+        executor=executor,
+        limiter=account_limiters[accounts.primary.name],
+        max_queue_size=config.ASYNC_MAX_QUEUE_SIZE,
+        dispatchers=config.ASYNC_DISPATCHERS,
+        account_limiters=account_limiters,
+        fair=get_fair_scheduler()
+    )
+    app['job_dispatcher'] = AsyncJobDispatcher(
+        store=JobStore(config.JOB_DB_PATH),
+        manager=app['queue_manager'],
+        workers=config.JOB_DISPATCHERS
+    )
+    app['metrics'] = metrics.create_collector('async')
+    _register_metrics(app)
+
+    app.router.add_post('/api/execute', handle_execute)
+    app.router.add_post('/api/execute_batch', handle_execute_batch)
+    app.router.add_post('/api/jobs', handle_submit_job)
+    app.router.add_get('/api/jobs/{job_id}', handle_get_job)
+    app.router.add_post('/api/cache/invalidate', handle_cache_invalidate)
+    app.router.add_get('/api/status', handle_status)
+    app.router.add_get('/health', handle_health)
+    app.router.add_get('/metrics', handle_metrics)
+
+    app.on_startup.append(_on_startup)
+    app.on_cleanup.append(_on_cleanup)
+    return app
+
+
+async def app_factory():
+    """gunicorn (aiohttp.GunicornWebWorker) 使用的应用工厂"""
+    return create_app()
+
+
+if __name__ == '__main__':
+    print("=" * 60)
+    print("通用HTTP API代理服务器 (asyncio)")
+    print("=" * 60)
+    print(f"服务器地址: http://{config.API_HOST}:{config.ASYNC_API_PORT}")
+    print(f"速率限制: {config.RATE_LIMIT_RATE:g}次/秒")
+    print(f"队列长度上限: {config.ASYNC_MAX_QUEUE_SIZE}")
+    print(f"主要endpoint: POST /api/execute")
+    print("=" * 60)
+    print("\n启动服务器...")
+
+    web.run_app(create_app(), host=config.API_HOST, port=config.ASYNC_API_PORT)
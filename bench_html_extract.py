@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+商品列表HTML提取压测 - 对比原来的BeautifulSoup逐层向上查找和 html_extract 的一次解析
+
+测试方法：
+1. 读取保存的 dxmCommodityProduct/pageList.htm 页面（--fixtures 目录下的 *.htm / *.html），
+   没有指定时生成一个结构相同的合成页面（--rows 个商品行）
+2. 原来的做法: BeautifulSoup(html.parser) 解析，对每个 goodsSKUName 向上15层，每层 find_all 带title的元素
+3. 新的做法: html_extract.extract_product_rows 解析一次 + match_variant，每个可用引擎分别计时
+4. 输出每页平均耗时、相对原做法的加速比和两种做法匹配到的SKU数
+   （原做法在SKU所在行找不到变体时会继续向上，匹配到同一商品其他变体行的title，所以匹配数通常更多）
+
+保存页面的方法: 在浏览器开发者工具中把 pageList.htm 请求的响应另存为 .htm 文件（提交前去掉店铺和商品信息）；
+fixtures/ 目录下有一个匿名化的页面，test_html_extract.py 用它对比新旧做法的首个匹配
+
+运行方式：
+    python bench_html_extract.py
+    python bench_html_extract.py --fixtures ./fixtures --shop-code A01 --variant Red --repeat 50
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from html_extract import available_engines, extract_product_rows, match_variant
+
+try:
+    from bs4 import BeautifulSoup
+except ImportError:
+    BeautifulSoup = None
+
+
+VARIANTS = ['Red', 'Blue', 'Black']
+SIZES = ['M', 'L']
+
+
+def synthetic_page(rows, shop_code):
+    """生成与 pageList.htm 结构相同的页面: 每个商品一行，行内嵌套变体表格"""
+    parts = ['<html><body><table class="myj-table"><tbody>']
+    for i in range(rows):
+        parts.append(
+            f'<tr class="content"><td><div class="imgDivOut"><img src="/img/{i}.jpg" title="商品图片{i}"/></div></td>'
+            f'<td><a href="/dxmCommodityProduct/edit.htm?id={i}" title="测试商品 {i} 长标题 ' + '关键词 ' * 8 + '">'
+            f'测试商品 {i}</a><table class="variant"><tbody>'
+        )
+        for j, color in enumerate(VARIANTS):
+            for size in SIZES:
+                parts.append(
+                    f'<tr><td><span class="inline-block no-new-line maxW240 goodsSKUName white-space">'
+                    f'{shop_code}-{i:04d}-{j}{size}</span></td>'
+                    f'<td><span class="attr" title="{color} / {size}">{color} / {size}</span></td>'
+                    f'<td><span title="库存">{i * j}</span><span title="价格">{i}.{j}9</span></td></tr>'
+                )
+        parts.append('</tbody></table></td><td><span title="已检查" data-content="已检查">✓</span></td></tr>')
+    parts.append('</tbody></table></body></html>')
+    return ''.join(parts)
+
+
+def legacy_search(html, shop_code, variant):
+    """原来的做法（api_service.search_dxm_product_all 改造前的代码）"""
+    soup = BeautifulSoup(html, 'html.parser')
+    sku_elements = soup.find_all('span', class_='inline-block no-new-line maxW240 goodsSKUName white-space')
+    exact_results = []
+    contains_results = []
+    for sku_element in sku_elements:
+        sku_name = sku_element.get_text(strip=True)
+        if not (sku_name.startswith(shop_code) or shop_code in sku_name):
+            continue
+        current_element = sku_element
+        for _ in range(15):
+            current_element = current_element.parent
+            if current_element is None:
+                break
+            for title_element in current_element.find_all(attrs={'title': True}):
+                title_text = title_element.get('title', '')
+                if title_text and variant.lower() in title_text.lower():
+                    result = {'sku_name': sku_name, 'title': title_text}
+                    (exact_results if sku_name.startswith(shop_code) else contains_results).append(result)
+                    break
+    return exact_results if exact_results else contains_results
+
+
+def new_search(html, shop_code, variant, engine):
+    exact_results, contains_results = match_variant(extract_product_rows(html, engine), shop_code, variant)
+    return exact_results if exact_results else contains_results
+
+
+def measure(func, pages, repeat):
+    """每页平均耗时（秒）和最后一次的结果"""
+    results = None
+    start = time.perf_counter()
+    for _ in range(repeat):
+        results = [func(html) for html in pages]
+    return (time.perf_counter() - start) / (repeat * len(pages)), results
+
+
+def load_pages(fixtures, rows, shop_code):
+    """读取保存的页面，没有时生成合成页面"""
+    if fixtures:
+        paths = sorted(glob.glob(os.path.join(fixtures, '*.htm')) + glob.glob(os.path.join(fixtures, '*.html')))
+        if not paths:
+            raise SystemExit(f"目录中没有 .htm / .html 页面: {fixtures}")
+        pages = []
+        for path in paths:
+            with open(path, encoding='utf-8') as f:
+                pages.append(f.read())
+        return pages, f"{len(pages)} 个保存的页面 ({fixtures})"
+    return [synthetic_page(rows, shop_code)], f"合成页面 ({rows} 个商品行)"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="商品列表HTML提取压测")
+    parser.add_argument('--fixtures', help="保存的pageList.htm页面目录，默认使用合成页面")
+    parser.add_argument('--rows', type=int, default=50, help="合成页面的商品行数")
+    parser.add_argument('--shop-code', default='A01', help="店铺编码")
+    parser.add_argument('--variant', default='Blue / L', help="变体信息")
+    parser.add_argument('--repeat', type=int, default=20, help="每个页面重复次数")
+    args = parser.parse_args()
+
+    pages, source = load_pages(args.fixtures, args.rows, args.shop_code)
+
+    print("=" * 60)
+    print("商品列表HTML提取压测")
+    print("=" * 60)
+    print(f"页面: {source}, 平均大小 {sum(len(p) for p in pages) // len(pages)} 字符")
+    print(f"店铺编码: {args.shop_code}, 变体: {args.variant}, 重复: {args.repeat}次")
+
+    baseline = None
+    if BeautifulSoup is not None:
+        # 原做法很慢，重复次数减少
+        baseline, results = measure(lambda html: legacy_search(html, args.shop_code, args.variant),
+                                    pages, max(1, args.repeat // 10))
+        print(f"\nBeautifulSoup (原做法): {baseline * 1000:.2f} ms/页, 匹配 {sum(len(r) for r in results)} 个SKU")
+    else:
+        print("\n未安装 beautifulsoup4，跳过原做法的对比")
+
+    for engine in available_engines():
+        elapsed, results = measure(lambda html: new_search(html, args.shop_code, args.variant, engine),
+                                   pages, args.repeat)
+        line = f"{engine:<11}: {elapsed * 1000:.2f} ms/页"
+        if baseline is not None:
+            line += f", 加速 {baseline / elapsed:.1f}x"
+        print(f"{line}, 匹配 {sum(len(r) for r in results)} 个SKU")
+
+    print("=" * 60)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
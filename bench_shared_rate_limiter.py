@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+共享限流器压测脚本 - 验证多个worker进程的总速率不超过全局预算
+
+测试方法：
+1. 在本地启动一个桩服务器（模拟店小秘），记录每次请求的到达时间
+2. 启动N个worker进程，每个进程M个线程，全部经过SharedRateLimiter后请求桩服务器
+3. 统计桩服务器实际收到的速率，检查是否保持在 8次/秒
+
+运行方式：
+    python bench_shared_rate_limiter.py
+    python bench_shared_rate_limiter.py --workers 17 --threads 2 --duration 10
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import threading
+import multiprocessing
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from rate_limiter import SharedRateLimiter
+
+
+def start_stub_upstream():
+    """启动桩服务器，返回 (server, 到达时间列表)"""
+    arrivals = []
+    arrivals_lock = threading.Lock()
+
+    class StubHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            with arrivals_lock:
+                arrivals.append(time.time())
+            body = b'{"code": 0, "msg": "ok"}'
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, arrivals
+
+
+def worker_main(db_path, bucket_name, rate, capacity, upstream_url, threads, deadline):
+    """worker进程：多个线程循环经过限流器请求桩服务器"""
+    limiter = SharedRateLimiter(db_path, name=bucket_name, rate=rate, capacity=capacity)
+
+    def loop():
+        while True:
+            sleep_time = limiter.reserve()
+            if time.time() + sleep_time >= deadline:
+                return
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+            urllib.request.urlopen(upstream_url, timeout=10).read()
+
+    pool = [threading.Thread(target=loop) for _ in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+
+def run_benchmark(workers, threads, duration, rate, capacity):
+    """运行压测，返回实测速率"""
+    server, arrivals = start_stub_upstream()
+    upstream_url = f"http://127.0.0.1:{server.server_address[1]}/api/package/searchPackage.json"
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='dxm_bench_'), 'rate_limiter.db')
+    bucket_name = f"bench-{os.getpid()}"
+
+    # 先建好令牌桶，避免worker同时建表
+    SharedRateLimiter(db_path, name=bucket_name, rate=rate, capacity=capacity)
+
+    deadline = time.time() + duration
+    processes = [
+        multiprocessing.Process(
+            target=worker_main,
+            args=(db_path, bucket_name, rate, capacity, upstream_url, threads, deadline)
+        )
+        for _ in range(workers)
+    ]
+
+    start = time.time()
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    server.shutdown()
+
+    arrivals.sort()
+    total = len(arrivals)
+    if total <= capacity:
+        return total, 0.0
+
+    # 去掉初始突发，统计稳态速率
+    steady = arrivals[int(capacity):]
+    span = max(steady[-1] - start, 1e-6)
+    return total, len(steady) / span
+
+
+def main():
+    parser = argparse.ArgumentParser(description="共享限流器压测")
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count() * 2 + 1,
+                        help="worker进程数（默认与gunicorn_config一致）")
+    parser.add_argument('--threads', type=int, default=2, help="每个worker的线程数")
+    parser.add_argument('--duration', type=float, default=10.0, help="压测时长（秒）")
+    parser.add_argument('--rate', type=float, default=8.0, help="全局速率（次/秒）")
+    parser.add_argument('--capacity', type=int, default=8, help="令牌桶容量")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("共享限流器压测")
+    print("=" * 60)
+    print(f"worker进程数: {args.workers}")
+    print(f"每个worker线程数: {args.threads}")
+    print(f"压测时长: {args.duration}秒")
+    print(f"目标速率: {args.rate}次/秒 (突发 {args.capacity})")
+
+    total, measured = run_benchmark(args.workers, args.threads, args.duration, args.rate, args.capacity)
+
+    print(f"\n桩服务器收到请求: {total}")
+    print(f"稳态速率: {measured:.2f}次/秒")
+
+    # 既不能超过预算，也不能因为锁竞争明显低于预算
+    ok = args.rate * 0.9 <= measured <= args.rate * 1.05
+    print(f"保持在{args.rate:g}次/秒: {'✓' if ok else '✗'}")
+    print("=" * 60)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -8,6 +8,9 @@
 - 自包含：所有逻辑都在这个文件内
 - 简单：只需调用 api_call() 函数
 - 自动重试：遇到速率限制自动重试
+- 批量调用：api_call_batch() 一次提交多个请求，结果完成一个返回一个
+- 异步任务：api_submit_job() 立即返回job_id，api_wait_job() 长轮询结果，适合排队时间很长的请求
+- 压缩传输：大请求体gzip压缩后发送，服务器按Accept-Encoding压缩响应（requests自动解压）
 - 完整错误处理：返回详细的错误信息
 
 使用方法：
@@ -28,6 +31,7 @@
 
 import time
 import json
+import gzip
 
 try:
     import requests
@@ -39,13 +43,59 @@ except ImportError:
 
 # ==================== 配置 ====================
 SERVER_URL = "http://47.104.72.198:5000/api/execute"
+BATCH_SERVER_URL = "http://47.104.72.198:5000/api/execute_batch"
+JOBS_SERVER_URL = "http://47.104.72.198:5000/api/jobs"
 MAX_RETRIES = 3  # 最大重试次数
 RETRY_DELAYS = [2, 4, 8]  # 重试延迟（秒），指数退避
+COMPRESS_REQUEST_MIN_SIZE = 2048  # 请求体达到这个字节数时gzip压缩后发送
+COMPRESS_LEVEL = 5  # gzip压缩级别
+DEADLINE_MARGIN = 0.5  # 告诉服务器的截止时间比timeout早这么多秒（留给网络传输），服务器不会处理客户端已经放弃的请求
+API_KEY = None  # 调用方标识（请求头 X-API-Key），服务器按它在调用方之间公平分配限流预算；None时按来源IP区分
 
 
 # ==================== 核心函数 ====================
 
-def api_call(url, headers=None, data=None, method='POST', params=None, timeout=30, verbose=False):
+def _post_json(url, payload, timeout, compress=True, stream=False, deadline=None):
+    """
+    向代理服务器发送JSON请求（大请求体gzip压缩，响应的gzip/zstd解压由requests自动完成）
+
+    参数：
+        deadline (float): 还愿意等待的秒数，通过 X-Request-Timeout 请求头告诉服务器（可选）
+
+    返回：
+        tuple: (requests.Response, 传输统计dict)
+    """
+    body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+    headers = {'Content-Type': 'application/json'}
+    if API_KEY:
+        headers['X-API-Key'] = API_KEY
+    if deadline is not None:
+        headers['X-Request-Timeout'] = f'{max(0.0, deadline):.3f}'
+    stats = {'request_bytes': len(body), 'request_sent': len(body)}
+    if compress and len(body) >= COMPRESS_REQUEST_MIN_SIZE:
+        body = gzip.compress(body, compresslevel=COMPRESS_LEVEL)
+        headers['Content-Encoding'] = 'gzip'
+        stats['request_sent'] = len(body)
+
+    started = time.time()
+    response = requests.post(url, data=body, headers=headers, stream=stream, timeout=timeout)
+    stats['elapsed'] = time.time() - started
+    return response, stats
+
+
+def _format_transfer(response, stats):
+    """verbose模式下的传输统计：请求/响应的传输字节数与原始字节数、节省的字节数、耗时"""
+    received = len(response.content)
+    encoding = response.headers.get('Content-Encoding')
+    wire = int(response.headers.get('Content-Length', received)) if encoding else received
+    saved = (stats['request_bytes'] - stats['request_sent']) + (received - wire)
+    return (f"[Client] 传输: 请求 {stats['request_sent']}/{stats['request_bytes']} 字节, "
+            f"响应 {wire}/{received} 字节 ({encoding or '未压缩'}), "
+            f"节省 {saved} 字节, 耗时 {stats['elapsed']:.3f}秒")
+
+
+def api_call(url, headers=None, data=None, method='POST', params=None, timeout=30, verbose=False, max_wait=None,
+             priority=None, cache=None, raw=False, select=None, compress=True, account=None, sticky=None):
     """
     统一的API调用函数 - 自动处理Cookie注入和速率限制
 
@@ -57,12 +107,25 @@ def api_call(url, headers=None, data=None, method='POST', params=None, timeout=3
         params (dict): GET请求的URL参数（可选）
         timeout (int): 请求超时时间（秒），默认30秒（可选）
         verbose (bool): 是否显示详细日志，默认False（可选）
+        max_wait (float): 服务器限流队列中最长等待秒数，超过时服务器返回429（可选）
+        priority (str): 优先级通道，'interactive'（默认，人工操作）或 'bulk'（批量任务）（可选）
+        cache (str): 服务器响应缓存控制，'bypass'（强制请求上游并刷新缓存）或 'invalidate'（可选）
+        raw (bool): 原样返回模式，服务器直接转发上游响应体，不做JSON解析和重新编码，
+            适合很大的列表页（可选）
+        select (str): 字段投影，服务器只返回选中的JSON字段，结构不变，
+            如 'data.page.list[].id,data.page.totalSize'（可选）
+        compress (bool): 请求体较大时gzip压缩后发送，默认True（可选）
+        account (str): 指定服务器使用的店小秘账号（config.COOKIE_ACCOUNTS 中的name），
+            默认由服务器选择负载最低的账号（可选）
+        sticky (str): sticky键，相同的键总是使用同一个账号，如店铺ID（可选）
 
     返回：
         dict: API响应，包含以下字段：
             - success (bool): 请求是否成功
             - response: 目标API返回的数据（成功时）
             - response_type (str): 响应类型，'json'或'text'（成功时）
+            - content (bytes): 上游原始响应体（raw=True时代替response，需要JSON时自行 json.loads）
+            - content_type (str): 上游的Content-Type（raw=True时）
             - status_code (int): HTTP状态码
             - error (str): 错误信息（失败时）
             - retries (int): 实际重试次数
@@ -121,6 +184,27 @@ def api_call(url, headers=None, data=None, method='POST', params=None, timeout=3
     if params:
         request_payload['params'] = params
 
+    if max_wait is not None:
+        request_payload['max_wait'] = max_wait
+
+    if priority:
+        request_payload['priority'] = priority
+
+    if cache:
+        request_payload['cache'] = cache
+
+    if raw:
+        request_payload['raw'] = True
+
+    if select:
+        request_payload['select'] = select
+
+    if account:
+        request_payload['account'] = account
+
+    if sticky:
+        request_payload['sticky'] = sticky
+
     # 重试逻辑
     retry_count = 0
     last_error = None
@@ -131,11 +215,28 @@ def api_call(url, headers=None, data=None, method='POST', params=None, timeout=3
                 print(f"[Client] 尝试 {attempt + 1}/{MAX_RETRIES + 1}: {method} {url}")
 
             # 发送请求到代理服务器
-            response = requests.post(
-                SERVER_URL,
-                json=request_payload,
-                timeout=timeout
-            )
+            response, transfer = _post_json(SERVER_URL, request_payload, timeout, compress=compress,
+                                            deadline=timeout - DEADLINE_MARGIN)
+            if verbose:
+                print(_format_transfer(response, transfer))
+
+            # 原样返回模式：响应体就是上游的原始数据，元数据在响应头中
+            if response.headers.get('X-Proxy-Raw') == '1':
+                if verbose:
+                    print(f"[Client] ✓ 请求成功: {response.status_code} ({len(response.content)} 字节)")
+                result = {
+                    'success': True,
+                    'status_code': response.status_code,
+                    'content': response.content,
+                    'content_type': response.headers.get('Content-Type'),
+                    'queue_wait': float(response.headers.get('X-Queue-Wait', 0)),
+                    'retries': retry_count
+                }
+                if 'X-Cache' in response.headers:
+                    result['cache'] = response.headers['X-Cache']
+                if response.headers.get('X-Coalesced') == '1':
+                    result['coalesced'] = True
+                return result
 
             # 解析响应
             try:
@@ -160,9 +261,11 @@ def api_call(url, headers=None, data=None, method='POST', params=None, timeout=3
             status_code = result.get('status_code', 500)
 
             if status_code == 429 and attempt < MAX_RETRIES:
-                # 速率限制，自动重试
+                # 速率限制，自动重试（优先使用服务器给出的Retry-After）
                 retry_count += 1
                 delay = RETRY_DELAYS[min(attempt, len(RETRY_DELAYS) - 1)]
+                if result.get('retry_after') is not None:
+                    delay = result['retry_after']
 
                 if verbose:
                     print(f"[Client] 速率限制，等待 {delay} 秒后重试...")
@@ -170,6 +273,18 @@ def api_call(url, headers=None, data=None, method='POST', params=None, timeout=3
                 time.sleep(delay)
                 continue
 
+            # 服务器在截止时间前没能处理（请求没有发往上游），与客户端超时一样重试
+            if result.get('deadline_exceeded') and attempt < MAX_RETRIES:
+                retry_count += 1
+                last_error = f'请求超时（超过{timeout}秒）'
+                delay = RETRY_DELAYS[min(attempt, len(RETRY_DELAYS) - 1)]
+
+                if verbose:
+                    print(f"[Client] 服务器排队超时，等待 {delay} 秒后重试...")
+
+                time.sleep(delay)
+                continue
+
             # 其他错误，不重试
             result['retries'] = retry_count
             return result
@@ -216,6 +331,185 @@ def api_call(url, headers=None, data=None, method='POST', params=None, timeout=3
     }
 
 
+def api_call_batch(requests_list, max_wait=None, timeout=60, verbose=False, priority=None):
+    """
+    批量API调用 - 一次提交多个请求，服务器每完成一个就立即返回一个结果
+
+    所有请求在服务器端经过同一个限流器，总耗时取决于限流速率，
+    而不是 往返时间 × 请求数。
+
+    参数：
+        requests_list (list): 请求列表，每个元素是dict，字段与 api_call 相同
+            （url, headers, data, method, params, priority, cache, select, account, sticky）
+        max_wait (float): 每个请求在服务器限流队列中最长等待秒数（可选）
+        priority (str): 优先级通道，服务器默认把批量请求放在 'bulk' 通道（可选）
+        timeout (int): 两个结果之间的最长等待时间（秒），默认60秒（可选）
+        verbose (bool): 是否显示详细日志，默认False（可选）
+
+    返回：
+        生成器，按完成顺序逐个产出结果dict，字段与 api_call 的返回值相同，
+        另外包含 index 字段表示对应 requests_list 中的位置。
+        无论成功失败，每个请求都会产出一个结果。
+
+    示例：
+        specs = [
+            {'url': 'https://www.dianxiaomi.com/api/package/searchPackage.json',
+             'data': {'pageNo': '1', 'searchType': 'orderId', 'content': order_id}}
+            for order_id in order_ids
+        ]
+        for result in api_call_batch(specs):
+            print(order_ids[result['index']], result['success'])
+    """
+    if not requests_list:
+        return
+
+    payload = {'requests': []}
+    for spec in requests_list:
+        item = {'url': spec.get('url'), 'method': spec.get('method', 'POST').upper()}
+        for key in ('headers', 'data', 'params', 'priority', 'cache', 'select', 'account', 'sticky'):
+            if spec.get(key):
+                item[key] = spec[key]
+        payload['requests'].append(item)
+
+    if max_wait is not None:
+        payload['max_wait'] = max_wait
+
+    if priority:
+        payload['priority'] = priority
+
+    pending = set(range(len(requests_list)))
+    start_time = time.time()
+
+    try:
+        if verbose:
+            print(f"[Client] 提交批量请求: {len(requests_list)} 个")
+
+        response, transfer = _post_json(BATCH_SERVER_URL, payload, timeout, stream=True)
+        if verbose:
+            print(f"[Client] 请求体 {transfer['request_sent']}/{transfer['request_bytes']} 字节, "
+                  f"响应编码: {response.headers.get('Content-Encoding') or '未压缩'}")
+
+        if response.status_code != 200:
+            try:
+                error = response.json().get('error')
+            except ValueError:
+                error = response.text[:200]
+            last_error = f'服务器拒绝批量请求: {error}'
+        else:
+            last_error = None
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                result = json.loads(line)
+                pending.discard(result.get('index'))
+                result.setdefault('retries', 0)
+
+                if verbose:
+                    done = len(requests_list) - len(pending)
+                    status = '✓' if result.get('success') else '✗'
+                    print(f"[Client] {status} [{done}/{len(requests_list)}] 序号 {result.get('index')} "
+                          f"({time.time() - start_time:.2f}秒)")
+
+                yield result
+
+            if pending:
+                last_error = '服务器提前结束了响应'
+
+    except requests.exceptions.Timeout:
+        last_error = f'请求超时（超过{timeout}秒未收到新结果）'
+    except requests.exceptions.ConnectionError:
+        last_error = f'连接错误: 无法连接到服务器 {BATCH_SERVER_URL}'
+    except requests.exceptions.RequestException as e:
+        last_error = f'请求错误: {str(e)}'
+    except ValueError as e:
+        last_error = f'服务器响应格式错误: {str(e)}'
+
+    # 未返回结果的请求统一报告失败
+    for index in sorted(pending):
+        yield {
+            'index': index,
+            'success': False,
+            'error': last_error or '请求失败',
+            'retries': 0
+        }
+
+
+def api_submit_job(url, headers=None, data=None, method='POST', params=None, priority=None, cache=None,
+                   timeout=30, select=None, account=None, sticky=None):
+    """
+    提交异步任务 - 服务器把请求保存到任务队列后立即返回，不在HTTP连接上等待限流
+
+    参数：
+        与 api_call 相同（url, headers, data, method, params, priority, cache, select, account, sticky）
+        timeout (int): 提交请求的超时时间（秒）
+
+    返回：
+        dict: {'success': True, 'job_id': ..., 'status': 'queued'}，失败时 {'success': False, 'error': ...}
+    """
+    payload = {'url': url, 'method': method.upper()}
+    for key, value in (('headers', headers), ('data', data), ('params', params),
+                       ('priority', priority), ('cache', cache), ('select', select),
+                       ('account', account), ('sticky', sticky)):
+        if value:
+            payload[key] = value
+
+    try:
+        response, _ = _post_json(JOBS_SERVER_URL, payload, timeout)
+        result = response.json()
+    except requests.exceptions.RequestException as e:
+        return {'success': False, 'error': f'请求错误: {str(e)}'}
+    except ValueError:
+        return {'success': False, 'error': f'服务器响应格式错误: {response.text[:200]}'}
+
+    if response.status_code != 202:
+        result.setdefault('success', False)
+        result.setdefault('status_code', response.status_code)
+    return result
+
+
+def api_wait_job(job_id, timeout=600, poll_wait=20, verbose=False):
+    """
+    等待异步任务完成（长轮询，服务器在任务完成时立即返回）
+
+    参数：
+        job_id (str): api_submit_job 返回的任务ID
+        timeout (int): 最长等待时间（秒），默认600秒
+        poll_wait (int): 每次长轮询让服务器最多等待的秒数
+        verbose (bool): 是否显示详细日志
+
+    返回：
+        dict: 任务完成时返回与 api_call 相同格式的结果；超时或出错时 {'success': False, 'error': ...}
+    """
+    deadline = time.time() + timeout
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return {'success': False, 'error': f'等待任务超时（超过{timeout}秒）', 'job_id': job_id}
+
+        wait = min(poll_wait, max(1, int(remaining)))
+        try:
+            response = requests.get(f"{JOBS_SERVER_URL}/{job_id}", params={'wait': wait}, timeout=wait + 10)
+            job = response.json()
+        except requests.exceptions.RequestException as e:
+            if verbose:
+                print(f"[Client] 查询任务失败，稍后重试: {e}")
+            time.sleep(1)
+            continue
+        except ValueError:
+            return {'success': False, 'error': f'服务器响应格式错误: {response.text[:200]}', 'job_id': job_id}
+
+        if response.status_code != 200:
+            return {'success': False, 'error': job.get('error', '查询任务失败'), 'job_id': job_id}
+
+        if verbose:
+            print(f"[Client] 任务 {job_id}: {job['status']}")
+
+        if job['status'] == 'done':
+            result = job['result'] or {'success': False, 'error': '任务没有结果'}
+            result['job_id'] = job_id
+            return result
+
+
 # ==================== 便捷函数 ====================
 
 def post(url, headers=None, data=None, **kwargs):
@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP压缩 - client_api 与代理服务器之间的响应压缩和请求解压
+
+代理服务器和客户端之间走公网，pageList.htm 的HTML片段和 list.json 的整页JSON都很大，
+文本内容压缩后通常只剩 1/5 ~ 1/10。
+
+- 响应: 按请求头 Accept-Encoding 协商，优先 zstd（安装了 zstandard 时），其次 gzip；
+  小于 COMPRESSION_MIN_SIZE 的响应和非文本内容不压缩
+- NDJSON流（/api/execute_batch）: gzip流式压缩，每一行立即flush，客户端仍然能逐行读取
+- 请求: 客户端可以发送 Content-Encoding: gzip / zstd 的请求体，服务器在解析JSON前解压，
+  解压后的大小受 COMPRESSION_MAX_REQUEST_SIZE 限制
+"""
+import io
+import json
+import zlib
+import gzip
+
+import config
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def supported_encodings():
+    """当前环境支持的编码，按优先级排列"""
+    return ('zstd', 'gzip') if zstandard is not None else ('gzip',)
+
+
+def _accepted(accept_encoding):
+    """解析 Accept-Encoding，返回客户端接受的编码集合（q=0 的不算）"""
+    accepted = set()
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.partition(';')
+        params = params.strip().replace(' ', '')
+        try:
+            quality = float(params[2:]) if params.startswith('q=') else 1.0
+        except ValueError:
+            quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def choose_encoding(accept_encoding, streaming=False):
+    """
+    根据 Accept-Encoding 选择响应编码
+
+    Args:
+        accept_encoding: 请求头 Accept-Encoding 的值
+        streaming: 流式响应（只使用支持逐块flush的gzip）
+
+    Returns:
+        str 或 None: 'zstd' / 'gzip'，客户端不支持时返回None
+    """
+    accepted = _accepted(accept_encoding)
+    for encoding in (('gzip',) if streaming else supported_encodings()):
+        if encoding in accepted:
+            return encoding
+    return None
+
+
+def should_compress(content_type, size=None):
+    """
+    响应是否值得压缩
+
+    Args:
+        content_type: 响应的Content-Type
+        size: 响应体字节数，None表示流式响应（大小未知）
+    """
+    if not config.COMPRESSION_ENABLED:
+        return False
+    if size is not None and size < config.COMPRESSION_MIN_SIZE:
+        return False
+    content_type = (content_type or '').lower()
+    return any(content_type.startswith(prefix) for prefix in config.COMPRESSION_TYPES)
+
+
+def compress(data, encoding):
+    """按编码压缩bytes"""
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=config.COMPRESSION_ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=config.COMPRESSION_GZIP_LEVEL)
+
+
+def decompress(data, encoding, max_size=None):
+    """
+    解压请求体
+
+    Args:
+        data: 压缩的bytes
+        encoding: Content-Encoding（gzip / zstd / identity）
+        max_size: 解压后的最大字节数，默认 config.COMPRESSION_MAX_REQUEST_SIZE
+
+    Returns:
+        bytes
+
+    Raises:
+        ValueError: 不支持的编码、数据损坏或解压后超过上限
+    """
+    max_size = config.COMPRESSION_MAX_REQUEST_SIZE if max_size is None else max_size
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return data
+
+    try:
+        if encoding in ('gzip', 'x-gzip'):
+            decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            result = decoder.decompress(data, max_size + 1)
+        elif encoding == 'zstd' and zstandard is not None:
+            reader = zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data))
+            result = reader.read(max_size + 1)
+        else:
+            raise ValueError(f"不支持的Content-Encoding: {encoding}")
+    except (zlib.error, getattr(zstandard, 'ZstdError', zlib.error)) as e:
+        raise ValueError(f"请求体解压失败: {e}")
+
+    if len(result) > max_size:
+        raise ValueError(f"解压后的请求体超过上限 ({max_size} 字节)")
+    return result
+
+
+class GzipStream:
+    """流式gzip压缩器（每块压缩后立即flush，接收方可以逐块解压）"""
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(config.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, chunk):
+        """压缩一块数据（str按UTF-8编码）"""
+        if isinstance(chunk, str):
+            chunk = chunk.encode('utf-8')
+        return self._compressor.compress(chunk) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        """结束压缩流，返回gzip尾部"""
+        return self._compressor.flush()
+
+
+def gzip_stream(chunks):
+    """
+    把产出 str / bytes 的可迭代对象（Flask流式响应）转换为gzip流
+
+    Yields:
+        bytes
+    """
+    stream = GzipStream()
+    try:
+        for chunk in chunks:
+            data = stream.compress(chunk)
+            if data:
+                yield data
+        yield stream.finish()
+    finally:
+        close = getattr(chunks, 'close', None)
+        if close is not None:
+            close()
+
+
+class DecompressRequestMiddleware:
+    """WSGI中间件: 解压 Content-Encoding 为 gzip / zstd 的请求体（Flask在解析JSON前看到的是原文）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    def __call__(self, environ, start_response):
+        encoding = environ.get('HTTP_CONTENT_ENCODING')
+        if not encoding or encoding.strip().lower() == 'identity':
+            return self.app(environ, start_response)
+
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        try:
+            body = decompress(environ['wsgi.input'].read(length) if length else b'', encoding)
+        except ValueError as e:
+            start_response('400 BAD REQUEST', [('Content-Type', 'application/json')])
+            return [json.dumps({"success": False, "error": str(e)}, ensure_ascii=False).encode('utf-8')]
+
+        environ['wsgi.input'] = io.BytesIO(body)
+        environ['CONTENT_LENGTH'] = str(len(body))
+        del environ['HTTP_CONTENT_ENCODING']
+        return self.app(environ, start_response)
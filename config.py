@@ -16,6 +16,29 @@ LOCAL_COOKIE_PATH = os.path.join(COOKIE_CACHE_DIR, "dxm_cookie.json")
 # Cookie缓存时间（分钟），超过这个时间会重新下载
 COOKIE_CACHE_MINUTES = 30
 
+# 内存中Cookie的最长保留时间（秒），到期后即使文件未变化也重新解析
+COOKIE_STORE_TTL = 300
+
+# 检查Cookie文件是否变化的最小间隔（秒）
+COOKIE_STORE_CHECK_INTERVAL = 1.0
+
+# 多账号Cookie池: 每个账号一份Cookie和独立的限流预算，吞吐量随账号数线性增长
+# 格式: [{"name": "账号名", "cookie_url": "Cookie文件URL", "rate": 初始速率(可选)}, ...]
+# 为空时只使用上面的 COOKIE_URL（账号名 'default'）
+COOKIE_ACCOUNTS = []
+
+# Cookie获取失败的账号暂停路由的时间（秒），之后重新尝试
+COOKIE_ACCOUNT_RETRY_INTERVAL = 60
+
+# 后台刷新Cookie: 服务启动后由后台线程在Cookie过期前重新下载，请求不再等待下载
+COOKIE_BACKGROUND_REFRESH = True
+
+# 提前多少分钟刷新（Cookie文件年龄超过 COOKIE_CACHE_MINUTES - 该值 时开始下载）
+COOKIE_REFRESH_AHEAD_MINUTES = 5
+
+# 后台线程检查Cookie年龄的间隔（秒），下载失败后也按这个间隔重试
+COOKIE_REFRESH_CHECK_INTERVAL = 30
+
 # ==================== HTTP配置 ====================
 # 下载超时时间（秒）
 DOWNLOAD_TIMEOUT = 30
@@ -26,6 +49,164 @@ RETRY_TIMES = 3
 # 重试延迟（秒）
 RETRY_DELAY = 2
 
+# ==================== 限流配置 ====================
+# 限流后端: 'local' 每个进程独立限流, 'sqlite' 所有gunicorn worker共享一个令牌桶
+RATE_LIMIT_BACKEND = "sqlite"
+
+# 每秒生成的令牌数（全局速率）
+RATE_LIMIT_RATE = 8.0
+
+# 令牌桶容量（允许的突发请求数）
+RATE_LIMIT_CAPACITY = 8
+
+# 请求在限流队列中最长等待时间（秒），超过则直接返回429和Retry-After；None表示一直等待
+RATE_LIMIT_MAX_WAIT = None
+
+# 优先级通道，按优先级从高到低排列（请求中用 priority 字段或 X-Priority 请求头指定）
+PRIORITY_LANES = ["interactive", "bulk"]
+
+# 单个请求未指定优先级时使用的通道
+PRIORITY_DEFAULT = "interactive"
+
+# 批量接口 /api/execute_batch 未指定优先级时使用的通道
+PRIORITY_BATCH_DEFAULT = "bulk"
+
+# 低优先级通道只领取这么多秒内可用的令牌，不提前占位，让高优先级请求可以插队
+PRIORITY_LOW_HORIZON = 0.05
+
+# 低优先级通道领不到令牌时，两次尝试之间的最长间隔（秒）
+PRIORITY_POLL_INTERVAL = 0.25
+
+# 自适应限流（AIMD）: 上游返回"系统繁忙"时按比例降低速率，持续正常时逐步提高
+ADAPTIVE_RATE_ENABLED = True
+
+# 自适应速率的下限和上限（次/秒），初始速率为 RATE_LIMIT_RATE
+# 上限为None时等于配置的速率（RATE_LIMIT_RATE，多账号时为账号的 rate），不会超过对外承诺的速率
+ADAPTIVE_RATE_FLOOR = 2.0
+ADAPTIVE_RATE_CEILING = None
+
+# 遇到繁忙响应时速率乘以这个系数
+ADAPTIVE_RATE_DECREASE_FACTOR = 0.7
+
+# 两次降速之间的最短间隔（秒），同一波繁忙响应只降一次
+ADAPTIVE_RATE_DECREASE_COOLDOWN = 2.0
+
+# 每次提速增加的速率（次/秒）
+ADAPTIVE_RATE_INCREASE_STEP = 0.5
+
+# 连续这么多秒没有繁忙响应才提速一次
+ADAPTIVE_RATE_INCREASE_INTERVAL = 10.0
+
+# 运行时数据目录（限流器数据库等）
+RUNTIME_DIR = os.path.join(os.path.dirname(__file__), "runtime")
+
+# 共享令牌桶的SQLite文件路径（所有worker必须指向同一个文件）
+RATE_LIMIT_DB_PATH = os.path.join(RUNTIME_DIR, "rate_limiter.db")
+
+# ==================== 请求代价配置 ====================
+# 每个请求消耗的令牌数: {"pattern": URL路径正则, "cost": 令牌数,
+#                       "field": 按哪个请求参数计费（可选）, "per": 每多少条记录消耗 cost 个令牌,
+#                       "family": 端点族（可选，见 RATE_LIMIT_FAMILIES）}
+# 按顺序匹配第一条；例如 pageSize=300 的 list.json 消耗 3 个令牌
+REQUEST_COST_RULES = [
+    {"pattern": r"/api/package/list\.json$", "cost": 1, "field": "pageSize", "per": 100, "family": "list"},
+    {"pattern": r"/dxmCommodityProduct/pageList\.htm$", "cost": 1, "field": "pageSize", "per": 100, "family": "list"},
+    {"pattern": r"/alibabaPairProduct/pageList\.htm$", "cost": 1, "field": "pageSize", "per": 100, "family": "list"},
+]
+
+# 不匹配任何规则的请求消耗的令牌数
+REQUEST_COST_DEFAULT = 1
+
+# 单个请求最多消耗的令牌数（不超过令牌桶容量，避免一个请求要等很久才攒够令牌）
+REQUEST_COST_MAX = 8
+
+# 端点族的子预算: {"端点族": {"rate": 每秒令牌数, "capacity": 突发容量}}
+# 每个账号每个端点族一个独立的令牌桶（名为 <账号令牌桶>:<端点族>），请求同时从账号令牌桶和子令牌桶领取令牌；
+# 例如 {"list": {"rate": 4.0, "capacity": 4}} 让大分页扫描最多用掉一半预算，小请求不会被饿死；
+# 代价超过子令牌桶容量的请求按容量计（上例中 pageSize=500 的请求消耗4个令牌）
+RATE_LIMIT_FAMILIES = {}
+
+# ==================== 客户端公平排队配置 ====================
+# 按客户端加权公平排队: 一个调用方连续发请求时不会占满整个限流预算
+# 只在同一个进程内生效: async_server.py 完整生效；gunicorn多worker的 server.py 下基本不起作用，
+# 进行中请求上限也按worker单独计数（见 fair_queue.py）
+FAIR_QUEUE_ENABLED = True
+
+# 识别客户端的请求头，没有这个请求头时按来源IP识别
+FAIR_CLIENT_HEADER = "X-API-Key"
+
+# 客户端配置: {"API Key 或 IP": {"name": "统计中显示的名字", "weight": 权重, "max_in_flight": 进行中请求上限}}
+FAIR_CLIENTS = {}
+
+# 未配置的客户端的权重
+FAIR_DEFAULT_WEIGHT = 1.0
+
+# 未配置的客户端同时进行中的请求数上限（每个进程单独计数），None表示不限制
+FAIR_DEFAULT_MAX_IN_FLIGHT = None
+
+# 每个进程最多记录的客户端数，超过时清理最久未出现的空闲客户端
+FAIR_MAX_TRACKED_CLIENTS = 1000
+
+# ==================== 上游请求配置 ====================
+# 转发到店小秘的请求超时时间（秒）
+UPSTREAM_TIMEOUT = 30
+
+# 连接池缓存的主机数
+HTTP_POOL_CONNECTIONS = 4
+
+# 每个主机保持的最大keep-alive连接数
+HTTP_POOL_MAXSIZE = 10
+
+# worker启动时预先建立连接的地址（空列表表示不预热）
+HTTP_WARMUP_URLS = ["https://www.dianxiaomi.com/"]
+
+# 每个预热地址建立的连接数（建议与gunicorn每个worker的线程数一致，0表示不预热）
+HTTP_WARMUP_CONNECTIONS = 2
+
+# 调用方的截止时间请求头: 调用方还愿意等待的秒数（相对时间，不受两端时钟偏差影响）
+# 超过截止时间的请求在领令牌前直接丢弃(504)，上游请求的超时时间也不超过剩余时间
+DEADLINE_HEADER = "X-Request-Timeout"
+
+# 剩余时间少于这个秒数时不再发往上游（响应来不及在截止时间前返回）
+DEADLINE_MIN_UPSTREAM_TIME = 0.2
+
+# ==================== 响应缓存配置 ====================
+# 是否缓存店小秘只读接口的响应（每个worker进程一份内存缓存）
+RESPONSE_CACHE_ENABLED = False
+
+# 缓存规则: (URL路径正则, 缓存秒数)，按顺序匹配第一条，不匹配的URL不缓存
+RESPONSE_CACHE_RULES = [
+    (r"/api/package/searchPackage\.json$", 60),
+    (r"/api/package/list\.json$", 60),
+    (r"/package/searchPackage\.htm$", 60),
+    (r"/dxmCommodityProduct/pageList\.htm$", 300),
+    (r"/alibabaPairProduct/pageList\.htm$", 300),
+    (r"/providerAuth/getList\.htm$", 600),
+]
+
+# 永远不缓存的写接口（优先于上面的规则）
+RESPONSE_CACHE_NEVER = [
+    r"/batch[A-Z]\w*\.(json|htm)$",
+    r"/(add|update|save|set|commit|submit|upload|delete|remove)[A-Z]?\w*\.(json|htm)$",
+    r"/excel/",
+]
+
+# 最大缓存条目数
+RESPONSE_CACHE_MAX_ENTRIES = 2000
+
+# 缓存响应体的最大总字节数
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# 缓存失效记录的SQLite文件路径（所有worker共用，一个worker清除缓存时其他worker同步清除）
+# None表示失效只影响收到请求的worker
+RESPONSE_CACHE_DB_PATH = os.path.join(RUNTIME_DIR, "response_cache.db")
+
+# 是否合并同时进行中的相同只读请求（只发一次上游请求，所有调用方共享结果）
+SINGLE_FLIGHT_ENABLED = True
+
+# 上游返回这些关键词时说明请求没有真正执行（繁忙/限流），不缓存、触发降速（api_service 的重试也使用这个列表）
+UPSTREAM_BUSY_KEYWORDS = ["系统繁忙", "请稍后重试"]
+
 # ==================== API服务器配置 ====================
 # API服务器地址
 API_HOST = "0.0.0.0"
@@ -36,6 +217,87 @@ API_PORT = 5000
 # 是否开启调试模式
 DEBUG = True
 
+# 批量接口单次最多包含的请求数
+BATCH_MAX_REQUESTS = 1000
+
+# 批量接口的并发执行线程数（每个worker进程），实际速率仍受限流器控制
+BATCH_CONCURRENCY = 16
+
+# 字段投影（select）单个请求最多包含的字段路径数
+SELECT_MAX_PATHS = 50
+
+# ==================== 响应压缩配置 ====================
+# 是否按客户端的 Accept-Encoding 压缩响应（zstd需要安装 zstandard，否则使用gzip）
+COMPRESSION_ENABLED = True
+
+# 小于这个字节数的响应不压缩（压缩收益抵不过CPU开销）
+COMPRESSION_MIN_SIZE = 1024
+
+# 只压缩这些Content-Type（前缀匹配）
+COMPRESSION_TYPES = ("application/json", "application/x-ndjson", "text/", "application/javascript")
+
+# 压缩级别（gzip 1-9，zstd 1-22）
+COMPRESSION_GZIP_LEVEL = 5
+COMPRESSION_ZSTD_LEVEL = 3
+
+# 压缩请求体解压后的最大字节数（防止压缩炸弹）
+COMPRESSION_MAX_REQUEST_SIZE = 64 * 1024 * 1024
+
+# ==================== 异步任务配置 (/api/jobs) ====================
+# 任务队列的SQLite文件路径（所有worker共用，重启后排队中的任务继续执行）
+JOB_DB_PATH = os.path.join(RUNTIME_DIR, "jobs.db")
+
+# 每个worker进程执行任务的线程数
+JOB_DISPATCHERS = 2
+
+# 队列为空时检查新任务的间隔（秒）
+JOB_POLL_INTERVAL = 0.5
+
+# 排队中任务数上限，超过时提交返回429
+JOB_MAX_QUEUED = 100000
+
+# 已完成任务的结果保留时间（秒）
+JOB_RESULT_TTL = 24 * 3600
+
+# GET /api/jobs/<id>?wait=N 长轮询的最长等待时间（秒，async_server.py）
+JOB_MAX_LONG_POLL = 25
+
+# Flask服务器（server.py）长轮询的最长等待时间（秒）: 长轮询在请求线程中等待，
+# gthread每个worker只有几个线程，等待时间长了会占满线程、堵住所有接口
+JOB_MAX_LONG_POLL_THREADED = 2
+
+# 执行任务的进程写心跳的间隔（秒）
+JOB_HEARTBEAT_INTERVAL = 10
+
+# 超过这么多秒没有心跳的进程视为已退出，它名下 running 的任务被回收
+JOB_WORKER_TIMEOUT = 60
+
+# 长轮询检查任务状态的间隔（秒）
+JOB_LONG_POLL_INTERVAL = 0.2
+
+# ==================== 异步服务器配置 (async_server.py) ====================
+# 异步服务器端口（与Flask服务器并存时使用不同端口）
+ASYNC_API_PORT = 5001
+
+# 请求队列最大长度，队列满时直接返回429
+ASYNC_MAX_QUEUE_SIZE = 10000
+
+# 从队列取请求并转发到上游的调度协程数（即最大上游并发数）
+ASYNC_DISPATCHERS = 32
+
+# 上游HTTP连接池大小
+ASYNC_POOL_SIZE = 32
+
+# ==================== 监控指标配置 (/metrics) ====================
+# 各worker指标快照的目录（同一个服务的所有worker共用）
+METRICS_DIR = os.path.join(RUNTIME_DIR, "metrics")
+
+# worker写指标快照的间隔（秒），/metrics 中其他worker的数据最多延迟这么久
+METRICS_FLUSH_INTERVAL = 5
+
+# 按接口路径统计时最多记录的不同路径数，超过的归为 'other'
+METRICS_MAX_PATHS = 200
+
 # ==================== 日志配置 ====================
 # 日志目录
 LOG_DIR = os.path.join(os.path.dirname(__file__), "logs")
@@ -1,25 +1,35 @@
 """
 Cookie管理器 - 自动下载、缓存和刷新Cookie
+
+start_refresher() 之后由后台线程在过期前刷新Cookie，get_cookie_path() 直接返回已有的文件
+（即使已经过期，也先用上一次的有效Cookie），只有本地还没有可用Cookie时才阻塞下载。
 """
 import os
-import json
 import time
 import requests
 from datetime import datetime, timedelta
 import config
+import metrics
+from cookie_store import CookieRefresher, get_cookie_store, write_cookie_file
 
 
 class CookieManager:
     """Cookie管理器类"""
 
-    def __init__(self):
-        self.cookie_url = config.COOKIE_URL
-        self.local_path = config.LOCAL_COOKIE_PATH
-        self.cache_dir = config.COOKIE_CACHE_DIR
+    def __init__(self, cookie_url=None, local_path=None):
+        """
+        Args:
+            cookie_url: Cookie文件的远程URL，默认 config.COOKIE_URL
+            local_path: 本地Cookie文件路径，默认 config.LOCAL_COOKIE_PATH
+        """
+        self.cookie_url = cookie_url or config.COOKIE_URL
+        self.local_path = local_path or config.LOCAL_COOKIE_PATH
+        self.cache_dir = os.path.dirname(self.local_path)
         self.cache_minutes = config.COOKIE_CACHE_MINUTES
         self.timeout = config.DOWNLOAD_TIMEOUT
         self.retry_times = config.RETRY_TIMES
         self.retry_delay = config.RETRY_DELAY
+        self.refresher = CookieRefresher(self.local_path, self._download_cookie, self.cache_minutes * 60)
 
         # 确保缓存目录存在
         self._ensure_cache_dir()
@@ -45,15 +55,9 @@ class CookieManager:
             print(f"[CookieManager] Cookie缓存已过期 (超过{self.cache_minutes}分钟)")
             return False
 
-        # 检查文件是否为空或格式错误
-        try:
-            with open(self.local_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                if 'cookies' not in data or not data['cookies']:
-                    print("[CookieManager] Cookie文件格式错误")
-                    return False
-        except Exception as e:
-            print(f"[CookieManager] Cookie文件读取失败: {e}")
+        # 检查文件是否为空或格式错误（使用内存缓存，文件未变化时不重复解析）
+        if not get_cookie_store(self.local_path).is_valid():
+            print("[CookieManager] Cookie文件读取失败或格式错误")
             return False
 
         return True
@@ -73,12 +77,13 @@ class CookieManager:
                 if 'cookies' not in cookie_data:
                     raise ValueError("Cookie数据格式错误：缺少'cookies'字段")
 
-                # 保存到本地
-                with open(self.local_path, 'w', encoding='utf-8') as f:
-                    json.dump(cookie_data, f, ensure_ascii=False, indent=2)
+                # 保存到本地（原子替换，读取方不会看到写了一半的文件）
+                write_cookie_file(self.local_path, cookie_data)
+                get_cookie_store(self.local_path).invalidate()
 
                 print(f"[CookieManager] ✓ Cookie下载成功，已保存到: {self.local_path}")
                 print(f"[CookieManager] ✓ 包含 {len(cookie_data['cookies'])} 个cookies")
+                metrics.inc('dxm_cookie_downloads_total', {'result': 'success'})
                 return True
 
             except requests.exceptions.RequestException as e:
@@ -88,9 +93,11 @@ class CookieManager:
                     time.sleep(self.retry_delay)
             except Exception as e:
                 print(f"[CookieManager] ✗ 下载失败: {e}")
+                metrics.inc('dxm_cookie_downloads_total', {'result': 'failure'})
                 return False
 
         print(f"[CookieManager] ✗ Cookie下载失败，已重试 {self.retry_times} 次")
+        metrics.inc('dxm_cookie_downloads_total', {'result': 'failure'})
         return False
 
     def get_cookie_path(self, force_refresh=False):
@@ -103,9 +110,15 @@ class CookieManager:
         Returns:
             str: 本地Cookie文件路径，如果获取失败返回None
         """
-        # 如果强制刷新或缓存无效，则下载
+        # 后台刷新已启动: 有可用的Cookie就直接返回，过期时唤醒后台线程下载
+        if not force_refresh and self.refresher.running and get_cookie_store(self.local_path).is_valid():
+            if self.refresher.needs_refresh():
+                self.refresher.trigger()
+            return self.local_path
+
+        # 如果强制刷新或缓存无效，则下载（多个线程同时到达时只下载一次）
         if force_refresh or not self._is_cache_valid():
-            if not self._download_cookie():
+            if not self.refresher.refresh(force=force_refresh):
                 # 如果下载失败，检查是否有旧的缓存可用
                 if os.path.exists(self.local_path):
                     print("[CookieManager] ⚠️  使用旧的Cookie缓存")
@@ -122,6 +135,14 @@ class CookieManager:
         """手动刷新Cookie"""
         return self.get_cookie_path(force_refresh=True)
 
+    def start_refresher(self):
+        """启动后台刷新线程（config.COOKIE_BACKGROUND_REFRESH 为False时不启动）"""
+        if not config.COOKIE_BACKGROUND_REFRESH or self.refresher.running:
+            return
+        self.refresher.start()
+        print(f"[CookieManager] ✓ 后台刷新已启动: {self.local_path} "
+              f"(过期前 {config.COOKIE_REFRESH_AHEAD_MINUTES} 分钟刷新)")
+
 
 # 创建全局实例
 _cookie_manager = CookieManager()
@@ -157,9 +178,8 @@ if __name__ == "__main__":
         print(f"\n✓ 成功获取Cookie路径: {cookie_path}")
 
         # 读取并显示Cookie信息
-        with open(cookie_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            print(f"✓ Cookie数量: {len(data['cookies'])}")
+        cookies = get_cookie_store(cookie_path).get_cookies_dict()
+        print(f"✓ Cookie数量: {len(cookies)}")
     else:
         print("\n✗ 获取Cookie失败")
 
@@ -0,0 +1,289 @@
+"""
+Cookie内存缓存 - 解析一次Cookie文件，在内存中保存Cookie字典和Cookie请求头
+
+热路径上只做一次 os.stat（并且每 check_interval 秒最多一次），
+文件的 inode / mtime / size 变化或超过TTL时才重新读取和解析JSON。
+同一个文件路径在进程内只有一个 CookieStore 实例，server.py、api_service.py、
+cookie_manager.py 共用。
+
+Cookie文件通过 write_cookie_file 原子替换（临时文件 + os.replace），
+CookieRefresher 在后台线程中于过期前重新下载，请求路径上只读取已有的文件。
+"""
+import os
+import json
+import time
+import tempfile
+import threading
+
+import config
+import metrics
+
+
+class CookieStore:
+    """单个Cookie文件的内存缓存"""
+
+    def __init__(self, path, ttl=None, check_interval=None):
+        """
+        Args:
+            path: Cookie JSON文件路径
+            ttl: 缓存最长保留时间（秒），到期后即使文件未变化也重新解析
+            check_interval: 两次检查文件状态的最小间隔（秒）
+        """
+        self.path = path
+        self.ttl = config.COOKIE_STORE_TTL if ttl is None else ttl
+        self.check_interval = config.COOKIE_STORE_CHECK_INTERVAL if check_interval is None else check_interval
+        self.reloads = 0
+        self._lock = threading.Lock()
+        self._signature = None
+        self._loaded_at = 0.0
+        self._checked_at = 0.0
+        self._cookies = None
+        self._header = None
+
+    def _stat_signature(self):
+        """文件签名 (inode, mtime, size)，任一变化都说明文件被替换或改写"""
+        st = os.stat(self.path)
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _is_fresh(self, now):
+        """内存中的数据是否仍然可用（调用方持有锁）"""
+        if self._cookies is None:
+            return False
+        if now - self._loaded_at > self.ttl:
+            return False
+        if now - self._checked_at < self.check_interval:
+            return True
+
+        self._checked_at = now
+        try:
+            return self._stat_signature() == self._signature
+        except OSError:
+            # 文件暂时不存在（例如正在被替换），继续使用内存中的数据
+            return True
+
+    def _load(self, now):
+        """读取并解析Cookie文件（调用方持有锁）"""
+        signature = self._stat_signature()
+        with open(self.path, 'r', encoding='utf-8') as f:
+            cookie_data = json.load(f)
+
+        if not isinstance(cookie_data.get('cookies'), list) or not cookie_data['cookies']:
+            raise ValueError("Cookie数据格式错误：缺少'cookies'字段")
+
+        cookies = {}
+        for cookie in cookie_data['cookies']:
+            if 'name' in cookie and 'value' in cookie:
+                cookies[cookie['name']] = cookie['value']
+
+        self._cookies = cookies
+        self._header = '; '.join([f"{k}={v}" for k, v in cookies.items()])
+        self._signature = signature
+        self._loaded_at = now
+        self._checked_at = now
+        self.reloads += 1
+        metrics.inc('dxm_cookie_reloads_total')
+
+    def _ensure_loaded(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._is_fresh(now):
+                return
+            try:
+                self._load(now)
+            except (OSError, ValueError):
+                if self._cookies is None:
+                    raise
+                # 文件可能正在被改写，先继续使用上一次的有效数据，稍后重试
+                self._checked_at = now
+
+    def get_cookies_dict(self):
+        """
+        获取Cookies字典（共享对象，调用方不要修改）
+
+        Raises:
+            OSError / ValueError: 文件不存在或格式错误
+        """
+        self._ensure_loaded()
+        return self._cookies
+
+    def get_cookie_header(self):
+        """
+        获取 'name=value; name2=value2' 格式的Cookie请求头
+
+        Raises:
+            OSError / ValueError: 文件不存在或格式错误
+        """
+        self._ensure_loaded()
+        return self._header
+
+    def is_valid(self):
+        """Cookie文件是否存在且格式正确"""
+        try:
+            self._ensure_loaded()
+            return True
+        except Exception:
+            return False
+
+    def invalidate(self):
+        """丢弃内存中的数据，下次访问时重新读取文件"""
+        with self._lock:
+            self._cookies = None
+            self._header = None
+            self._signature = None
+
+
+def write_cookie_file(path, cookie_data):
+    """
+    原子写入Cookie文件: 先写同目录下的临时文件，再 os.replace 替换
+    （读取方看到的要么是旧文件，要么是完整的新文件）
+
+    Args:
+        path: Cookie JSON文件路径
+        cookie_data: 下载得到的Cookie数据
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path) + '.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(cookie_data, f, ensure_ascii=False, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class CookieRefresher:
+    """
+    Cookie刷新器 - 同一时间只有一个线程下载，后台线程在过期前主动刷新
+
+    - refresh(): 阻塞下载；多个线程同时调用时只有第一个真正下载，其余等待并共用它的结果
+    - start(): 启动后台线程，文件年龄超过 max_age - refresh_ahead 时重新下载，
+      下载失败时继续使用旧文件，check_interval 秒后重试
+    """
+
+    def __init__(self, path, download, max_age, refresh_ahead=None, check_interval=None):
+        """
+        Args:
+            path: Cookie JSON文件路径
+            download: 函数 download() -> bool，下载并写入Cookie文件
+            max_age: Cookie文件的有效期（秒）
+            refresh_ahead: 提前刷新的秒数，默认 config.COOKIE_REFRESH_AHEAD_MINUTES
+            check_interval: 后台线程检查间隔（秒），默认 config.COOKIE_REFRESH_CHECK_INTERVAL
+        """
+        self.path = path
+        self.download = download
+        self.max_age = max_age
+        self.refresh_ahead = config.COOKIE_REFRESH_AHEAD_MINUTES * 60 if refresh_ahead is None else refresh_ahead
+        self.check_interval = config.COOKIE_REFRESH_CHECK_INTERVAL if check_interval is None else check_interval
+        self.refreshes = 0
+        self.failures = 0
+        self._attempts = 0
+        self._last_ok = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        """后台线程是否已启动"""
+        return self._thread is not None
+
+    def age(self):
+        """Cookie文件的年龄（秒），文件不存在时返回None"""
+        try:
+            return max(0.0, time.time() - os.path.getmtime(self.path))
+        except OSError:
+            return None
+
+    def needs_refresh(self):
+        """文件不存在、格式错误或即将过期"""
+        age = self.age()
+        if age is None or age >= self.max_age - self.refresh_ahead:
+            return True
+        return not get_cookie_store(self.path).is_valid()
+
+    def refresh(self, force=False):
+        """
+        下载Cookie（同一时间只有一个线程下载）
+
+        Args:
+            force: 即使文件仍然有效也重新下载
+
+        Returns:
+            bool: 下载成功，或等待期间其他线程已经下载成功
+        """
+        attempts = self._attempts
+        with self._lock:
+            if self._attempts != attempts:
+                return self._last_ok  # 等待锁期间其他线程刚刚下载过
+            if not force and not self.needs_refresh():
+                return True
+
+            ok = bool(self.download())
+            self._attempts += 1
+            self._last_ok = ok
+            if ok:
+                self.refreshes += 1
+            else:
+                self.failures += 1
+            return ok
+
+    def start(self):
+        """启动后台刷新线程（重复调用无影响）"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name=f'cookie-refresher-{os.path.basename(self.path)}', daemon=True)
+        self._thread.start()
+
+    def trigger(self):
+        """唤醒后台线程立即检查（后台线程未启动时无影响）"""
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.check_interval)
+            self._wakeup.clear()
+            try:
+                if self.needs_refresh():
+                    self.refresh()
+            except Exception as e:
+                print(f"[CookieRefresher] ⚠️  后台刷新Cookie失败: {e}")
+
+    def stats(self):
+        """刷新统计信息"""
+        age = self.age()
+        return {
+            'background': self.running,
+            'age': round(age, 1) if age is not None else None,
+            'refreshes': self.refreshes,
+            'failures': self.failures
+        }
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_cookie_store(path):
+    """
+    获取指定Cookie文件的进程内共享缓存
+
+    Args:
+        path: Cookie JSON文件路径
+
+    Returns:
+        CookieStore
+    """
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = CookieStore(key)
+            _stores[key] = store
+        return store
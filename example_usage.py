@@ -9,11 +9,13 @@ from api_service import (
     # 搜索类函数
     search_dxm_product,
     search_dxm_product_all,
+    search_dxm_product_result,
     search_package,
     search_package_ids,
     search_package2,
     get_package_numbers,
     get_dianxiaomi_order_id,
+    lookup_orders,
 
     # 商品管理类函数
     add_product_to_dianxiaomi,
@@ -69,6 +71,17 @@ def example_1_search_product():
     )
     print(f"所有匹配结果: {all_results}")
 
+    # 同一个关键词查询多个店铺/变体：只请求一次，之后从内存中查询
+    # （上面两次调用也共用了同一次请求，结果缓存 PRODUCT_SEARCH_CACHE_SECONDS 秒）
+    search = search_dxm_product_result("iPhone 15")
+    if search:
+        for variant in ["黑色", "白色", "蓝色"]:
+            print(f"{variant}: {search.first('SH001', variant)}")
+
+    # 热门关键词的SKU可能在后面的页：最多搜索5页（并发请求，找到精确匹配后不再请求后面的页）
+    result = search_dxm_product("iPhone", "SH001", "黑色", max_pages=5)
+    print(f"多页搜索结果: {result}")
+
 
 def example_2_get_shop_dict():
     """示例2：获取店铺字典"""
@@ -103,6 +116,11 @@ def example_3_search_package():
     package_numbers = get_package_numbers(content="6385553-1124")
     print(f"包裹号列表: {package_numbers}")
 
+    # 方法5：批量查询多个订单（多个订单号合并成一次搜索，并发请求）
+    orders = lookup_orders(["6385553-1124", "6385553-1125", "6385553-1126"])
+    for order_id, info in orders.items():
+        print(f"{order_id}: {info.to_dict() if info else '查询失败'}")
+
 
 def example_4_batch_commit():
     """示例4：批量提交订单"""
@@ -196,13 +214,15 @@ def show_all_functions():
 
     functions = {
         "搜索类函数 (7个)": [
-            "search_dxm_product(search_value, shop_code, variant, debug=False)",
-            "search_dxm_product_all(search_value, shop_code, variant, debug=False)",
+            "search_dxm_product(search_value, shop_code, variant, debug=False, max_pages=1)",
+            "search_dxm_product_all(search_value, shop_code, variant, debug=False, max_pages=1)",
+            "search_dxm_product_result(search_value, max_pages=1) -> .first(shop_code, variant) / .all(shop_code, variant)",
             "search_package(content)",
             "search_package_ids(content)",
             "search_package2(content)",
             "get_package_numbers(content)",
             "get_dianxiaomi_order_id(content)",
+            "lookup_orders(order_ids) -> {order_id: OrderPackageInfo}",
         ],
         "商品管理类函数 (3个)": [
             "add_product_to_dianxiaomi(name, name_en, price, url, custom_zn, custom_en, sb_weight, sb_price, supplier, main_supplier, img_url, id, pid_pair, vid_pair, shop_id_pair, sku)",
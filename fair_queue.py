@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+客户端公平排队 - 多个调用方共用限流预算时，按权重公平分配令牌
+
+只按到达顺序排队时，一个死循环发请求的机器人可以占满整个 8次/秒 的预算，
+其他调用方的请求都排在它后面。这里按客户端（API Key 请求头，没有时用来源IP）
+做加权公平排队（start-time fair queuing，WFQ的一种实现）:
+
+- 每个请求到达时打上虚拟开始时间标签:
+      start = max(队列当前虚拟时间, 该客户端上一个请求的结束标签)
+      该客户端的结束标签 = start + cost / weight
+  标签最小的请求先领令牌；连续发请求的客户端标签越排越靠后，
+  偶尔发一个请求的客户端总是排在前面，权重为2的客户端得到2倍的份额
+- 空闲的客户端不会积攒额度（标签不小于队列当前虚拟时间）
+- 每个客户端可以限制同时进行中的请求数（从领到令牌到上游返回），
+  达到上限的客户端暂时不参与排队，不影响其他客户端
+- 每个 (限流器, 优先级通道) 是一个独立的队列，优先级通道之间仍然是严格优先级
+
+作用范围: 排队标签、虚拟时间和进行中计数都保存在进程内，公平性和进行中上限只在同一个进程内生效
+（令牌桶本身仍然是所有worker共享的）。
+
+- async_server.py 是单进程，所有请求在同一个队列里排序，公平排队完整生效
+- server.py 在gunicorn下是多个worker、每个worker只有几个线程，同一进程内同时排队的请求很少，
+  请求之间主要在共享令牌桶上按到达顺序竞争，公平排队基本不起作用；
+  max_in_flight 也是每个worker单独计数（实际上限约为 worker数 × max_in_flight）。
+  需要按调用方公平分配预算时请使用 async_server.py
+"""
+import time
+import hashlib
+import itertools
+import threading
+
+import config
+import metrics
+from rate_limiter import RateLimitExceeded, WaitHistogram
+
+
+ANONYMOUS_CLIENT = 'anonymous'
+
+
+class _ClientState:
+    """单个客户端的排队状态和统计"""
+
+    def __init__(self, name, weight, max_in_flight):
+        self.name = name
+        self.weight = weight
+        self.max_in_flight = max_in_flight
+        self.finish = {}  # 队列 -> 上一个请求的结束标签
+        self.waiting = 0
+        self.in_flight = 0
+        self.served = 0
+        self.rejected = 0
+        self.histogram = WaitHistogram()
+        self.last_seen = time.monotonic()
+
+    def can_admit(self):
+        return self.max_in_flight is None or self.in_flight < self.max_in_flight
+
+
+class FairScheduler:
+    """按客户端加权公平排队（进程内所有限流器共用一个实例，只在本进程内生效）"""
+
+    def __init__(self, clients=None, default_weight=None, default_max_in_flight=None, max_clients=None):
+        """
+        Args:
+            clients: {API Key 或 IP: {'name', 'weight', 'max_in_flight'}}，默认 config.FAIR_CLIENTS
+            default_weight: 未配置的客户端的权重
+            default_max_in_flight: 未配置的客户端的进行中请求上限，None表示不限制
+            max_clients: 最多记录多少个客户端，超过时清理最久未出现的空闲客户端
+        """
+        clients = config.FAIR_CLIENTS if clients is None else clients
+        self.default_weight = config.FAIR_DEFAULT_WEIGHT if default_weight is None else default_weight
+        self.default_max_in_flight = config.FAIR_DEFAULT_MAX_IN_FLIGHT \
+            if default_max_in_flight is None else default_max_in_flight
+        self.max_clients = config.FAIR_MAX_TRACKED_CLIENTS if max_clients is None else max_clients
+        self._names = {key: spec.get('name') or key for key, spec in clients.items()}
+        self._specs = {self._names[key]: spec for key, spec in clients.items()}
+        self._clients = {}
+        self._vtime = {}    # 队列 -> 虚拟时间（最近放行的请求的开始标签）
+        self._tickets = {}  # 队列 -> [(start, seq, client), ...] 等待成为队首的线程
+        self._busy = set()  # 队首正在领令牌的队列
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+
+    def identify(self, api_key=None, remote_addr=None):
+        """
+        客户端标识
+
+        配置过的API Key / IP使用配置中的名字；其他API Key只保留哈希前缀（不在统计中暴露Key），
+        没有API Key时使用来源IP
+
+        Returns:
+            str: 客户端名
+        """
+        for value in (api_key, remote_addr):
+            if value and value in self._names:
+                return self._names[value]
+        if api_key:
+            return 'key:' + hashlib.sha256(api_key.encode('utf-8')).hexdigest()[:12]
+        if remote_addr:
+            return f'ip:{remote_addr}'
+        return ANONYMOUS_CLIENT
+
+    def _state(self, client):
+        """获取客户端状态（调用方持有锁）"""
+        state = self._clients.get(client)
+        if state is None:
+            if len(self._clients) >= self.max_clients:
+                self._evict()
+            spec = self._specs.get(client, {})
+            state = _ClientState(
+                client,
+                float(spec.get('weight', self.default_weight)),
+                spec.get('max_in_flight', self.default_max_in_flight)
+            )
+            self._clients[client] = state
+        state.last_seen = time.monotonic()
+        return state
+
+    def _evict(self):
+        """清理最久未出现的一半空闲客户端（调用方持有锁）"""
+        idle = sorted((state for state in self._clients.values() if not state.waiting and not state.in_flight),
+                      key=lambda state: state.last_seen)
+        for state in idle[:max(1, len(idle) // 2)]:
+            del self._clients[state.name]
+
+    def _tag(self, queue, state, cost):
+        """为新请求计算开始标签（调用方持有锁）"""
+        start = max(self._vtime.get(queue, 0.0), state.finish.get(queue, 0.0))
+        state.finish[queue] = start + cost / state.weight
+        state.waiting += 1
+        return start
+
+    def _admit(self, queue, state, start):
+        """请求成为队首、开始领令牌（调用方持有锁）"""
+        self._vtime[queue] = max(self._vtime.get(queue, 0.0), start)
+        state.waiting -= 1
+        state.in_flight += 1
+
+    def tag(self, queue, client, cost=1.0):
+        """
+        请求进入队列，返回开始标签（asyncio版本按标签排序）
+
+        Args:
+            queue: 队列标识（如优先级通道名）
+            client: 客户端名
+            cost: 请求的代价（令牌数）
+
+        Returns:
+            float: 开始标签，越小越先执行
+        """
+        with self._cond:
+            return self._tag(queue, self._state(client), cost)
+
+    def can_admit(self, client):
+        """客户端进行中的请求数是否低于上限"""
+        with self._cond:
+            return self._state(client).can_admit()
+
+    def admit(self, queue, client, start):
+        """asyncio版本: 带有 start 标签的请求从队列中取出，开始领令牌"""
+        with self._cond:
+            self._admit(queue, self._state(client), start)
+
+    def cancel(self, client, rejected=False):
+        """
+        排队中的请求离开队列（调用方断开或排队超时）
+
+        Args:
+            client: 客户端名
+            rejected: 是否计为拒绝
+        """
+        with self._cond:
+            state = self._state(client)
+            state.waiting -= 1
+            if rejected:
+                state.rejected += 1
+            self._cond.notify_all()
+        if rejected:
+            metrics.inc('dxm_client_requests_total', {'client': client, 'result': 'rejected'})
+
+    def acquire(self, queue, client, timeout=None, cost=1.0):
+        """
+        线程版本: 等待成为队列的队首（之后调用方去领令牌，领完调用 release）
+
+        Args:
+            queue: 队列标识
+            client: 客户端名
+            timeout: 最长等待秒数，None表示一直等待
+            cost: 请求的代价（令牌数）
+
+        Raises:
+            RateLimitExceeded: 超过 timeout 仍未轮到
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            state = self._state(client)
+            start = self._tag(queue, state, cost)
+            ticket = (start, next(self._sequence), client)
+            tickets = self._tickets.setdefault(queue, [])
+            tickets.append(ticket)
+            while queue in self._busy or self._head(tickets) is not ticket:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    tickets.remove(ticket)
+                    if state.finish.get(queue) == start + cost / state.weight:
+                        state.finish[queue] = start  # 没有用掉的份额还给这个客户端
+                    state.waiting -= 1
+                    state.rejected += 1
+                    self._cond.notify_all()
+                    metrics.inc('dxm_client_requests_total', {'client': client, 'result': 'rejected'})
+                    raise RateLimitExceeded(timeout or 0.0)
+                self._cond.wait(remaining)
+
+            tickets.remove(ticket)
+            self._busy.add(queue)
+            self._admit(queue, state, start)
+
+    def _head(self, tickets):
+        """标签最小、且客户端未达到进行中上限的请求（调用方持有锁）"""
+        eligible = [ticket for ticket in tickets if self._clients[ticket[2]].can_admit()]
+        return min(eligible) if eligible else None
+
+    def release(self, queue):
+        """线程版本: 队首已经领到令牌（或放弃），下一个请求成为队首"""
+        with self._cond:
+            self._busy.discard(queue)
+            self._cond.notify_all()
+
+    def served(self, client, waited):
+        """请求领到令牌（记录排队时间）"""
+        with self._cond:
+            state = self._state(client)
+            state.served += 1
+        state.histogram.observe(waited)
+        metrics.inc('dxm_client_requests_total', {'client': client, 'result': 'served'})
+        metrics.observe('dxm_client_queue_wait_seconds', waited, {'client': client})
+
+    def finish(self, client, rejected=False):
+        """
+        已放行的请求结束（上游返回，或领令牌时被拒绝）
+
+        Args:
+            client: 客户端名
+            rejected: 领令牌时被拒绝（计为拒绝）
+        """
+        with self._cond:
+            state = self._state(client)
+            state.in_flight -= 1
+            if rejected:
+                state.rejected += 1
+            self._cond.notify_all()
+        if rejected:
+            metrics.inc('dxm_client_requests_total', {'client': client, 'result': 'rejected'})
+
+    def gauge(self, field):
+        """/metrics 使用: {(('client', 名称),): 当前值}，field 为 'waiting' 或 'in_flight'"""
+        with self._cond:
+            return {(('client', name),): getattr(state, field) for name, state in self._clients.items()}
+
+    def stats(self):
+        """
+        各客户端统计
+
+        Returns:
+            dict: {客户端名: {weight, max_in_flight, waiting, in_flight, served, rejected, queue_wait}}
+        """
+        with self._cond:
+            states = sorted(self._clients.values(), key=lambda state: state.name)
+            counters = [(state, state.weight, state.max_in_flight, state.waiting, state.in_flight,
+                         state.served, state.rejected) for state in states]
+        return {
+            state.name: {
+                'weight': weight,
+                'max_in_flight': max_in_flight,
+                'waiting': waiting,
+                'in_flight': in_flight,
+                'served': served,
+                'rejected': rejected,
+                'queue_wait': state.histogram.snapshot()
+            }
+            for state, weight, max_in_flight, waiting, in_flight, served, rejected in counters
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_fair_scheduler():
+    """
+    获取进程内共享的公平排队调度器
+
+    Returns:
+        FairScheduler 或 None（config.FAIR_QUEUE_ENABLED 为False时）
+    """
+    global _scheduler
+    if not config.FAIR_QUEUE_ENABLED:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = FairScheduler()
+        return _scheduler
+
+
+def client_from_headers(scheduler, headers, remote_addr):
+    """
+    从请求头和来源IP识别客户端
+
+    Args:
+        scheduler: FairScheduler 或 None
+        headers: 请求头（Flask / aiohttp 的headers对象）
+        remote_addr: 来源IP
+
+    Returns:
+        str 或 None: 客户端名，未启用公平排队时返回None
+    """
+    if scheduler is None:
+        return None
+    return scheduler.identify(headers.get(config.FAIR_CLIENT_HEADER), remote_addr)
@@ -1,58 +1,167 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-通用API服务 - 支持任意HTTP请求，自动注入Cookie，限流8次/秒
+通用API服务 - 支持任意HTTP请求，自动注入Cookie，限流8次/秒（所有worker共享）
 """
 import sys
 import os
 import time
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+
 import requests
-from threading import Lock
-from collections import deque
+from requests.adapters import HTTPAdapter
 
 # 添加项目根目录到路径
 sys.path.insert(0, os.path.dirname(__file__))
 
-from cookie_manager import get_cookie_path
+import config
+from cookie_store import get_cookie_store
+from account_pool import create_account_pool
+from response_cache import CACHE_BYPASS, CACHE_DIRECTIVES, CACHE_INVALIDATE, ResponseCache, create_response_cache
+from single_flight import FlightTimeout, create_single_flight, is_read_request
+from adaptive_rate import is_busy_response
+from projection import apply_select, compile_select
+from request_cost import create_cost_table
+import metrics
+from rate_limiter import RateLimiter, RateLimitExceeded  # RateLimiter保留以兼容旧的导入路径
 
 
-class RateLimiter:
-    """速率限制器 - 8次/秒"""
+def load_cookie_string(cookie_path):
+    """
+    获取Cookie请求头（来自进程内的CookieStore，文件未变化时不重复解析）
 
-    def __init__(self, max_calls=8, time_window=1.0):
-        """
-        Args:
-            max_calls: 时间窗口内最大调用次数
-            time_window: 时间窗口（秒）
-        """
-        self.max_calls = max_calls
-        self.time_window = time_window
-        self.calls = deque()
-        self.lock = Lock()
-
-    def wait_if_needed(self):
-        """如果超过速率限制，等待"""
-        with self.lock:
-            now = time.time()
-
-            # 移除时间窗口外的调用记录
-            while self.calls and self.calls[0] <= now - self.time_window:
-                self.calls.popleft()
-
-            # 如果达到限制，计算需要等待的时间
-            if len(self.calls) >= self.max_calls:
-                sleep_time = self.time_window - (now - self.calls[0])
-                if sleep_time > 0:
-                    print(f"[RateLimiter] 达到速率限制，等待 {sleep_time:.2f} 秒...")
-                    time.sleep(sleep_time)
-                    # 重新计算
-                    now = time.time()
-                    while self.calls and self.calls[0] <= now - self.time_window:
-                        self.calls.popleft()
-
-            # 记录本次调用
-            self.calls.append(now)
+    Args:
+        cookie_path: 本地Cookie文件路径
+
+    Returns:
+        str: 'name=value; name2=value2' 格式的Cookie字符串
+    """
+    try:
+        return get_cookie_store(cookie_path).get_cookie_header()
+    except Exception as e:
+        raise Exception(f"读取Cookie失败: {e}")
+
+
+def parse_deadline(value):
+    """
+    解析截止时间请求头（config.DEADLINE_HEADER，调用方还愿意等待的秒数）
+
+    Args:
+        value: 请求头的值
+
+    Returns:
+        float 或 None: time.monotonic() 时间轴上的截止时间，没有或格式错误时返回None
+    """
+    try:
+        budget = float(value)
+    except (TypeError, ValueError):
+        return None
+    if budget != budget or budget == float('inf'):
+        return None
+    return time.monotonic() + budget
+
+
+def parse_max_wait(value):
+    """
+    校验请求中的 max_wait（限流队列中最长等待秒数）
+
+    Args:
+        value: JSON请求体中的值
+
+    Returns:
+        float 或 None: 没有指定时返回None
+
+    Raises:
+        ValueError: 不是非负数
+    """
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value or value < 0:
+        raise ValueError(f"max_wait必须是非负数: {value!r}")
+    return float(value)
+
+
+def deadline_result(url, method, stage):
+    """
+    超过截止时间、不再发往上游的结果（计入 dxm_deadline_shed_total）
+
+    Args:
+        stage: 'queue' 排队中丢弃（没有消耗令牌） / 'upstream' 领到令牌后剩余时间不够发送 /
+               'flight' 等待合并的相同请求时超过截止时间
+    """
+    metrics.inc('dxm_deadline_shed_total', {'stage': stage})
+    return {
+        'success': False,
+        'status_code': 504,
+        'error': '已超过调用方的截止时间，请求没有发往上游',
+        'deadline_exceeded': True,
+        'request_info': {
+            'url': url,
+            'method': method
+        }
+    }
+
+
+def rate_limited_result(url, method, lane, retry_after):
+    """
+    预计排队时间超过 max_wait、直接拒绝的结果（计入 dxm_limiter_rejected_total）
+
+    Args:
+        lane: 优先级通道
+        retry_after: 建议重试等待秒数
+    """
+    metrics.inc('dxm_limiter_rejected_total', {'lane': lane})
+    return {
+        'success': False,
+        'status_code': 429,
+        'error': f"达到速率限制，需要等待 {retry_after:.2f} 秒",
+        'retry_after': round(retry_after, 3),
+        'request_info': {
+            'url': url,
+            'method': method
+        }
+    }
+
+
+def wants_raw(value):
+    """
+    解析原样返回开关（payload的 raw 字段或 X-Raw-Response 请求头）
+
+    Returns:
+        bool
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+
+def raw_response_headers(result):
+    """
+    原样返回模式下放在响应头中的元数据（响应体是上游的原始字节）
+
+    Args:
+        result: execute_request 返回的原样结果
+
+    Returns:
+        dict: 响应头
+    """
+    headers = {
+        'Content-Type': result['content_type'],
+        'X-Proxy-Raw': '1',
+        'X-Queue-Wait': str(result.get('queue_wait', 0.0))
+    }
+    if 'cache' in result:
+        headers['X-Cache'] = result['cache']
+    if 'cache_age' in result:
+        headers['X-Cache-Age'] = str(result['cache_age'])
+    if result.get('coalesced'):
+        headers['X-Coalesced'] = '1'
+    if 'account' in result:
+        headers['X-Account'] = result['account']
+    return headers
 
 
 class GenericAPIService:
@@ -60,47 +169,88 @@ class GenericAPIService:
 
     def __init__(self):
         """初始化服务"""
-        self.cookie_path = None
-        self.rate_limiter = RateLimiter(max_calls=8, time_window=1.0)
-        self._refresh_cookie()
+        self.accounts = create_account_pool()
+        # 主账号的限流器和速率控制器（优先级通道的解析与账号无关，单账号时就是唯一的限流器）
+        self.rate_limiter = self.accounts.primary.limiter
+        self.rate_controller = self.accounts.primary.rate_controller
+        self.response_cache = create_response_cache()
+        self.single_flight = create_single_flight()
+        self.costs = create_cost_table()
+        self.in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self.session = self._create_session()
+        self.accounts.prepare()
+        if config.HTTP_WARMUP_URLS and config.HTTP_WARMUP_CONNECTIONS > 0:
+            threading.Thread(target=self.warm_up, daemon=True).start()
         print("[GenericAPIService] ✓ 服务初始化成功")
 
-    def _refresh_cookie(self):
-        """刷新Cookie路径"""
-        self.cookie_path = get_cookie_path()
-        if not self.cookie_path:
-            raise Exception("无法获取Cookie，请检查网络连接")
-        return self.cookie_path
-
-    def _ensure_cookie(self):
-        """确保Cookie可用"""
-        if not self.cookie_path:
-            self._refresh_cookie()
-        return self.cookie_path
-
-    def _get_cookie_string(self):
-        """获取Cookie字符串"""
-        cookie_path = self._ensure_cookie()
-
-        try:
-            with open(cookie_path, 'r', encoding='utf-8') as f:
-                cookie_data = json.load(f)
-
-            # 提取cookies
-            cookies_dict = {}
-            if 'cookies' in cookie_data and isinstance(cookie_data['cookies'], list):
-                for cookie in cookie_data['cookies']:
-                    if 'name' in cookie and 'value' in cookie:
-                        cookies_dict[cookie['name']] = cookie['value']
+    def _create_session(self):
+        """创建带连接池的HTTP会话（每个worker进程一个，线程间共享）"""
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=config.HTTP_POOL_CONNECTIONS,
+            pool_maxsize=config.HTTP_POOL_MAXSIZE,
+            max_retries=0
+        )
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        # Cookie由服务器显式注入，不保存上游返回的Set-Cookie，避免和注入的Cookie冲突
+        session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+        return session
+
+    def warm_up(self):
+        """预先建立到上游的keep-alive连接，省去首批请求的TCP+TLS握手"""
+        targets = [url for url in config.HTTP_WARMUP_URLS for _ in range(config.HTTP_WARMUP_CONNECTIONS)]
+        if not targets:
+            return
+
+        def connect(url):
+            # 预热请求同样计入限流预算（走最低优先级通道）
+            self.rate_limiter.wait_if_needed(priority=self.rate_limiter.lanes[-1])
+            try:
+                self.session.head(url, timeout=config.UPSTREAM_TIMEOUT, allow_redirects=False)
+                return True
+            except requests.exceptions.RequestException as e:
+                print(f"[GenericAPIService] ⚠️  预热连接失败: {url} ({e})")
+                return False
+
+        # 并发发起，才能在连接池中留下多个连接
+        with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+            warmed = sum(pool.map(connect, targets))
+        print(f"[GenericAPIService] ✓ 已预热 {warmed}/{len(targets)} 个上游连接")
+
+    def connection_stats(self):
+        """
+        连接复用统计
 
-            # 构建cookie字符串
-            cookie_string = '; '.join([f"{k}={v}" for k, v in cookies_dict.items()])
-            return cookie_string
+        Returns:
+            dict: requests 总请求数, new_connections 新建连接数, reused 复用连接的请求数
+        """
+        total_requests = 0
+        new_connections = 0
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                try:
+                    pool = pools[key]
+                except KeyError:  # 已被LRU淘汰
+                    continue
+                total_requests += pool.num_requests
+                new_connections += pool.num_connections
+        return {
+            'requests': total_requests,
+            'new_connections': new_connections,
+            'reused': max(0, total_requests - new_connections)
+        }
 
-        except Exception as e:
-            raise Exception(f"读取Cookie失败: {e}")
+    @property
+    def cookie_path(self):
+        """主账号的Cookie文件路径"""
+        return self.accounts.primary.cookie_path
 
-    def execute_request(self, url, headers=None, data=None, method='POST', params=None):
+    def execute_request(self, url, headers=None, data=None, method='POST', params=None, max_wait=None,
+                        priority=None, cache=None, raw=False, select=None, account=None, sticky=None, client=None,
+                        deadline=None):
         """
         通用HTTP请求执行器
 
@@ -110,6 +260,20 @@ class GenericAPIService:
             data (dict): POST请求的表单数据
             method (str): HTTP方法，'POST'或'GET'，默认'POST'
             params (dict): GET请求的URL参数
+            max_wait (float): 限流队列中最长等待时间（秒），默认使用 config.RATE_LIMIT_MAX_WAIT
+            priority (str): 优先级通道（config.PRIORITY_LANES），默认 config.PRIORITY_DEFAULT
+            cache (str): 缓存控制，'bypass' 不读缓存并刷新，'invalidate' 先清除该URL的缓存；
+                         None表示正常使用缓存（仅对 config.RESPONSE_CACHE_RULES 中的只读接口生效）
+            raw (bool): 原样返回模式，不解析JSON，结果中用 body（上游响应体bytes）和 content_type
+                        代替 response / response_type / headers / request_info
+            select (str|list): 字段投影，如 'data.page.list[].id,data.page.totalSize'，
+                               只返回选中的JSON字段（语法见 projection.py）
+            account (str): 指定使用的账号名（config.COOKIE_ACCOUNTS），None表示自动选择负载最低的账号
+            sticky (str): sticky键，相同的键总是使用同一个账号
+            client (str): 客户端名（fair_queue.FairScheduler.identify），同一通道内按客户端公平排队；
+                          None表示按到达顺序排队
+            deadline (float): 调用方的截止时间（time.monotonic()时间轴，见 parse_deadline），
+                              来不及在截止时间前完成的请求不消耗令牌、不发往上游，返回504
 
         Returns:
             dict: 完整的响应信息，包含：
@@ -118,11 +282,190 @@ class GenericAPIService:
                 - response: 响应数据（JSON或文本）
                 - headers: 响应头
                 - error: 错误信息（如果有）
+                - retry_after: 建议重试等待秒数（限流拒绝时）
+                - deadline_exceeded: True表示超过调用方的截止时间，请求没有发往上游（504）
+                - deadline_timeout: True表示上游请求的超时时间按截止时间缩短后超时（不与合并的请求共享）
+                - queue_wait: 在限流队列中等待的秒数
+                - cache: 'hit' / 'miss' / 'bypass'（仅可缓存的接口）
+                - coalesced: True表示合并到了同时进行中的相同请求，结果与该请求共享
+                - account: 实际使用的账号名
                 - request_info: 请求信息（调试用）
         """
 
-        # 等待速率限制
-        self.rate_limiter.wait_if_needed()
+        try:
+            priority = self.rate_limiter.resolve(priority)
+        except ValueError as e:
+            return {
+                'success': False,
+                'status_code': 400,
+                'error': str(e),
+                'request_info': {
+                    'url': url,
+                    'method': method
+                }
+            }
+
+        # 查询响应缓存（命中时不消耗令牌）
+        if cache is not None and cache not in CACHE_DIRECTIVES:
+            return {
+                'success': False,
+                'status_code': 400,
+                'error': f"不支持的缓存指令: {cache}，可选值: {', '.join(CACHE_DIRECTIVES)}",
+                'request_info': {
+                    'url': url,
+                    'method': method
+                }
+            }
+
+        if account:
+            try:
+                self.accounts.get(account)
+            except ValueError as e:
+                return {
+                    'success': False,
+                    'status_code': 400,
+                    'error': str(e),
+                    'request_info': {
+                        'url': url,
+                        'method': method
+                    }
+                }
+
+        tree = None
+        if select is not None:
+            try:
+                if raw:
+                    raise ValueError("select 不能与 raw 同时使用")
+                tree = compile_select(select)
+            except ValueError as e:
+                return {
+                    'success': False,
+                    'status_code': 400,
+                    'error': str(e),
+                    'request_info': {
+                        'url': url,
+                        'method': method
+                    }
+                }
+
+        # 缓存和合并都使用完整响应，字段投影在最后对每个调用方单独执行
+        result = self._lookup_and_send(url, headers, data, method, params, max_wait, priority, cache, raw,
+                                       account, sticky, client, deadline)
+        return apply_select(result, tree) if tree is not None else result
+
+    def _lookup_and_send(self, url, headers, data, method, params, max_wait, priority, cache, raw, account, sticky,
+                         client=None, deadline=None):
+        """查询响应缓存 → 合并相同请求 → 发送（参数见 execute_request）"""
+
+        cache_key = None
+        cache_ttl = self.response_cache.ttl_for(method, url) if self.response_cache else None
+        if cache == CACHE_INVALIDATE and self.response_cache:
+            self.response_cache.invalidate(url)
+        if cache_ttl:
+            cache_key = self.response_cache.make_key(method, url, data, params, raw, account)
+            if cache is None:
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    print(f"[GenericAPIService] ✓ 命中缓存: {url}")
+                    metrics.inc('dxm_cache_requests_total', {'result': 'hit'})
+                    return cached
+                metrics.inc('dxm_cache_requests_total', {'result': 'miss'})
+            else:
+                self.response_cache.bypassed += 1
+                metrics.inc('dxm_cache_requests_total', {'result': 'bypass'})
+
+        # 相同的只读请求正在进行中时，等待它的结果（不消耗令牌）
+        if max_wait is None:
+            max_wait = config.RATE_LIMIT_MAX_WAIT
+        started = time.monotonic()
+        wait_until = None if max_wait is None else started + max_wait
+
+        def send(admitted=None):
+            # 合并的请求可能先等过一个被拒绝的leader，排队时间从进入服务时算起
+            remaining = None if wait_until is None else max(0.0, wait_until - time.monotonic())
+            return self._send_request(url, headers, data, method, params, remaining, priority,
+                                      cache, cache_key, cache_ttl, raw, account, sticky, client, deadline,
+                                      admitted)
+
+        if self.single_flight is None or not is_read_request(method, url):
+            return send()
+
+        # 不同通道的请求不合并，交互请求不会等在排队中的批量请求后面
+        flight_key = f"{priority}:{cache_key or ResponseCache.make_key(method, url, data, params, raw, account)}"
+        # 等待leader的时间受这个请求自己的 max_wait 和截止时间限制
+        queue_by, bounded = wait_until, False
+        if deadline is not None and (queue_by is None or deadline - config.DEADLINE_MIN_UPSTREAM_TIME < queue_by):
+            queue_by, bounded = deadline - config.DEADLINE_MIN_UPSTREAM_TIME, True
+        try:
+            result, shared = self.single_flight.do(flight_key, send, queue_by, deadline)
+        except FlightTimeout as e:
+            if e.admitted:
+                # leader已经发往上游，但在这个请求的截止时间前没有返回
+                return deadline_result(url, method, 'flight')
+            if bounded:
+                return deadline_result(url, method, 'queue')
+            # leader在这个请求的 max_wait 内没有领到令牌，与自己排队时一样快速失败
+            return rate_limited_result(url, method, priority, max_wait or 1.0 / self.rate_limiter.rate)
+        if shared:
+            print(f"[GenericAPIService] ✓ 合并到进行中的相同请求: {url}")
+            metrics.inc('dxm_single_flight_coalesced_total')
+            result = dict(result, coalesced=True)
+        return result
+
+    def _send_request(self, url, headers, data, method, params, max_wait, priority, cache, cache_key, cache_ttl,
+                      raw=False, account=None, sticky=None, client=None, deadline=None, admitted=None):
+        """
+        选择账号 → 限流（按客户端公平排队，重接口消耗多个令牌） → 发送（参数见 execute_request）
+
+        admitted: 领到令牌后调用的无参函数（请求合并时通知等待中的相同请求）
+        """
+        target = self.accounts.select(account, sticky)
+        cost, family = self.costs.cost(method, url, data, params)
+
+        # 等待该账号的速率限制（预计等待超过max_wait时直接拒绝，不消耗令牌）
+        if max_wait is None:
+            max_wait = config.RATE_LIMIT_MAX_WAIT
+
+        # 截止时间: 排队时间不能超过剩余时间（留出上游请求的时间），已经过期的请求不再领令牌
+        bounded = False
+        if deadline is not None:
+            budget = deadline - time.monotonic() - config.DEADLINE_MIN_UPSTREAM_TIME
+            if budget <= 0:
+                return deadline_result(url, method, 'queue')
+            if max_wait is None or budget < max_wait:
+                max_wait, bounded = budget, True
+
+        try:
+            queue_wait = target.limiter.wait_if_needed(max_wait=max_wait, priority=priority, client=client,
+                                                       cost=cost, family=family)
+        except RateLimitExceeded as e:
+            if bounded:
+                return deadline_result(url, method, 'queue')
+            return rate_limited_result(url, method, priority, e.retry_after)
+
+        if admitted is not None:
+            admitted()
+        metrics.observe('dxm_limiter_wait_seconds', queue_wait, {'lane': priority})
+        metrics.inc('dxm_limiter_tokens_total', {'family': family or 'default'}, cost)
+
+        try:
+            # 上游请求的超时时间不超过剩余时间
+            timeout = config.UPSTREAM_TIMEOUT
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining < config.DEADLINE_MIN_UPSTREAM_TIME:
+                    return deadline_result(url, method, 'upstream')
+                timeout = min(timeout, remaining)
+            return self._send_upstream(target, url, headers, data, method, params, cache, cache_key, cache_ttl,
+                                       raw, queue_wait, timeout)
+        finally:
+            # 公平排队: 这个客户端进行中的请求数减一
+            if client is not None and target.limiter.fair is not None:
+                target.limiter.fair.finish(client)
+
+    def _send_upstream(self, target, url, headers, data, method, params, cache, cache_key, cache_ttl, raw,
+                       queue_wait, timeout):
+        """注入Cookie → 请求上游 → 写入缓存（参数见 execute_request）"""
 
         # 准备headers
         if headers is None:
@@ -130,9 +473,9 @@ class GenericAPIService:
 
         # 自动注入Cookie
         try:
-            cookie_string = self._get_cookie_string()
+            cookie_string = target.cookie_header()
             headers['cookie'] = cookie_string
-            print(f"[GenericAPIService] ✓ Cookie已注入")
+            print(f"[GenericAPIService] ✓ Cookie已注入 (账号: {target.name})")
         except Exception as e:
             return {
                 'success': False,
@@ -156,20 +499,25 @@ class GenericAPIService:
         print(f"[GenericAPIService] 发送 {method} 请求: {url}")
 
         # 执行HTTP请求
+        path = metrics.path_label(url)
+        started = time.monotonic()
+        with self._in_flight_lock:
+            self.in_flight += 1
+        target.begin()
         try:
             if method.upper() == 'POST':
-                response = requests.post(
+                response = self.session.post(
                     url=url,
                     headers=headers,
                     data=data,
-                    timeout=30
+                    timeout=timeout
                 )
             elif method.upper() == 'GET':
-                response = requests.get(
+                response = self.session.get(
                     url=url,
                     headers=headers,
                     params=params,
-                    timeout=30
+                    timeout=timeout
                 )
             else:
                 return {
@@ -178,33 +526,70 @@ class GenericAPIService:
                     'request_info': request_info
                 }
 
-            # 解析响应
-            result = {
-                'success': True,
-                'status_code': response.status_code,
-                'headers': dict(response.headers),
-                'request_info': request_info
-            }
+            metrics.inc('dxm_upstream_requests_total', {'path': path, 'status': str(response.status_code)})
+            metrics.observe('dxm_upstream_latency_seconds', time.monotonic() - started, {'path': path})
+
+            if raw:
+                # 原样返回: 不解析JSON，也不回显响应头和请求信息
+                result = {
+                    'success': True,
+                    'status_code': response.status_code,
+                    'content_type': response.headers.get('Content-Type', 'application/octet-stream'),
+                    'body': response.content,
+                    'queue_wait': round(queue_wait, 3),
+                    'account': target.name
+                }
+                body_text = response.content
+            else:
+                # 解析响应
+                result = {
+                    'success': True,
+                    'status_code': response.status_code,
+                    'headers': dict(response.headers),
+                    'queue_wait': round(queue_wait, 3),
+                    'account': target.name,
+                    'request_info': request_info
+                }
 
-            # 尝试解析JSON
-            try:
-                result['response'] = response.json()
-                result['response_type'] = 'json'
-            except json.JSONDecodeError:
-                result['response'] = response.text
-                result['response_type'] = 'text'
+                # 尝试解析JSON
+                try:
+                    result['response'] = response.json()
+                    result['response_type'] = 'json'
+                except json.JSONDecodeError:
+                    result['response'] = response.text
+                    result['response_type'] = 'text'
+                body_text = response.text
+
+            # 上游繁忙时降速，持续正常时逐步提速
+            busy = is_busy_response(response.status_code, body_text)
+            if busy:
+                metrics.inc('dxm_upstream_busy_total', {'path': path})
+            if target.rate_controller is not None:
+                target.rate_controller.record(busy)
+
+            # 只缓存真正执行成功的响应（200且不是上游繁忙提示）
+            if cache_key is not None:
+                result['cache'] = 'miss' if cache is None else CACHE_BYPASS
+                if response.status_code == 200 and not busy:
+                    self.response_cache.put(cache_key, url, result, cache_ttl, len(response.content))
 
             print(f"[GenericAPIService] ✓ 响应成功: {response.status_code}")
 
             return result
 
         except requests.exceptions.Timeout:
-            return {
+            metrics.inc('dxm_upstream_requests_total', {'path': path, 'status': 'timeout'})
+            result = {
                 'success': False,
                 'error': '请求超时',
                 'request_info': request_info
             }
+            if timeout < config.UPSTREAM_TIMEOUT:
+                # 超时时间按调用方的截止时间缩短过，结果不给合并的其他请求使用
+                result['deadline_timeout'] = True
+            return result
         except requests.exceptions.RequestException as e:
+            metrics.inc('dxm_upstream_requests_total', {'path': path, 'status': 'error'})
             return {
                 'success': False,
                 'error': f'请求失败: {str(e)}',
@@ -216,6 +601,10 @@ class GenericAPIService:
                 'error': f'未知错误: {str(e)}',
                 'request_info': request_info
             }
+        finally:
+            target.end()
+            with self._in_flight_lock:
+                self.in_flight -= 1
 
 
 # 全局服务实例
@@ -231,7 +620,8 @@ def get_service():
 
 
 # 便捷函数
-def execute(url, headers=None, data=None, method='POST', params=None):
+def execute(url, headers=None, data=None, method='POST', params=None, max_wait=None, priority=None, cache=None,
+            raw=False, select=None, account=None, sticky=None, client=None, deadline=None):
     """
     便捷函数 - 执行HTTP请求
 
@@ -241,12 +631,22 @@ def execute(url, headers=None, data=None, method='POST', params=None):
         data: POST数据
         method: HTTP方法
         params: GET参数
+        max_wait: 限流队列中最长等待时间（秒）
+        priority: 优先级通道，如 'interactive' 或 'bulk'
+        cache: 缓存控制指令，'bypass' 或 'invalidate'
+        raw: 原样返回上游响应体（bytes），不解析JSON
+        select: 字段投影表达式
+        account: 指定账号名
+        sticky: sticky键，相同的键总是使用同一个账号
+        client: 客户端名（公平排队）
+        deadline: 截止时间（time.monotonic()时间轴）
 
     Returns:
         完整的响应信息
     """
     service = get_service()
-    return service.execute_request(url, headers, data, method, params)
+    return service.execute_request(url, headers, data, method, params, max_wait, priority, cache, raw, select,
+                                   account, sticky, client, deadline)
 
 
 if __name__ == "__main__":
@@ -268,6 +668,8 @@ if __name__ == "__main__":
             elapsed = time.time() - start
             print(f"  请求 {i+1}: 等待 {elapsed:.3f}秒")
 
+        print(f"\n排队等待直方图: {json.dumps(service.rate_limiter.stats(), ensure_ascii=False)}")
+
         print("\n" + "=" * 60)
         print("测试完成")
         print("=" * 60)
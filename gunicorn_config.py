@@ -40,3 +40,19 @@ max_requests_jitter = 50
 
 # 优雅重启超时
 graceful_timeout = 30
+
+
+def post_worker_init(worker):
+    """worker启动后立即初始化服务（下载Cookie并预热上游连接），而不是等第一个请求"""
+    from server import get_generic_api_service, get_job_dispatcher
+    try:
+        get_generic_api_service()
+    except Exception as e:
+        # 初始化失败时不阻止worker启动，第一个请求会再次尝试
+        worker.log.warning(f"服务预初始化失败: {e}")
+
+    # 启动异步任务执行线程，继续执行重启前还在排队的任务
+    try:
+        get_job_dispatcher()
+    except Exception as e:
+        worker.log.warning(f"任务执行器启动失败: {e}")
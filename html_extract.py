@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+商品列表HTML提取 - 把 dxmCommodityProduct/pageList.htm 的每个商品行解析成 (SKU名称, [title...]) 记录
+
+原来的做法是对每个 goodsSKUName 向上找15层父元素，每一层都在整个子树里 find_all 带title的元素，
+50行的页面是平方级的工作量，纯Python的 html.parser 后端又慢，是搜索机器人最主要的CPU开销。
+这里整页只解析一次:
+
+- 每个SKU属于包含它的最近一个 <tr>（商品行），记录该行内所有非空的 title 属性（按文档顺序）；
+  不在任何 <tr> 内的SKU使用整个页面的title
+- 解析引擎按可用性依次选择 selectolax、lxml，都没有安装时使用标准库 html.parser 的流式解析器
+- 变体匹配在记录上进行（match_variant），只匹配SKU所在行的title，不会匹配到相邻商品的变体
+- 同时统计商品行（class 含 content 的 <tr>）的个数: 一个商品有多个SKU，判断是否为最后一页要按商品数
+"""
+from collections import namedtuple
+from html.parser import HTMLParser as _StdlibHTMLParser
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as _SelectolaxParser
+except ImportError:
+    try:
+        # selectolax 1.0 之前的版本（Modest后端）
+        from selectolax.parser import HTMLParser as _SelectolaxParser
+    except ImportError:
+        _SelectolaxParser = None
+
+try:
+    import lxml.html as _lxml_html
+except ImportError:
+    _lxml_html = None
+
+
+SKU_CLASS = 'goodsSKUName'
+PRODUCT_ROW_CLASS = 'content'
+
+ProductRow = namedtuple('ProductRow', ['sku_name', 'titles'])
+
+# rows: list[ProductRow]; products: 页面中的商品行数
+ProductPage = namedtuple('ProductPage', ['rows', 'products'])
+
+
+def available_engines():
+    """当前环境可用的解析引擎，按速度从快到慢排列"""
+    engines = []
+    if _SelectolaxParser is not None:
+        engines.append('selectolax')
+    if _lxml_html is not None:
+        engines.append('lxml')
+    engines.append('stdlib')
+    return engines
+
+
+def extract_product_rows(html, engine=None):
+    """
+    解析商品列表页面
+
+    Args:
+        html: 页面HTML字符串
+        engine: 'selectolax' / 'lxml' / 'stdlib'，None表示使用最快的可用引擎
+
+    Returns:
+        list[ProductRow]: 按SKU在页面中出现的顺序排列
+
+    Raises:
+        ValueError: 指定的引擎不可用
+    """
+    return extract_product_page(html, engine).rows
+
+
+def extract_product_page(html, engine=None):
+    """
+    解析商品列表页面，同时统计商品行数
+
+    Args:
+        html: 页面HTML字符串
+        engine: 'selectolax' / 'lxml' / 'stdlib'，None表示使用最快的可用引擎
+
+    Returns:
+        ProductPage: (SKU记录列表, 商品行数)
+
+    Raises:
+        ValueError: 指定的引擎不可用
+    """
+    engine = engine or available_engines()[0]
+    if engine not in available_engines():
+        raise ValueError(f"不可用的HTML解析引擎: {engine}，可选值: {', '.join(available_engines())}")
+    if not html:
+        return ProductPage([], 0)
+    return ProductPage(*_EXTRACTORS[engine](html))
+
+
+def match_variant(rows, shop_code, variant):
+    """
+    在商品行记录中匹配店铺编码和变体
+
+    Args:
+        rows: extract_product_rows() 的结果
+        shop_code: 店铺编码，SKU名称以它开头为精确匹配，包含它为模糊匹配
+        variant: 变体信息（不区分大小写），商品行中某个title包含它即为匹配
+
+    Returns:
+        tuple: (精确匹配列表, 模糊匹配列表)，元素为 {'sku_name', 'title'}，title为该行第一个匹配的title
+    """
+    variant = variant.lower()
+    exact, contains = [], []
+    for row in rows:
+        if not (row.sku_name.startswith(shop_code) or shop_code in row.sku_name):
+            continue
+        for title in row.titles:
+            if variant in title.lower():
+                result = {'sku_name': row.sku_name, 'title': title}
+                (exact if row.sku_name.startswith(shop_code) else contains).append(result)
+                break
+    return exact, contains
+
+
+def first_match(rows, shop_code, variant):
+    """
+    第一个符合条件的SKU名称（以店铺编码开头的优先）
+
+    Args:
+        rows: extract_product_rows() 的结果
+        shop_code: 店铺编码
+        variant: 变体信息
+
+    Returns:
+        str 或 None: SKU名称，未找到返回None
+    """
+    exact, contains = match_variant(rows, shop_code, variant)
+    if exact:
+        return exact[0]['sku_name']
+    if contains:
+        return contains[0]['sku_name']
+    return None
+
+
+def _has_class(value, name):
+    return value is not None and name in value.split()
+
+
+def _extract_selectolax(html):
+    tree = _SelectolaxParser(html)
+    rows, titles_by_row = [], {}
+    for span in tree.css('span.' + SKU_CLASS):
+        row = span.parent
+        while row is not None and row.tag != 'tr':
+            row = row.parent
+        scope = row if row is not None else tree.root
+        titles = titles_by_row.get(scope.mem_id)
+        if titles is None:
+            # 行自身的title不算在该行内；不在行内时使用整个页面（包括根元素）的title
+            titles = titles_by_row[scope.mem_id] = [
+                node.attributes['title'] for node in scope.css('[title]')
+                if node.attributes.get('title') and (row is None or node.mem_id != row.mem_id)
+            ]
+        rows.append(ProductRow(span.text(deep=True, separator='', strip=True), titles))
+    return rows, len(tree.css('tr.' + PRODUCT_ROW_CLASS))
+
+
+def _extract_lxml(html):
+    document = _lxml_html.fromstring(html)
+    rows, titles_by_row = [], {}
+    spans = document.xpath('//span[contains(concat(" ", normalize-space(@class), " "), " %s ")]' % SKU_CLASS)
+    for span in spans:
+        scope = next(span.iterancestors('tr'), None)
+        # 行自身的title不算在该行内；不在行内时使用整个页面（fromstring 返回的根元素自身也算）
+        path = './/*/@title'
+        if scope is None:
+            scope, path = document, 'descendant-or-self::*/@title'
+        titles = titles_by_row.get(scope)
+        if titles is None:
+            titles = titles_by_row[scope] = [str(title) for title in scope.xpath(path) if title]
+        rows.append(ProductRow(''.join(text.strip() for text in span.itertext()), titles))
+    products = document.xpath('//tr[contains(concat(" ", normalize-space(@class), " "), " %s ")]'
+                              % PRODUCT_ROW_CLASS)
+    return rows, len(products)
+
+
+class _RowParser(_StdlibHTMLParser):
+    """
+    标准库流式解析器: 一遍扫描，维护当前打开的 <tr> 栈
+
+    带title的元素加入所有打开的行（外层行的子树也包含它）；SKU记录引用所在行的title列表，
+    解析结束时列表已经完整。没有闭合的 <tr> 在同一层的下一个 <tr> 或 </table> 处隐式关闭。
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.rows = []
+        self.products = 0
+        self._frames = [(-1, [])]  # (所在table层数, title列表)，栈底是整个页面
+        self._tables = 0
+        self._sku_text = None      # 正在读取的SKU文本片段
+        self._sku_depth = 0        # SKU span 内嵌套的 span 层数
+
+    def _collect(self, attrs):
+        """元素的非空title加入所有打开的行（行自身的title不算在该行内，与其他引擎一致）"""
+        for name, value in attrs:
+            if name == 'title' and value:
+                for _, titles in self._frames:
+                    titles.append(value)
+                break
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'tr' and self._frames[-1][0] == self._tables:
+            self._frames.pop()
+        self._collect(attrs)
+
+        if tag == 'tr':
+            self._frames.append((self._tables, []))
+            if _has_class(dict(attrs).get('class'), PRODUCT_ROW_CLASS):
+                self.products += 1
+        elif tag == 'table':
+            self._tables += 1
+        elif tag == 'span':
+            if self._sku_text is not None:
+                self._sku_depth += 1
+            elif _has_class(dict(attrs).get('class'), SKU_CLASS):
+                self._sku_text = []
+                self._sku_depth = 0
+
+    def handle_startendtag(self, tag, attrs):
+        # <br/> 之类的自闭合标签不会打开行或span，只收集title
+        self._collect(attrs)
+
+    def handle_endtag(self, tag):
+        if tag == 'tr':
+            if self._frames[-1][0] == self._tables:
+                self._frames.pop()
+        elif tag == 'table':
+            while self._frames[-1][0] >= self._tables:
+                self._frames.pop()
+            self._tables = max(0, self._tables - 1)
+        elif tag == 'span' and self._sku_text is not None:
+            if self._sku_depth:
+                self._sku_depth -= 1
+            else:
+                text = ''.join(piece.strip() for piece in self._sku_text)
+                self.rows.append(ProductRow(text, self._frames[-1][1]))
+                self._sku_text = None
+
+    def handle_data(self, data):
+        if self._sku_text is not None:
+            self._sku_text.append(data)
+
+
+def _extract_stdlib(html):
+    parser = _RowParser()
+    parser.feed(html)
+    parser.close()
+    return parser.rows, parser.products
+
+
+_EXTRACTORS = {
+    'selectolax': _extract_selectolax,
+    'lxml': _extract_lxml,
+    'stdlib': _extract_stdlib,
+}
@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+持久化任务队列 - /api/jobs 使用的异步任务
+
+客户端提交任务后立即拿到 job_id，不用在 /api/execute 上同步等待限流队列；
+任务保存在SQLite（WAL模式）中，gunicorn重启后排队中的任务不会丢失。
+
+每个worker进程运行几个 JobDispatcher 线程，从数据库中领取任务，
+通过 GenericAPIService.execute_request 执行（经过共享限流器，所以整体仍是限流速率），
+再把结果写回数据库。
+
+任务状态: queued → running → done
+执行任务的进程退出时（gunicorn按max_requests回收worker、重启、崩溃），它名下 running 状态的任务中:
+- 只读请求（single_flight.is_read_request）重新放回队列
+- 写请求（批量作废、提交平台等）可能已经到达上游，不能重发，标记为 done，结果为"执行中断，结果未知"
+
+进程是否还在由每个进程启动时生成的 worker token 和心跳判断，容器重启后pid被重用也不会误判。
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+
+import config
+from single_flight import is_read_request
+
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+
+
+class JobQueueFull(Exception):
+    """排队中的任务数达到上限"""
+
+
+class JobStore:
+    """SQLite任务表（所有worker共用一个数据库文件）"""
+
+    def __init__(self, db_path):
+        """
+        Args:
+            db_path: SQLite数据库文件路径
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self._ensure_db()
+
+    @property
+    def token(self):
+        """当前进程的 worker token"""
+        return _process_token()
+
+    def _get_conn(self):
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _ensure_db(self):
+        """确保数据库和任务表存在"""
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+
+        conn = self._get_conn()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            ' id TEXT PRIMARY KEY,'
+            ' status TEXT NOT NULL,'
+            ' priority INTEGER NOT NULL,'
+            ' spec TEXT NOT NULL,'
+            ' result TEXT,'
+            ' owner_pid INTEGER,'
+            ' created_at REAL NOT NULL,'
+            ' started_at REAL,'
+            ' finished_at REAL,'
+            ' owner_token TEXT)'
+        )
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(jobs)')]
+        if 'owner_token' not in columns:
+            # 旧版本创建的数据库
+            conn.execute('ALTER TABLE jobs ADD COLUMN owner_token TEXT')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority, created_at)')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS job_workers ('
+            ' token TEXT PRIMARY KEY,'
+            ' pid INTEGER NOT NULL,'
+            ' heartbeat_at REAL NOT NULL)'
+        )
+
+    def heartbeat(self):
+        """记录当前进程仍在运行（执行任务的进程需要每 JOB_HEARTBEAT_INTERVAL 秒调用一次）"""
+        self._get_conn().execute(
+            'INSERT INTO job_workers (token, pid, heartbeat_at) VALUES (?, ?, ?)'
+            ' ON CONFLICT(token) DO UPDATE SET heartbeat_at = excluded.heartbeat_at',
+            (self.token, os.getpid(), time.time())
+        )
+
+    def submit(self, spec, priority=0, max_queued=None):
+        """
+        提交任务
+
+        Args:
+            spec: 请求描述（与 /api/execute 的参数相同）
+            priority: 优先级序号，越小越先执行
+            max_queued: 排队中任务数上限，None表示不限制
+
+        Returns:
+            str: job_id
+
+        Raises:
+            JobQueueFull: 排队中的任务数达到上限
+        """
+        job_id = uuid.uuid4().hex
+        conn = self._get_conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if max_queued is not None:
+                queued = conn.execute('SELECT COUNT(*) FROM jobs WHERE status = ?', (JOB_QUEUED,)).fetchone()[0]
+                if queued >= max_queued:
+                    raise JobQueueFull(f"任务队列已满 ({max_queued})")
+            conn.execute(
+                'INSERT INTO jobs (id, status, priority, spec, created_at) VALUES (?, ?, ?, ?, ?)',
+                (job_id, JOB_QUEUED, priority, json.dumps(spec, ensure_ascii=False), time.time())
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return job_id
+
+    def claim(self):
+        """
+        领取一个排队中的任务（优先级高的、先提交的先领取）
+
+        Returns:
+            tuple 或 None: (job_id, spec)，没有任务时返回None
+        """
+        conn = self._get_conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT id, spec FROM jobs WHERE status = ? ORDER BY priority, created_at LIMIT 1',
+                (JOB_QUEUED,)
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    'UPDATE jobs SET status = ?, owner_pid = ?, owner_token = ?, started_at = ? WHERE id = ?',
+                    (JOB_RUNNING, os.getpid(), self.token, time.time(), row[0])
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def complete(self, job_id, result):
+        """保存任务结果"""
+        self._get_conn().execute(
+            'UPDATE jobs SET status = ?, result = ?, finished_at = ? WHERE id = ?',
+            (JOB_DONE, json.dumps(result, ensure_ascii=False), time.time(), job_id)
+        )
+
+    def get(self, job_id):
+        """
+        查询任务
+
+        Returns:
+            dict 或 None: {job_id, status, created_at, started_at, finished_at, result}
+        """
+        row = self._get_conn().execute(
+            'SELECT status, result, created_at, started_at, finished_at FROM jobs WHERE id = ?',
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, result, created_at, started_at, finished_at = row
+        return {
+            'job_id': job_id,
+            'status': status,
+            'created_at': created_at,
+            'started_at': started_at,
+            'finished_at': finished_at,
+            'result': json.loads(result) if result is not None else None
+        }
+
+    def requeue_orphans(self):
+        """
+        处理已退出进程名下的 running 任务: 只读请求放回队列，写请求标记为结果未知
+
+        Returns:
+            tuple: (放回队列的任务数, 标记为中断的写任务数)
+        """
+        conn = self._get_conn()
+        now = time.time()
+        owners = conn.execute(
+            'SELECT DISTINCT j.owner_pid, j.owner_token, w.pid, w.heartbeat_at FROM jobs j'
+            ' LEFT JOIN job_workers w ON w.token = j.owner_token WHERE j.status = ?',
+            (JOB_RUNNING,)
+        ).fetchall()
+        dead = [(pid, token) for pid, token, worker_pid, heartbeat_at in owners
+                if not self._owner_alive(pid, token, worker_pid, heartbeat_at, now)]
+
+        requeued = interrupted = 0
+        for pid, token in dead:
+            owner = 'owner_token = ?' if token is not None else 'owner_token IS NULL AND owner_pid = ?'
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = conn.execute(
+                    f'SELECT id, spec FROM jobs WHERE status = ? AND {owner}',
+                    (JOB_RUNNING, token if token is not None else pid)
+                ).fetchall()
+                for job_id, spec in rows:
+                    spec = json.loads(spec)
+                    if is_read_request(spec.get('method', 'POST'), spec.get('url', '')):
+                        conn.execute(
+                            'UPDATE jobs SET status = ?, owner_pid = NULL, owner_token = NULL, started_at = NULL'
+                            ' WHERE id = ?',
+                            (JOB_QUEUED, job_id)
+                        )
+                        requeued += 1
+                    else:
+                        conn.execute(
+                            'UPDATE jobs SET status = ?, result = ?, finished_at = ? WHERE id = ?',
+                            (JOB_DONE, json.dumps(_interrupted_result(spec), ensure_ascii=False), now, job_id)
+                        )
+                        interrupted += 1
+                if token is not None:
+                    conn.execute('DELETE FROM job_workers WHERE token = ?', (token,))
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+        conn.execute('DELETE FROM job_workers WHERE heartbeat_at < ?', (now - 10 * config.JOB_WORKER_TIMEOUT,))
+        return requeued, interrupted
+
+    def _owner_alive(self, pid, token, worker_pid, heartbeat_at, now):
+        """执行任务的进程是否仍在运行"""
+        if token is None:
+            # 旧版本领取的任务只记录了pid
+            return pid is None or _pid_alive(pid)
+        if token == self.token:
+            return True
+        if worker_pid is None or heartbeat_at is None or now - heartbeat_at > config.JOB_WORKER_TIMEOUT:
+            return False
+        # pid已经属于当前进程（容器重启后pid被重用），或者进程已经不存在
+        return worker_pid != os.getpid() and _pid_alive(worker_pid)
+
+    def purge(self, older_than):
+        """
+        删除已完成的旧任务
+
+        Args:
+            older_than: 完成时间早于多少秒前的任务会被删除
+
+        Returns:
+            int: 删除的任务数
+        """
+        cursor = self._get_conn().execute(
+            'DELETE FROM jobs WHERE status = ? AND finished_at < ?',
+            (JOB_DONE, time.time() - older_than)
+        )
+        return cursor.rowcount
+
+    def counts(self):
+        """各状态的任务数"""
+        rows = self._get_conn().execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall()
+        result = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_DONE: 0}
+        result.update(dict(rows))
+        return result
+
+
+_token = None
+_token_pid = None
+
+
+def _process_token():
+    """当前进程的 worker token（每次进程启动生成一个，fork后的子进程重新生成）"""
+    global _token, _token_pid
+    if _token_pid != os.getpid():
+        _token = uuid.uuid4().hex
+        _token_pid = os.getpid()
+    return _token
+
+
+def _interrupted_result(spec):
+    """写任务执行中断时的结果（请求可能已经到达上游，不自动重发）"""
+    return {
+        'success': False,
+        'interrupted': True,
+        'error': '任务执行中断（worker进程退出），请求可能已经发往上游，结果未知，请确认后再决定是否重新提交',
+        'request_info': {
+            'url': spec.get('url'),
+            'method': spec.get('method', 'POST')
+        }
+    }
+
+
+def _pid_alive(pid):
+    """进程是否存在（任务数据库只在本机共享，pid可以直接检查；pid可能被重用，需要配合心跳判断）"""
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobDispatcher:
+    """在后台线程中领取并执行任务"""
+
+    def __init__(self, store, execute, threads=None, poll_interval=None):
+        """
+        Args:
+            store: JobStore
+            execute: 函数 execute(spec) -> 结果dict
+            threads: 执行线程数
+            poll_interval: 队列为空时检查新任务的间隔（秒）
+        """
+        self.store = store
+        self.execute = execute
+        self.threads = config.JOB_DISPATCHERS if threads is None else threads
+        self.poll_interval = config.JOB_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.completed = 0
+        self.running = 0
+        self._wakeup = threading.Event()
+        self._started = False
+        self._lock = threading.Lock()
+
+    def start(self):
+        """启动后台线程（重复调用无影响）"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+
+        self.store.heartbeat()
+        report_orphans('JobDispatcher', *self.store.requeue_orphans())
+        for i in range(self.threads):
+            threading.Thread(target=self._run, name=f'job-dispatcher-{i}', daemon=True).start()
+        threading.Thread(target=self._housekeeping, name='job-housekeeping', daemon=True).start()
+        print(f"[JobDispatcher] ✓ 已启动 {self.threads} 个任务执行线程")
+
+    def notify(self):
+        """有新任务提交时唤醒空闲线程"""
+        self._wakeup.set()
+
+    def _run(self):
+        while True:
+            try:
+                job = self.store.claim()
+            except sqlite3.Error as e:
+                print(f"[JobDispatcher] ⚠️  领取任务失败: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            job_id, spec = job
+            with self._lock:
+                self.running += 1
+            try:
+                try:
+                    result = self.execute(spec)
+                except Exception as e:
+                    result = {'success': False, 'error': f'未知错误: {str(e)}'}
+                self.store.complete(job_id, result)
+                with self._lock:
+                    self.completed += 1
+            except sqlite3.Error as e:
+                # 结果没写进去，任务保持running，进程退出后按 requeue_orphans 的规则处理
+                print(f"[JobDispatcher] ⚠️  保存任务结果失败: {job_id} ({e})")
+            finally:
+                with self._lock:
+                    self.running -= 1
+
+    def _housekeeping(self):
+        """定期发送心跳、回收中断的任务、清理过期结果"""
+        last_cleanup = time.monotonic()
+        while True:
+            time.sleep(config.JOB_HEARTBEAT_INTERVAL)
+            try:
+                self.store.heartbeat()
+                if time.monotonic() - last_cleanup >= 60:
+                    last_cleanup = time.monotonic()
+                    report_orphans('JobDispatcher', *self.store.requeue_orphans())
+                    self.store.purge(config.JOB_RESULT_TTL)
+            except sqlite3.Error as e:
+                print(f"[JobDispatcher] ⚠️  任务清理失败: {e}")
+
+    def stats(self):
+        """任务统计信息"""
+        with self._lock:
+            running, completed = self.running, self.completed
+        return {
+            'jobs': self.store.counts(),
+            'dispatchers': self.threads,
+            'running_in_worker': running,
+            'completed_in_worker': completed
+        }
+
+
+def report_orphans(source, requeued, interrupted):
+    """打印 requeue_orphans 的处理结果"""
+    if requeued:
+        print(f"[{source}] ✓ 重新排队 {requeued} 个中断的只读任务")
+    if interrupted:
+        print(f"[{source}] ⚠️  {interrupted} 个写任务执行中断，已标记为结果未知（不会自动重发）")
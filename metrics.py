@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+监控指标 - Prometheus文本格式的 /metrics，跨gunicorn worker汇总
+
+每个进程在内存中累计计数器和直方图（metrics.inc / metrics.observe），
+后台线程每隔 METRICS_FLUSH_INTERVAL 秒把快照写到 METRICS_DIR/<pid>.json。
+抓取 /metrics 时，处理请求的worker先写出自己的最新快照，再汇总目录下所有快照：
+
+- 计数器、直方图: 所有worker相加；已退出worker的快照合并进 archive.json 后删除，
+  worker重启不会让累计值变小
+- 每个worker的瞬时值（队列深度、进行中的请求）: 只汇总仍在运行的worker
+- 全局瞬时值（Cookie年龄、任务队列长度）: 抓取时由当前进程直接计算
+"""
+import os
+import json
+import time
+import fcntl
+import threading
+from urllib.parse import urlsplit
+
+import config
+
+
+# 指标定义: 名称 -> (类型, 说明)
+METRIC_DEFINITIONS = {
+    'dxm_upstream_requests_total': ('counter', '发往店小秘的请求数（按接口路径和状态码）'),
+    'dxm_upstream_latency_seconds': ('histogram', '店小秘接口响应时间（秒）'),
+    'dxm_upstream_busy_total': ('counter', '店小秘返回"系统繁忙"等限流关键词的次数'),
+    'dxm_upstream_retries_total': ('counter', '上游繁忙后重新发送的请求数（按接口路径）'),
+    'dxm_limiter_wait_seconds': ('histogram', '请求在限流器中排队等待的时间（秒）'),
+    'dxm_limiter_rejected_total': ('counter', '预计排队时间超过max_wait被拒绝(429)的请求数'),
+    'dxm_limiter_tokens_total': ('counter', '领取的限流令牌数（按端点族，重接口一个请求消耗多个令牌）'),
+    'dxm_deadline_shed_total': ('counter', '超过调用方截止时间、没有发往上游就丢弃的请求数（按阶段）'),
+    'dxm_cache_requests_total': ('counter', '可缓存请求的缓存结果（hit/miss/bypass）'),
+    'dxm_single_flight_coalesced_total': ('counter', '合并到进行中相同请求的重复请求数'),
+    'dxm_cookie_reloads_total': ('counter', 'Cookie文件重新解析次数'),
+    'dxm_cookie_downloads_total': ('counter', '从COS下载Cookie的次数（按结果）'),
+    'dxm_queue_depth': ('gauge', '在限流队列中等待的请求数'),
+    'dxm_in_flight_requests': ('gauge', '正在等待上游响应的请求数'),
+    'dxm_cookie_age_seconds': ('gauge', '各账号Cookie文件距上次下载的秒数'),
+    'dxm_jobs': ('gauge', '异步任务数（按状态）'),
+    'dxm_rate_limit_rate': ('gauge', '当前限流速率（次/秒，自适应限流会调整）'),
+    'dxm_workers': ('gauge', '上报指标的worker进程数'),
+    'dxm_client_requests_total': ('counter', '各客户端领到令牌(served)和被拒绝(rejected)的请求数'),
+    'dxm_client_queue_wait_seconds': ('histogram', '各客户端请求的排队时间（秒）'),
+    'dxm_client_waiting': ('gauge', '各客户端正在排队的请求数'),
+    'dxm_client_in_flight': ('gauge', '各客户端已放行、尚未完成的请求数'),
+}
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+WAIT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+HISTOGRAM_BUCKETS = {
+    'dxm_upstream_latency_seconds': LATENCY_BUCKETS,
+    'dxm_limiter_wait_seconds': WAIT_BUCKETS,
+    'dxm_client_queue_wait_seconds': WAIT_BUCKETS,
+}
+
+
+_failed_gauges = set()
+
+
+def _gauge_failed(name, error):
+    """瞬时值计算失败时打印一次（之后同一个指标的失败不再打印，避免每次抓取刷屏）"""
+    if name not in _failed_gauges:
+        _failed_gauges.add(name)
+        print(f"[Metrics] ⚠️  指标 {name} 计算失败，已跳过: {type(error).__name__}: {error}")
+
+
+def _label_key(labels):
+    """标签dict -> 可作为dict键的有序元组"""
+    return tuple(sorted((labels or {}).items()))
+
+
+class MetricsRegistry:
+    """进程内的指标存储"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [每个桶的次数..., +Inf次数, sum]
+        self._gauges = {}      # name -> 函数，返回 {labels元组: 值}
+
+    def inc(self, name, labels=None, value=1):
+        """计数器加value"""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=None):
+        """直方图记录一次观测值"""
+        buckets = HISTOGRAM_BUCKETS[name]
+        index = len(buckets)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                index = i
+                break
+        key = (name, _label_key(labels))
+        with self._lock:
+            data = self._histograms.get(key)
+            if data is None:
+                data = self._histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+            data[index] += 1
+            data[-1] += value
+
+    def register_gauge(self, name, func):
+        """
+        注册每个worker的瞬时值（快照时调用）
+
+        Args:
+            name: 指标名
+            func: 无参数函数，返回数值或 {标签dict的元组: 数值}
+        """
+        self._gauges[name] = func
+
+    def snapshot(self):
+        """
+        当前进程的指标快照（可JSON序列化）
+
+        Returns:
+            dict: {'counters': [...], 'histograms': [...], 'gauges': [...]}
+        """
+        with self._lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self._counters.items()]
+            histograms = [[name, list(labels), list(data)] for (name, labels), data in self._histograms.items()]
+
+        gauges = []
+        for name, func in list(self._gauges.items()):
+            try:
+                value = func()
+            except Exception as e:
+                _gauge_failed(name, e)
+                continue
+            if isinstance(value, dict):
+                gauges.extend([name, list(labels), v] for labels, v in value.items())
+            else:
+                gauges.append([name, [], value])
+        return {'counters': counters, 'histograms': histograms, 'gauges': gauges}
+
+
+def _merge_into(total, snapshot, include_gauges=True):
+    """把一个快照累加到汇总结果中"""
+    for name, labels, value in snapshot.get('counters', []):
+        key = (name, tuple(tuple(item) for item in labels))
+        total['counters'][key] = total['counters'].get(key, 0) + value
+    for name, labels, data in snapshot.get('histograms', []):
+        key = (name, tuple(tuple(item) for item in labels))
+        current = total['histograms'].get(key)
+        if current is None or len(current) != len(data):
+            total['histograms'][key] = list(data)
+        else:
+            total['histograms'][key] = [a + b for a, b in zip(current, data)]
+    if include_gauges:
+        for name, labels, value in snapshot.get('gauges', []):
+            key = (name, tuple(tuple(item) for item in labels))
+            total['gauges'][key] = total['gauges'].get(key, 0) + value
+
+
+def _to_snapshot(total):
+    """汇总结果 -> 快照格式（用于写archive.json）"""
+    return {
+        'counters': [[name, [list(l) for l in labels], value] for (name, labels), value in total['counters'].items()],
+        'histograms': [[name, [list(l) for l in labels], data] for (name, labels), data in total['histograms'].items()],
+        'gauges': []
+    }
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class MultiprocessCollector:
+    """把各worker的快照写到共享目录，抓取时汇总"""
+
+    ARCHIVE = 'archive.json'
+
+    def __init__(self, registry, directory, interval=None):
+        """
+        Args:
+            registry: MetricsRegistry
+            directory: 快照目录（同一个服务的所有worker必须相同）
+            interval: 后台写快照的间隔（秒）
+        """
+        self.registry = registry
+        self.directory = directory
+        self.interval = config.METRICS_FLUSH_INTERVAL if interval is None else interval
+        self._global_gauges = {}
+        self._started_pid = None
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def register_global_gauge(self, name, func):
+        """注册全局瞬时值（抓取时由当前进程计算，不按worker相加）"""
+        self._global_gauges[name] = func
+
+    def start(self):
+        """启动后台写快照线程（fork后的新进程会重新启动）"""
+        with self._lock:
+            if self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"[Metrics] ⚠️  写入指标快照失败: {e}")
+
+    def flush(self):
+        """把当前进程的快照原子地写到 <pid>.json"""
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.registry.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _read(self, path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def collect(self):
+        """
+        汇总所有worker的指标
+
+        Returns:
+            dict: {'counters': {...}, 'histograms': {...}, 'gauges': {...}, 'workers': 运行中的worker数}
+        """
+        self.flush()
+        total = {'counters': {}, 'histograms': {}, 'gauges': {}}
+
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                archive_path = os.path.join(self.directory, self.ARCHIVE)
+                archive = {'counters': {}, 'histograms': {}, 'gauges': {}}
+                _merge_into(archive, self._read(archive_path) or {})
+
+                # 已退出worker的计数器并入archive，保证累计值不会变小
+                dead = []
+                live = []
+                for filename in os.listdir(self.directory):
+                    if not filename.endswith('.json') or filename == self.ARCHIVE:
+                        continue
+                    try:
+                        pid = int(filename[:-5])
+                    except ValueError:
+                        continue
+                    (live if _pid_alive(pid) else dead).append(filename)
+
+                if dead:
+                    for filename in dead:
+                        snapshot = self._read(os.path.join(self.directory, filename))
+                        if snapshot:
+                            _merge_into(archive, snapshot, include_gauges=False)
+                    tmp_path = f'{archive_path}.tmp'
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        json.dump(_to_snapshot(archive), f)
+                    os.replace(tmp_path, archive_path)
+                    for filename in dead:
+                        os.remove(os.path.join(self.directory, filename))
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        _merge_into(total, _to_snapshot(archive), include_gauges=False)
+        workers = 0
+        for filename in live:
+            snapshot = self._read(os.path.join(self.directory, filename))
+            if snapshot:
+                _merge_into(total, snapshot)
+                workers += 1
+
+        for name, func in self._global_gauges.items():
+            try:
+                value = func()
+            except Exception as e:
+                _gauge_failed(name, e)
+                continue
+            values = value if isinstance(value, dict) else {(): value}
+            for labels, v in values.items():
+                total['gauges'][(name, tuple(labels))] = v
+        total['gauges'][('dxm_workers', ())] = workers
+        return total
+
+    def render(self):
+        """
+        Prometheus文本格式 (text/plain; version=0.0.4)
+
+        Returns:
+            str
+        """
+        total = self.collect()
+        series = {}
+        for (name, labels), value in sorted(total['counters'].items()):
+            series.setdefault(name, []).append(_line(name, labels, value))
+        for (name, labels), value in sorted(total['gauges'].items()):
+            series.setdefault(name, []).append(_line(name, labels, value))
+        for (name, labels), data in sorted(total['histograms'].items()):
+            buckets = HISTOGRAM_BUCKETS.get(name)
+            if buckets is None or len(data) != len(buckets) + 2:
+                continue
+            lines = series.setdefault(name, [])
+            running = 0
+            for bound, count in zip(buckets, data):
+                running += count
+                lines.append(_line(f'{name}_bucket', labels + (('le', repr(bound)),), running))
+            count = running + data[len(buckets)]
+            lines.append(_line(f'{name}_bucket', labels + (('le', '+Inf'),), count))
+            lines.append(_line(f'{name}_sum', labels, data[-1]))
+            lines.append(_line(f'{name}_count', labels, count))
+
+        output = []
+        for name in sorted(series):
+            metric_type, help_text = METRIC_DEFINITIONS.get(name, ('untyped', name))
+            output.append(f'# HELP {name} {help_text}')
+            output.append(f'# TYPE {name} {metric_type}')
+            output.extend(series[name])
+        return '\n'.join(output) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_value(value):
+    """整数不带小数点，浮点数保留完整精度"""
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _line(name, labels, value):
+    """一行样本: name{k="v"} value"""
+    if labels:
+        label_text = ','.join(f'{k}="{_escape(v)}"' for k, v in labels)
+        return f'{name}{{{label_text}}} {_format_value(value)}'
+    return f'{name} {_format_value(value)}'
+
+
+# ==================== 进程内全局指标 ====================
+
+REGISTRY = MetricsRegistry()
+
+_known_paths = set()
+_paths_lock = threading.Lock()
+
+
+def path_label(url):
+    """
+    把URL转换为接口路径标签（去掉查询参数；不同路径数超过上限时归为 'other'，避免标签无限增长）
+    """
+    path = urlsplit(url).path or '/'
+    with _paths_lock:
+        if path in _known_paths:
+            return path
+        if len(_known_paths) >= config.METRICS_MAX_PATHS:
+            return 'other'
+        _known_paths.add(path)
+    return path
+
+
+def inc(name, labels=None, value=1):
+    """计数器加value（全局registry）"""
+    REGISTRY.inc(name, labels, value)
+
+
+def observe(name, value, labels=None):
+    """直方图记录观测值（全局registry）"""
+    REGISTRY.observe(name, value, labels)
+
+
+def create_collector(service_name):
+    """
+    创建跨worker的指标汇总器
+
+    Args:
+        service_name: 服务名（Flask和asyncio服务器使用不同的快照目录）
+
+    Returns:
+        MultiprocessCollector
+    """
+    return MultiprocessCollector(REGISTRY, os.path.join(config.METRICS_DIR, service_name))
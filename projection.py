@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+字段投影 - 代理服务器在返回前只保留调用方需要的JSON字段
+
+大多数调用方只需要整页JSON中的几个字段（订单ID、包裹号……），
+请求中带上 select 后，代理在返回前裁剪 response，减少传输量和客户端解析时间。
+
+select 语法: 逗号分隔的字段路径（也可以是路径列表）
+    - 用 . 分隔层级:             data.page.totalSize
+    - 字段名后加 [] 表示对列表中的每个元素继续选择:  data.page.list[].id
+    - 路径停在哪一层就保留整个值:  data.page.list[]  （保留整个列表）
+
+结果保持原来的嵌套结构，只是去掉了没有选择的字段，调用方访问路径不变:
+    select="data.page.list[].id,data.page.totalSize"
+    {"data": {"page": {"list": [{"id": 1}, {"id": 2}], "totalSize": 2}}}
+
+不存在的字段直接省略；只对JSON响应生效，文本响应原样返回。
+"""
+import re
+
+import config
+
+
+_SEGMENT = re.compile(r'([^.\[\]\s]+)(\[\])?')
+
+
+def compile_select(select):
+    """
+    解析select表达式为选择树
+
+    Args:
+        select: 'a.b,c[].d' 形式的字符串，或路径字符串列表
+
+    Returns:
+        dict: {字段名: [是否遍历列表, 子选择树或None（保留整个值）]}
+
+    Raises:
+        ValueError: 表达式格式错误
+    """
+    if isinstance(select, str):
+        paths = select.split(',')
+    elif isinstance(select, (list, tuple)) and all(isinstance(path, str) for path in select):
+        paths = list(select)
+    else:
+        raise ValueError("select 必须是逗号分隔的字段路径字符串或路径列表")
+
+    paths = [path.strip() for path in paths if path.strip()]
+    if not paths:
+        raise ValueError("select 不能为空")
+    if len(paths) > config.SELECT_MAX_PATHS:
+        raise ValueError(f"select 字段路径过多: {len(paths)} > {config.SELECT_MAX_PATHS}")
+
+    tree = {}
+    for path in paths:
+        segments = path.split('.')
+        node = tree
+        for depth, segment in enumerate(segments):
+            match = _SEGMENT.fullmatch(segment)
+            if not match:
+                raise ValueError(f"无效的字段路径: {path}")
+            key, each = match.group(1), match.group(2) is not None
+
+            child = node.get(key)
+            if child is None:
+                child = node[key] = [each, {}]
+            elif child[0] != each:
+                raise ValueError(f"字段 {key} 在不同路径中的写法冲突（带[]与不带[]）: {path}")
+
+            if depth == len(segments) - 1:
+                child[1] = None  # 选择整个值，覆盖更深的路径
+                break
+            if child[1] is None:
+                break  # 已经选择了整个值
+            node = child[1]
+    return tree
+
+
+def project(value, tree):
+    """
+    按选择树裁剪JSON值
+
+    Args:
+        value: 解析后的JSON（顶层应为对象）
+        tree: compile_select() 的结果
+
+    Returns:
+        裁剪后的值；顶层不是对象时返回None
+    """
+    return _take(value, tree)
+
+
+def _take(value, children):
+    if children is None:
+        return value
+    if not isinstance(value, dict):
+        return None
+
+    result = {}
+    for key, (each, grandchildren) in children.items():
+        if key not in value:
+            continue
+        item = value[key]
+        if each:
+            if isinstance(item, list):
+                result[key] = [_take(element, grandchildren) for element in item]
+        else:
+            result[key] = _take(item, grandchildren)
+    return result
+
+
+def apply_select(result, tree):
+    """
+    对 execute_request 的结果应用字段投影（不修改原结果，缓存中的完整响应不受影响）
+
+    Args:
+        result: execute_request 的结果dict
+        tree: compile_select() 的结果
+
+    Returns:
+        dict: response 被裁剪后的结果副本；非JSON或失败的结果原样返回
+    """
+    if not result.get('success') or result.get('response_type') != 'json':
+        return result
+    return dict(result, response=project(result['response'], tree))
@@ -0,0 +1,703 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+限流器 - 进程内限流器与跨进程共享令牌桶
+
+gunicorn会启动多个worker进程，进程内的RateLimiter只能限制单个worker，
+SharedRateLimiter把令牌桶状态保存在SQLite文件中，所有worker共用同一个预算。
+
+两种限流器都是预约式的：在锁内预约下一个令牌，在锁外sleep，
+并把每次请求的排队时间记录到直方图中。
+
+PriorityLimiter 在限流器外面加了优先级通道，交互请求不会被批量任务堵在后面。
+"""
+import os
+import abc
+import time
+import sqlite3
+import threading
+from threading import Lock
+
+import config
+
+
+class RateLimitExceeded(Exception):
+    """预计排队时间超过调用方允许的上限"""
+
+    def __init__(self, retry_after):
+        """
+        Args:
+            retry_after: 需要等待的秒数（建议客户端在这之后重试）
+        """
+        self.retry_after = retry_after
+        super().__init__(f"达到速率限制，需要等待 {retry_after:.2f} 秒")
+
+
+class WaitHistogram:
+    """排队等待时间直方图（秒）"""
+
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个是 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.lock = Lock()
+
+    def observe(self, value):
+        """记录一次等待时间"""
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: {'buckets': {上界: 累计次数}, 'count': 总次数, 'sum': 总等待秒数}
+        """
+        with self.lock:
+            counts = list(self.counts)
+            total = self.count
+            total_sum = self.sum
+
+        cumulative = {}
+        running = 0
+        for bound, c in zip(self.buckets, counts):
+            running += c
+            cumulative[str(bound)] = running
+        cumulative['+Inf'] = total
+        return {'buckets': cumulative, 'count': total, 'sum': round(total_sum, 6)}
+
+
+class _ReservationLimiter(abc.ABC):
+    """
+    预约式限流器基类
+
+    子类实现 reserve()：在锁内原子地预约下一个可用令牌并返回需要等待的秒数，
+    调用方在锁外sleep，其他线程不会被正在等待的线程阻塞。
+    """
+
+    def __init__(self):
+        self.wait_histogram = WaitHistogram()
+        self.rejected = 0
+
+    @abc.abstractmethod
+    def reserve(self, max_wait=None, cost=1.0):
+        """预约令牌，返回需要等待的秒数；需要等待的时间超过 max_wait 时抛出 RateLimitExceeded"""
+
+    @abc.abstractmethod
+    def refund(self, cost=1.0):
+        """归还已预约但没有使用的令牌"""
+
+    def wait_if_needed(self, max_wait=None, cost=1.0):
+        """
+        预约令牌，如果需要则在锁外等待
+
+        Args:
+            max_wait: 最长允许的排队时间（秒），None表示一直等待
+            cost: 消耗的令牌数
+
+        Returns:
+            float: 实际排队等待的秒数
+
+        Raises:
+            RateLimitExceeded: 预计等待时间超过 max_wait（不会消耗令牌）
+        """
+        try:
+            sleep_time = self.reserve(max_wait, cost)
+        except RateLimitExceeded:
+            self.rejected += 1
+            raise
+
+        if sleep_time > 0:
+            time.sleep(sleep_time)
+        self.wait_histogram.observe(sleep_time)
+        return sleep_time
+
+    def stats(self):
+        """限流器统计信息"""
+        return {
+            'backend': type(self).__name__,
+            'rate': self.rate,
+            'capacity': self.capacity,
+            'rejected': self.rejected,
+            'queue_wait': self.wait_histogram.snapshot()
+        }
+
+
+class RateLimiter(_ReservationLimiter):
+    """速率限制器 - 8次/秒（进程内令牌桶）"""
+
+    def __init__(self, max_calls=8, time_window=1.0):
+        """
+        Args:
+            max_calls: 时间窗口内最大调用次数（同时也是突发容量）
+            time_window: 时间窗口（秒）
+        """
+        super().__init__()
+        self.max_calls = max_calls
+        self.time_window = time_window
+        self.rate = max_calls / time_window
+        self.base_rate = self.rate
+        self.capacity = float(max_calls)
+        self.tokens = self.capacity
+        self.last_update = time.monotonic()
+        self.rate_changed_at = 0.0
+        self.lock = Lock()
+
+    def reserve(self, max_wait=None, cost=1.0):
+        """
+        预约令牌
+
+        令牌不足时余额记为负数（预约未来的令牌），后来的调用方依次排在后面。
+
+        Args:
+            max_wait: 最长允许的排队时间（秒），None表示不限制
+            cost: 消耗的令牌数（重接口消耗多个，见 request_cost.py）
+
+        Returns:
+            float: 调用方需要等待的秒数，0表示立即可用
+
+        Raises:
+            RateLimitExceeded: 需要等待的时间超过 max_wait
+        """
+        with self.lock:
+            now = time.monotonic()
+            tokens = min(self.capacity, self.tokens + (now - self.last_update) * self.rate)
+            sleep_time = (cost - tokens) / self.rate if tokens < cost else 0.0
+
+            if max_wait is not None and sleep_time > max_wait:
+                raise RateLimitExceeded(sleep_time)
+
+            self.tokens = tokens - cost
+            self.last_update = now
+
+        return sleep_time
+
+    def refund(self, cost=1.0):
+        """归还已预约但没有使用的令牌（同一个请求在另一个令牌桶被拒绝）"""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last_update) * self.rate + cost)
+            self.last_update = now
+
+    def adjust_rate(self, decide):
+        """
+        原子地调整速率
+
+        Args:
+            decide: 函数 decide(rate, rate_changed_at, now) -> 新速率，None表示不调整
+                    （时间均为 time.time() 秒）
+
+        Returns:
+            tuple: (当前速率, 上次调整时间)
+        """
+        with self.lock:
+            wall_now = time.time()
+            new_rate = decide(self.rate, self.rate_changed_at, wall_now)
+            if new_rate is not None and new_rate != self.rate:
+                # 先按旧速率补充令牌，再切换速率
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_update) * self.rate)
+                self.last_update = now
+                self.rate = float(new_rate)
+                self.rate_changed_at = wall_now
+            return self.rate, self.rate_changed_at
+
+
+class SharedRateLimiter(_ReservationLimiter):
+    """
+    跨进程共享的令牌桶限流器 - 基于SQLite文件锁
+
+    - 速率: rate 个令牌/秒
+    - 容量: capacity 个令牌（允许短时间突发）
+    - 每次调用在 BEGIN IMMEDIATE 事务中预约一个令牌，令牌不足时
+      余额记为负数（即预约未来的令牌），等待在事务提交后进行，
+      不会在持有文件锁时sleep
+    """
+
+    def __init__(self, db_path, name='default', rate=8.0, capacity=8, keep_rate=False):
+        """
+        Args:
+            db_path: SQLite数据库文件路径（所有worker必须相同）
+            name: 令牌桶名称，同一个数据库中可以存放多个桶
+            rate: 配置的速率（每秒生成的令牌数），新建桶或配置变化时使用
+            capacity: 桶的最大容量
+            keep_rate: 桶已存在且配置的速率没有变化时沿用数据库中的速率
+                       （自适应限流调整过的速率不会因为worker重启而被重置）
+        """
+        super().__init__()
+        self.db_path = db_path
+        self.name = name
+        self.rate = float(rate)
+        self.base_rate = float(rate)
+        self.capacity = float(capacity)
+        self.keep_rate = keep_rate
+        self._local = threading.local()
+        self._ensure_db()
+
+    def _ensure_db(self):
+        """确保数据库和令牌桶记录存在"""
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+
+        conn = self._get_conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS token_bucket ('
+                ' name TEXT PRIMARY KEY,'
+                ' tokens REAL NOT NULL,'
+                ' last_update REAL NOT NULL,'
+                ' rate REAL NOT NULL,'
+                ' capacity REAL NOT NULL,'
+                ' rate_changed_at REAL NOT NULL DEFAULT 0,'
+                ' base_rate REAL)'
+            )
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(token_bucket)')]
+            if 'rate_changed_at' not in columns:
+                # 旧版本创建的数据库
+                conn.execute('ALTER TABLE token_bucket ADD COLUMN rate_changed_at REAL NOT NULL DEFAULT 0')
+            if 'base_rate' not in columns:
+                conn.execute('ALTER TABLE token_bucket ADD COLUMN base_rate REAL')
+
+            row = conn.execute('SELECT rate, base_rate FROM token_bucket WHERE name = ?', (self.name,)).fetchone()
+            if row is None:
+                conn.execute(
+                    'INSERT INTO token_bucket (name, tokens, last_update, rate, capacity, base_rate)'
+                    ' VALUES (?, ?, ?, ?, ?, ?)',
+                    (self.name, self.capacity, time.time(), self.rate, self.capacity, self.base_rate)
+                )
+            elif self.keep_rate and row[1] == self.base_rate:
+                # 配置没有变化: 沿用当前余额和（自适应调整过的）速率，只更新容量
+                self.rate = row[0]
+                conn.execute('UPDATE token_bucket SET capacity = ? WHERE name = ?', (self.capacity, self.name))
+            else:
+                # 配置的速率变了（或旧版本的数据库没有记录）: 沿用当前余额，速率回到配置值
+                if self.keep_rate and row[0] != self.rate:
+                    print(f"[RateLimiter] ✓ 令牌桶 {self.name} 的配置速率变为 {self.rate:g}，"
+                          f"不再沿用之前的 {row[0]:g}")
+                conn.execute(
+                    'UPDATE token_bucket SET rate = ?, base_rate = ?, capacity = ?, rate_changed_at = ?'
+                    ' WHERE name = ?',
+                    (self.rate, self.base_rate, self.capacity, time.time(), self.name)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _get_conn(self):
+        """获取当前线程的数据库连接（sqlite3连接不能跨线程共享）"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def reserve(self, max_wait=None, cost=1.0):
+        """
+        预约令牌
+
+        Args:
+            max_wait: 最长允许的排队时间（秒），None表示不限制
+            cost: 消耗的令牌数
+
+        Returns:
+            float: 调用方需要等待的秒数，0表示立即可用
+
+        Raises:
+            RateLimitExceeded: 需要等待的时间超过 max_wait
+        """
+        conn = self._get_conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, last_update, rate, capacity FROM token_bucket WHERE name = ?',
+                (self.name,)
+            ).fetchone()
+            tokens, last_update, rate, capacity = row
+            self.rate = rate
+            now = time.time()
+
+            # 补充令牌
+            tokens = min(capacity, tokens + max(0.0, now - last_update) * rate)
+            sleep_time = (cost - tokens) / rate if tokens < cost else 0.0
+
+            if max_wait is not None and sleep_time > max_wait:
+                conn.execute('ROLLBACK')
+                raise RateLimitExceeded(sleep_time)
+
+            tokens -= cost
+            conn.execute(
+                'UPDATE token_bucket SET tokens = ?, last_update = ? WHERE name = ?',
+                (tokens, now, self.name)
+            )
+            conn.execute('COMMIT')
+        except RateLimitExceeded:
+            raise
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        return sleep_time
+
+    def refund(self, cost=1.0):
+        """归还已预约但没有使用的令牌（同一个请求在另一个令牌桶被拒绝）"""
+        conn = self._get_conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            conn.execute(
+                'UPDATE token_bucket SET tokens = MIN(capacity, tokens + MAX(0.0, ? - last_update) * rate + ?),'
+                ' last_update = ? WHERE name = ?',
+                (now, cost, now, self.name)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def adjust_rate(self, decide):
+        """
+        原子地调整共享令牌桶的速率（所有worker立即生效）
+
+        Args:
+            decide: 函数 decide(rate, rate_changed_at, now) -> 新速率，None表示不调整
+
+        Returns:
+            tuple: (当前速率, 上次调整时间)
+        """
+        conn = self._get_conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            tokens, last_update, rate, capacity, changed_at = conn.execute(
+                'SELECT tokens, last_update, rate, capacity, rate_changed_at FROM token_bucket WHERE name = ?',
+                (self.name,)
+            ).fetchone()
+            now = time.time()
+            new_rate = decide(rate, changed_at, now)
+            if new_rate is not None and new_rate != rate:
+                # 先按旧速率补充令牌，再切换速率
+                tokens = min(capacity, tokens + max(0.0, now - last_update) * rate)
+                rate, changed_at = float(new_rate), now
+                conn.execute(
+                    'UPDATE token_bucket SET tokens = ?, last_update = ?, rate = ?, rate_changed_at = ?'
+                    ' WHERE name = ?',
+                    (tokens, now, rate, changed_at, self.name)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        self.rate = rate
+        return rate, changed_at
+
+
+class PriorityLimiter:
+    """
+    优先级通道 - 在同一个令牌预算内区分交互请求和批量请求（严格优先级）
+
+    - 最高优先级通道直接预约令牌，可以预约未来的令牌（与普通限流器相同）
+    - 低优先级通道只领取 horizon 秒内就能用上的令牌，领不到就稍后重试，
+      不在令牌桶里提前占位，所以后到的高优先级请求总是排在它们前面；
+      令牌桶是所有worker共享的，这个规则跨进程同样有效
+    - 每个低优先级通道在进程内同一时间只有队首一个请求去领令牌，其余请求按先后排队
+    - 指定了 fair（fair_queue.FairScheduler）且请求带有客户端名时，每个通道内按客户端加权公平排队，
+      由公平排队的队首去领令牌
+    - 每个请求可以消耗多个令牌（cost），属于某个端点族（family）的请求还要从该族的子令牌桶领取令牌
+    """
+
+    def __init__(self, limiter, lanes=None, default_lane=None, horizon=None, poll_interval=None, fair=None,
+                 families=None):
+        """
+        Args:
+            limiter: RateLimiter 或 SharedRateLimiter
+            lanes: 通道名列表，按优先级从高到低排列
+            default_lane: 未指定优先级时使用的通道
+            horizon: 低优先级通道可以预约的最远时间（秒）
+            poll_interval: 低优先级通道两次尝试之间的最长间隔（秒）
+            fair: FairScheduler，None表示通道内按到达顺序排队
+            families: {端点族: RateLimiter 或 SharedRateLimiter}，端点族的子预算
+        """
+        self.limiter = limiter
+        self.fair = fair
+        self.families = dict(families or {})
+        self.lanes = list(lanes or config.PRIORITY_LANES)
+        self.default_lane = default_lane or config.PRIORITY_DEFAULT
+        self.horizon = config.PRIORITY_LOW_HORIZON if horizon is None else horizon
+        self.poll_interval = config.PRIORITY_POLL_INTERVAL if poll_interval is None else poll_interval
+        self._heads = {lane: Lock() for lane in self.lanes[1:]}
+        self._lock = Lock()
+        self._lane_stats = {
+            lane: {'waiting': 0, 'served': 0, 'rejected': 0, 'histogram': WaitHistogram()}
+            for lane in self.lanes
+        }
+
+    @property
+    def rate(self):
+        return self.limiter.rate
+
+    @property
+    def capacity(self):
+        return self.limiter.capacity
+
+    def resolve(self, priority):
+        """
+        把请求中的优先级转换为通道名
+
+        Args:
+            priority: 通道名（不区分大小写），None表示默认通道
+
+        Returns:
+            str: 通道名
+
+        Raises:
+            ValueError: 未知的优先级
+        """
+        if priority is None or priority == '':
+            return self.default_lane
+        lane = str(priority).strip().lower()
+        if lane not in self._lane_stats:
+            raise ValueError(f"不支持的优先级: {priority}，可选值: {', '.join(self.lanes)}")
+        return lane
+
+    def rank(self, lane):
+        """通道的优先级序号，0最高"""
+        return self.lanes.index(lane)
+
+    def attempt(self, lane, remaining=None, cost=1.0, family=None):
+        """
+        为指定通道尝试领取一次令牌（不sleep）
+
+        Args:
+            lane: 通道名
+            remaining: 剩余可等待的秒数，None表示不限制
+            cost: 消耗的令牌数
+            family: 端点族，配置了子预算时同时从子令牌桶领取
+
+        Returns:
+            tuple: (sleep_time, retry_in)，领取成功时 retry_in 为None，
+                   低优先级通道领不到令牌时 sleep_time 为None，retry_in 为建议的重试间隔
+
+        Raises:
+            RateLimitExceeded: 预计等待时间超过 remaining
+        """
+        sub = self.families.get(family) if family else None
+        # 代价超过令牌桶容量时，低优先级通道永远攒不够令牌；按参与的令牌桶中最小的容量计
+        cost = min(cost, self.limiter.capacity, sub.capacity if sub is not None else cost)
+        if sub is None:
+            return self._attempt(self.limiter, lane, remaining, cost)
+
+        # 先领子预算，账号令牌桶领不到时把子预算的令牌还回去；两边都预约成功后等待较晚的那个
+        family_sleep, retry_in = self._attempt(sub, lane, remaining, cost)
+        if family_sleep is None:
+            return None, retry_in
+        try:
+            sleep_time, retry_in = self._attempt(self.limiter, lane, remaining, cost)
+        except RateLimitExceeded:
+            sub.refund(cost)
+            raise
+        if sleep_time is None:
+            sub.refund(cost)
+            return None, retry_in
+        return max(sleep_time, family_sleep), None
+
+    def _attempt(self, limiter, lane, remaining, cost):
+        """在一个令牌桶上按通道规则领取令牌（参数和返回值见 attempt）"""
+        if lane == self.lanes[0]:
+            return limiter.reserve(remaining, cost), None
+
+        horizon = self.horizon if remaining is None else min(self.horizon, remaining)
+        try:
+            return limiter.reserve(horizon, cost), None
+        except RateLimitExceeded as e:
+            # retry_after 只是下限（期间还可能有高优先级请求插队）
+            if remaining is not None and e.retry_after > remaining:
+                raise
+            return None, min(self.poll_interval, max(0.005, e.retry_after - self.horizon))
+
+    def enter(self, lane):
+        """请求进入通道"""
+        with self._lock:
+            self._lane_stats[lane]['waiting'] += 1
+
+    def leave(self, lane, waited=None):
+        """
+        请求离开通道
+
+        Args:
+            lane: 通道名
+            waited: 排队等待的秒数，None表示被拒绝
+        """
+        with self._lock:
+            stats = self._lane_stats[lane]
+            stats['waiting'] -= 1
+            if waited is None:
+                stats['rejected'] += 1
+            else:
+                stats['served'] += 1
+        if waited is None:
+            self.limiter.rejected += 1
+        else:
+            stats['histogram'].observe(waited)
+            self.limiter.wait_histogram.observe(waited)
+
+    def wait_if_needed(self, max_wait=None, priority=None, client=None, cost=1.0, family=None):
+        """
+        在指定通道中领取令牌，如果需要则等待
+
+        Args:
+            max_wait: 最长允许的排队时间（秒），None表示一直等待
+            priority: 通道名，None表示默认通道
+            client: 客户端名（公平排队），None表示按到达顺序排队。
+                    正常返回后调用方必须在请求结束时调用 self.fair.finish(client)
+            cost: 消耗的令牌数（request_cost.CostTable.cost）
+            family: 端点族，配置了子预算时同时从子令牌桶领取
+
+        Returns:
+            float: 实际排队等待的秒数
+
+        Raises:
+            ValueError: 未知的优先级
+            RateLimitExceeded: 预计等待时间超过 max_wait
+        """
+        lane = self.resolve(priority)
+        fair = self.fair if client is not None else None
+        start = time.monotonic()
+        self.enter(lane)
+        waited = None
+        try:
+            head = None if fair is not None else self._heads.get(lane)
+            if fair is not None:
+                try:
+                    fair.acquire((id(self), lane), client, max_wait, cost)
+                except RateLimitExceeded:
+                    raise RateLimitExceeded(max_wait or 1.0 / self.rate)
+            elif head is not None and not head.acquire(timeout=-1 if max_wait is None else max_wait):
+                raise RateLimitExceeded(max_wait or 1.0 / self.rate)
+            try:
+                while True:
+                    remaining = None if max_wait is None else max(0.0, max_wait - (time.monotonic() - start))
+                    sleep_time, retry_in = self.attempt(lane, remaining, cost, family)
+                    if sleep_time is not None:
+                        break
+                    time.sleep(retry_in)
+                # 公平排队的队首等到自己的令牌可用才让出，否则先到的客户端会一次预约很多未来的令牌
+                if fair is not None and sleep_time > 0:
+                    time.sleep(sleep_time)
+                    sleep_time = 0
+            except BaseException:
+                if fair is not None:
+                    fair.finish(client, rejected=True)
+                raise
+            finally:
+                if fair is not None:
+                    fair.release((id(self), lane))
+                elif head is not None:
+                    head.release()
+
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+            waited = time.monotonic() - start
+            if fair is not None:
+                fair.served(client, waited)
+            return waited
+        finally:
+            self.leave(lane, waited)
+
+    def waiting(self):
+        """所有通道中正在排队的请求数"""
+        with self._lock:
+            return sum(stats['waiting'] for stats in self._lane_stats.values())
+
+    def lane_stats(self):
+        """
+        各通道统计
+
+        Returns:
+            dict: {通道名: {'waiting': 当前排队数, 'served': 已放行数, 'rejected': 拒绝数, 'queue_wait': 等待直方图}}
+        """
+        with self._lock:
+            counters = {lane: dict(stats) for lane, stats in self._lane_stats.items()}
+        return {
+            lane: {
+                'waiting': stats['waiting'],
+                'served': stats['served'],
+                'rejected': stats['rejected'],
+                'queue_wait': stats['histogram'].snapshot()
+            }
+            for lane, stats in counters.items()
+        }
+
+    def stats(self):
+        """限流器统计信息（含各通道）"""
+        result = self.limiter.stats()
+        result['default_lane'] = self.default_lane
+        result['lanes'] = self.lane_stats()
+        if self.families:
+            result['families'] = {name: limiter.stats() for name, limiter in self.families.items()}
+        return result
+
+
+def create_rate_limiter(name='default', rate=None, capacity=None, keep_rate=None):
+    """
+    根据配置创建限流器
+
+    Args:
+        name: 令牌桶名称（仅共享后端使用）
+        rate: 初始速率（次/秒），默认 config.RATE_LIMIT_RATE
+        capacity: 令牌桶容量，默认 config.RATE_LIMIT_CAPACITY（本地后端默认等于速率，至少为1）
+        keep_rate: 共享令牌桶已存在时保留其中的速率，默认 config.ADAPTIVE_RATE_ENABLED
+
+    Returns:
+        RateLimiter 或 SharedRateLimiter
+
+    Raises:
+        ValueError: 速率或容量不是正数
+    """
+    rate = float(config.RATE_LIMIT_RATE if rate is None else rate)
+    if not rate > 0:
+        raise ValueError(f"限流速率必须大于0（令牌桶 {name}）: {rate!r}")
+    if capacity is not None and not float(capacity) > 0:
+        raise ValueError(f"令牌桶容量必须大于0（令牌桶 {name}）: {capacity!r}")
+    if config.RATE_LIMIT_BACKEND == 'sqlite':
+        return SharedRateLimiter(
+            db_path=config.RATE_LIMIT_DB_PATH,
+            name=name,
+            rate=rate,
+            capacity=config.RATE_LIMIT_CAPACITY if capacity is None else capacity,
+            keep_rate=config.ADAPTIVE_RATE_ENABLED if keep_rate is None else keep_rate
+        )
+    # 直接设置小数速率（max_calls=int(rate) 会把 2.5 截断为 2、0.5 截断为 0）
+    limiter = RateLimiter(max_calls=rate, time_window=1.0)
+    limiter.capacity = limiter.tokens = float(capacity) if capacity is not None else max(rate, 1.0)
+    return limiter
+
+
+def create_family_limiters(bucket):
+    """
+    根据 config.RATE_LIMIT_FAMILIES 创建端点族的子令牌桶
+
+    Args:
+        bucket: 所属的账号令牌桶名称，子令牌桶名为 <bucket>:<端点族>
+
+    Returns:
+        dict: {端点族: RateLimiter 或 SharedRateLimiter}
+    """
+    return {
+        family: create_rate_limiter(f'{bucket}:{family}', rate=spec['rate'], capacity=spec.get('capacity'),
+                                    keep_rate=False)
+        for family, spec in config.RATE_LIMIT_FAMILIES.items()
+    }
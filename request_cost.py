@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求代价 - 按接口和参数决定每个请求消耗多少个限流令牌
+
+上游的限流对重接口更敏感: pageSize=300 的 list.json 和一个很小的 batchSetCustomComment.json
+各算一个令牌时，几个大分页扫描就能让上游报"系统繁忙"，后面的小请求都跟着排队。
+
+- config.REQUEST_COST_RULES 按URL路径正则匹配第一条规则，规则给出基础令牌数，
+  可以按某个请求参数（如 pageSize）放大: 每 per 条记录消耗 cost 个令牌，不足 per 条按 per 计
+- 不匹配任何规则的请求消耗 REQUEST_COST_DEFAULT 个令牌，单个请求最多消耗 REQUEST_COST_MAX 个
+- 规则可以指定端点族（family），config.RATE_LIMIT_FAMILIES 中配置了该端点族时，
+  请求还要从该族独立的子令牌桶领取同样数量的令牌（同时受账号总预算和子预算限制）
+"""
+import re
+import math
+from urllib.parse import urlsplit, parse_qsl
+
+import config
+
+
+class CostTable:
+    """请求代价表"""
+
+    def __init__(self, rules=None, default=None, max_cost=None):
+        """
+        Args:
+            rules: [{'pattern', 'cost', 'field', 'per', 'family'}, ...]，按顺序匹配第一条
+            default: 不匹配任何规则的请求消耗的令牌数
+            max_cost: 单个请求最多消耗的令牌数
+        """
+        rules = config.REQUEST_COST_RULES if rules is None else rules
+        self.default = float(config.REQUEST_COST_DEFAULT if default is None else default)
+        self.max_cost = float(config.REQUEST_COST_MAX if max_cost is None else max_cost)
+        self.rules = [(re.compile(rule['pattern']), rule) for rule in rules]
+
+    def cost(self, method, url, data=None, params=None):
+        """
+        计算请求的代价
+
+        Args:
+            method: HTTP方法
+            url: 完整URL
+            data: POST表单数据（dict或urlencoded字符串）
+            params: GET参数（dict）
+
+        Returns:
+            tuple: (令牌数, 端点族名或None)
+        """
+        path = urlsplit(url).path
+        for pattern, rule in self.rules:
+            if pattern.search(path):
+                cost = float(rule.get('cost', self.default))
+                field = rule.get('field')
+                if field:
+                    value = _field_value(field, method, url, data, params)
+                    if value is not None and value > 0:
+                        cost *= max(1, math.ceil(value / rule.get('per', 1)))
+                return min(cost, self.max_cost), rule.get('family')
+        return min(self.default, self.max_cost), None
+
+
+def _field_value(field, method, url, data, params):
+    """从请求参数中读取数值字段（表单、GET参数、URL查询串），读不到或不是有限的数字时返回None"""
+    sources = [params, data if method.upper() == 'POST' else None, urlsplit(url).query]
+    for source in sources:
+        if isinstance(source, (str, bytes)):
+            if isinstance(source, bytes):
+                source = source.decode('utf-8', 'replace')
+            source = dict(parse_qsl(source))
+        if isinstance(source, dict) and source.get(field) not in (None, ''):
+            try:
+                value = float(source[field])
+            except (TypeError, ValueError):
+                return None
+            # inf 会让 math.ceil 抛出 OverflowError，nan 无法比较
+            return value if math.isfinite(value) else None
+    return None
+
+
+def create_cost_table():
+    """
+    根据配置创建请求代价表
+
+    Returns:
+        CostTable
+    """
+    return CostTable()
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+响应缓存 - 店小秘只读接口的TTL + LRU内存缓存
+
+很多机器人会在几分钟内用完全相同的参数反复查询同一个订单
+（searchPackage.json / pageList.htm），每次都消耗一个限流令牌。
+命中缓存的请求直接返回上一次的响应，不经过限流器，也不请求上游。
+
+- 只有匹配 config.RESPONSE_CACHE_RULES 的URL才会缓存，每条规则有自己的TTL
+- 匹配 config.RESPONSE_CACHE_NEVER 的写接口（批量作废、提交平台等）永远不缓存
+- 缓存键: (method, url, 排序后的data, 排序后的params)，请求头不参与
+- 条目数和总字节数都有上限，超过时淘汰最久未使用的条目
+- 每个worker进程一份缓存；显式失效（/api/cache/invalidate、X-Cache: invalidate）记录在共享的
+  SQLite文件中（config.RESPONSE_CACHE_DB_PATH），其他worker在下一次读缓存时同步删除
+"""
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import config
+
+
+# 请求中可以使用的缓存控制指令（payload的 cache 字段或 X-Cache 请求头）
+CACHE_BYPASS = 'bypass'          # 不读缓存，请求上游后用新响应覆盖缓存
+CACHE_INVALIDATE = 'invalidate'  # 删除该URL的所有缓存条目，然后请求上游
+CACHE_DIRECTIVES = (CACHE_BYPASS, CACHE_INVALIDATE)
+
+
+def _base_url(url):
+    """去掉查询参数和fragment的URL（按URL失效时的比较依据）"""
+    return urlsplit(url)._replace(query='', fragment='').geturl()
+
+
+class SharedInvalidations:
+    """
+    跨进程的缓存失效记录 - SQLite中的自增序号表
+
+    每次失效追加一行（url为NULL表示清空全部），各进程记住自己已经处理到的序号，
+    读缓存前取出更新的记录在本进程的缓存中执行。
+    """
+
+    def __init__(self, db_path, keep_seconds=3600):
+        """
+        Args:
+            db_path: SQLite数据库文件路径（所有worker必须相同）
+            keep_seconds: 失效记录保留的秒数（不短于最长的缓存TTL）
+        """
+        self.db_path = db_path
+        self.keep_seconds = keep_seconds
+        self._local = threading.local()
+        self._ensure_db()
+        # 进程启动前的记录与本进程的（空）缓存无关
+        self.seen = self._get_conn().execute('SELECT COALESCE(MAX(id), 0) FROM cache_invalidations').fetchone()[0]
+
+    def _get_conn(self):
+        """获取当前线程的数据库连接"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _ensure_db(self):
+        """确保数据库和失效记录表存在"""
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir, exist_ok=True)
+        self._get_conn().execute(
+            'CREATE TABLE IF NOT EXISTS cache_invalidations ('
+            ' id INTEGER PRIMARY KEY AUTOINCREMENT,'
+            ' url TEXT,'
+            ' created_at REAL NOT NULL)'
+        )
+
+    def publish(self, url):
+        """
+        记录一次失效
+
+        Args:
+            url: 去掉查询参数的URL，None表示清空全部
+
+        Returns:
+            int: 这条记录的序号
+        """
+        conn = self._get_conn()
+        now = time.time()
+        cursor = conn.execute('INSERT INTO cache_invalidations (url, created_at) VALUES (?, ?)', (url, now))
+        conn.execute('DELETE FROM cache_invalidations WHERE created_at < ?', (now - self.keep_seconds,))
+        return cursor.lastrowid
+
+    def poll(self):
+        """
+        取出本进程尚未处理的失效记录
+
+        Returns:
+            list: [(序号, url或None), ...]，按序号排列
+        """
+        return self._get_conn().execute(
+            'SELECT id, url FROM cache_invalidations WHERE id > ? ORDER BY id', (self.seen,)
+        ).fetchall()
+
+
+class ResponseCache:
+    """TTL + LRU 响应缓存"""
+
+    def __init__(self, rules=None, never=None, max_entries=None, max_bytes=None, shared=None):
+        """
+        Args:
+            rules: [(URL正则, TTL秒), ...]，按顺序匹配第一条
+            never: 永远不缓存的URL正则列表（优先于rules）
+            max_entries: 最大条目数
+            max_bytes: 缓存响应体的最大总字节数
+            shared: SharedInvalidations，None表示失效只影响本进程
+        """
+        rules = config.RESPONSE_CACHE_RULES if rules is None else rules
+        never = config.RESPONSE_CACHE_NEVER if never is None else never
+        self.rules = [(re.compile(pattern), ttl) for pattern, ttl in rules]
+        self.never = [re.compile(pattern) for pattern in never]
+        self.max_entries = config.RESPONSE_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = config.RESPONSE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+
+        self._entries = OrderedDict()  # key -> (expires_at, stored_at, size, url, result)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.shared = shared
+        self._sync_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+        self.remote_invalidations = 0
+
+    def ttl_for(self, method, url):
+        """
+        获取URL的缓存时间
+
+        Returns:
+            float 或 None: TTL秒数，None表示不缓存
+        """
+        if method.upper() not in ('GET', 'POST'):
+            return None
+        path = urlsplit(url).path
+        for pattern in self.never:
+            if pattern.search(path):
+                return None
+        for pattern, ttl in self.rules:
+            if pattern.search(path):
+                return ttl
+        return None
+
+    @staticmethod
+    def make_key(method, url, data=None, params=None, raw=False, account=None):
+        """
+        生成规范化的缓存键（参数顺序不影响结果）
+
+        Args:
+            method: HTTP方法
+            url: 完整URL（URL中的查询参数与params合并后排序）
+            data: POST表单数据（dict或字符串）
+            params: GET参数
+            raw: 原样返回模式（结果格式不同，与普通请求分开缓存）
+            account: 指定的账号名（指定账号的请求与自动选择账号的请求分开缓存）
+        """
+        parts = urlsplit(url)
+        query = parse_qsl(parts.query, keep_blank_values=True)
+        if isinstance(params, dict):
+            query.extend((str(k), str(v)) for k, v in params.items())
+        base_url = urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, urlencode(sorted(query)), ''))
+
+        if isinstance(data, dict):
+            body = sorted((str(k), json.dumps(v, sort_keys=True, ensure_ascii=False) if not isinstance(v, str) else v)
+                          for k, v in data.items())
+        else:
+            body = data
+        key = [method.upper(), base_url, body]
+        if raw:
+            key.append('raw')
+        if account:
+            key.append(f'account:{account}')
+        return json.dumps(key, ensure_ascii=False)
+
+    def get(self, key):
+        """
+        读取缓存
+
+        Returns:
+            dict 或 None: 命中时返回结果副本（带 cache='hit' 和 cache_age），未命中返回None
+        """
+        self._sync()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+        _, stored_at, _, _, result = entry
+        cached = dict(result)
+        cached['cache'] = 'hit'
+        cached['cache_age'] = round(now - stored_at, 3)
+        cached['queue_wait'] = 0.0
+        return cached
+
+    def put(self, key, url, result, ttl, size):
+        """
+        写入缓存
+
+        Args:
+            key: make_key() 生成的缓存键
+            url: 请求URL（用于按URL失效）
+            result: execute_request 的结果dict
+            ttl: 缓存秒数
+            size: 响应体字节数（用于内存上限）
+        """
+        if size > self.max_bytes:
+            return
+        now = time.monotonic()
+        stored = {k: v for k, v in result.items() if k not in ('cache', 'cache_age')}
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (now + ttl, now, size, url, stored)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, key):
+        """删除条目（调用方持有锁）"""
+        entry = self._entries.pop(key)
+        self._bytes -= entry[2]
+
+    def _sync(self):
+        """执行其他worker记录的失效（数据库读失败时跳过，下次再同步）"""
+        if self.shared is None:
+            return
+        with self._sync_lock:
+            try:
+                records = self.shared.poll()
+            except sqlite3.Error as e:
+                print(f"[ResponseCache] ⚠️  读取共享失效记录失败: {e}")
+                return
+            for record_id, url in records:
+                self._invalidate_local(url)
+                self.shared.seen = record_id
+                self.remote_invalidations += 1
+
+    def _invalidate_local(self, url):
+        """删除本进程中的缓存条目，url为去掉查询参数的URL或None"""
+        with self._lock:
+            if url is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                self._bytes = 0
+                return removed
+
+            keys = [key for key, entry in self._entries.items() if _base_url(entry[3]) == url]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def invalidate(self, url=None):
+        """
+        删除缓存条目（配置了共享失效记录时，所有worker都会删除）
+
+        Args:
+            url: 只删除这个URL（忽略查询参数）的条目，None表示清空全部
+
+        Returns:
+            int: 本进程删除的条目数
+        """
+        url = _base_url(url) if url is not None else None
+        if self.shared is not None:
+            self._sync()
+            try:
+                record_id = self.shared.publish(url)
+            except sqlite3.Error as e:
+                print(f"[ResponseCache] ⚠️  记录共享失效失败，只清除了当前worker的缓存: {e}")
+            else:
+                # 自己的记录不用再执行一次（中间夹着其他worker的记录时留给下次同步）
+                with self._sync_lock:
+                    if record_id == self.shared.seen + 1:
+                        self.shared.seen = record_id
+        return self._invalidate_local(url)
+
+    @property
+    def scope(self):
+        """失效的作用范围: 'all_workers' 或 'worker'"""
+        return 'all_workers' if self.shared is not None else 'worker'
+
+    def stats(self):
+        """缓存统计信息"""
+        with self._lock:
+            entries = len(self._entries)
+            total_bytes = self._bytes
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'bytes': total_bytes,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'bypassed': self.bypassed,
+            'evictions': self.evictions,
+            'remote_invalidations': self.remote_invalidations,
+            'invalidation_scope': self.scope,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+def create_response_cache():
+    """
+    根据配置创建响应缓存
+
+    Returns:
+        ResponseCache 或 None（config.RESPONSE_CACHE_ENABLED 为False时）
+    """
+    if not config.RESPONSE_CACHE_ENABLED:
+        return None
+    shared = None
+    if config.RESPONSE_CACHE_DB_PATH:
+        shared = SharedInvalidations(config.RESPONSE_CACHE_DB_PATH,
+                                     max([ttl for _, ttl in config.RESPONSE_CACHE_RULES] + [3600]))
+    return ResponseCache(shared=shared)
@@ -4,6 +4,8 @@
 
 特点：
 - 单一endpoint: /api/execute
+- 批量endpoint: /api/execute_batch（NDJSON流式返回）
+- 异步任务: POST /api/jobs 立即返回job_id，GET /api/jobs/<id> 长轮询结果
 - 自动注入Cookie
 - 速率限制: 8次/秒
 - 支持POST和GET方法
@@ -15,27 +17,116 @@
 部署地址：
     http://47.104.72.198:5000
 """
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import json
+import math
+import time
+import threading
 import traceback
 import config
-from generic_api_service import get_service
+from generic_api_service import get_service, parse_deadline, parse_max_wait, wants_raw, raw_response_headers
+from projection import compile_select
+from compression import DecompressRequestMiddleware, choose_encoding, compress, gzip_stream, should_compress
+from job_queue import JobStore, JobDispatcher, JobQueueFull, JOB_DONE
+from fair_queue import client_from_headers, get_fair_scheduler
+import metrics
 
 app = Flask(__name__)
 CORS(app)  # 允许跨域请求
+app.wsgi_app = DecompressRequestMiddleware(app.wsgi_app)  # 支持 Content-Encoding: gzip / zstd 的请求体
 
 # 获取通用API服务实例
 api_service = None
 
+# 批量请求的执行线程池（每个worker进程一个，所有批量请求共用）
+_batch_executor = ThreadPoolExecutor(max_workers=config.BATCH_CONCURRENCY)
+
+# 异步任务执行器（每个worker进程一个）
+_job_dispatcher = None
+_job_dispatcher_lock = threading.Lock()
+
+# 监控指标汇总器（所有worker写同一个快照目录）
+_metrics_collector = metrics.create_collector('flask')
+
 
 def get_generic_api_service():
     """获取通用API服务实例"""
     global api_service
     if api_service is None:
         api_service = get_service()
+        _register_metrics(api_service)
+    _metrics_collector.start()
     return api_service
 
 
+def _register_metrics(service):
+    """注册 /metrics 中的瞬时值"""
+    metrics.REGISTRY.register_gauge('dxm_queue_depth', lambda: _queue_depth(service))
+    metrics.REGISTRY.register_gauge('dxm_in_flight_requests', lambda: service.in_flight)
+    fair = get_fair_scheduler()
+    if fair is not None:
+        print("[Server] ⚠️  公平排队只在每个worker进程内生效，多worker部署下基本不起作用（需要时请使用 async_server.py）")
+        metrics.REGISTRY.register_gauge('dxm_client_waiting', lambda: fair.gauge('waiting'))
+        metrics.REGISTRY.register_gauge('dxm_client_in_flight', lambda: fair.gauge('in_flight'))
+    _metrics_collector.register_global_gauge('dxm_rate_limit_rate', lambda: {
+        (('account', account.name),): account.limiter.rate for account in service.accounts.accounts
+    })
+    _metrics_collector.register_global_gauge('dxm_cookie_age_seconds', service.accounts.cookie_ages)
+    _metrics_collector.register_global_gauge('dxm_jobs', _job_counts)
+
+
+def _queue_depth(service):
+    """各优先级通道排队的请求数（所有账号合计）"""
+    depth = {}
+    for account in service.accounts.accounts:
+        for lane, lane_stats in account.limiter.lane_stats().items():
+            key = (('lane', lane),)
+            depth[key] = depth.get(key, 0) + lane_stats['waiting']
+    return depth
+
+
+def _job_counts():
+    """各状态的异步任务数（任务数据库所有worker共用）"""
+    if _job_dispatcher is None:
+        return {}
+    return {(('status', status),): count for status, count in _job_dispatcher.store.counts().items()}
+
+
+def get_job_dispatcher():
+    """获取异步任务执行器（首次调用时启动后台线程）"""
+    global _job_dispatcher
+    with _job_dispatcher_lock:
+        if _job_dispatcher is None:
+            _job_dispatcher = JobDispatcher(JobStore(config.JOB_DB_PATH), _execute_job)
+            _job_dispatcher.start()
+    return _job_dispatcher
+
+
+def _execute_job(spec):
+    """执行一个异步任务（任务已经在队列中等过，这里不再限制排队时间）"""
+    return get_generic_api_service().execute_request(
+        url=spec['url'],
+        headers=spec.get('headers', {}),
+        data=spec.get('data'),
+        method=spec.get('method', 'POST'),
+        params=spec.get('params'),
+        priority=spec.get('priority'),
+        cache=spec.get('cache'),
+        select=spec.get('select'),
+        account=spec.get('account'),
+        sticky=spec.get('sticky'),
+        client=spec.get('client')
+    )
+
+
+def _request_client():
+    """当前请求的客户端名（API Key 请求头或来源IP），未启用公平排队时返回None"""
+    return client_from_headers(get_fair_scheduler(), request.headers, request.remote_addr)
+
+
 @app.route('/', methods=['GET'])
 def index():
     """API文档首页"""
@@ -58,7 +149,14 @@ def index():
                 "headers": "请求头字典，不含cookie（可选）",
                 "data": "POST请求的表单数据（可选）",
                 "method": "HTTP方法，'POST'或'GET'，默认'POST'（可选）",
-                "params": "GET请求的URL参数（可选）"
+                "params": "GET请求的URL参数（可选）",
+                "max_wait": "限流队列中最长等待秒数，超过直接返回429和Retry-After（可选）",
+                "priority": f"优先级通道 {config.PRIORITY_LANES}，也可以用请求头 X-Priority 指定，默认 '{config.PRIORITY_DEFAULT}'（可选）",
+                "cache": "缓存控制 'bypass'（不读缓存并刷新）或 'invalidate'（清除该URL的缓存），也可以用请求头 X-Cache 指定（可选）",
+                "raw": "原样返回模式，true时直接返回上游的响应体、状态码和Content-Type，不做JSON解析和重新编码，也可以用请求头 X-Raw-Response: 1 指定（可选）",
+                "select": "字段投影，只返回需要的JSON字段，如 'data.page.list[].id,data.page.totalSize'（可选，批量和异步任务同样支持）",
+                "account": "指定使用的账号名（config.COOKIE_ACCOUNTS），也可以用请求头 X-Account 指定，默认自动选择负载最低的账号（可选）",
+                "sticky": "sticky键，相同的键总是路由到同一个账号，也可以用请求头 X-Sticky-Key 指定（可选）"
             },
             "返回格式": {
                 "success": "布尔值，表示请求是否成功",
@@ -67,7 +165,8 @@ def index():
                 "response_type": "'json'或'text'",
                 "headers": "响应头字典",
                 "error": "错误信息（失败时）"
-            }
+            },
+            "原样返回模式": "响应头 X-Proxy-Raw: 1 表示响应体来自上游；X-Queue-Wait、X-Cache、X-Cache-Age、X-Coalesced 携带元数据。代理自身的错误（429限流、400参数错误等）仍返回上面的JSON格式"
         },
         "使用示例": {
             "POST请求": {
@@ -92,10 +191,48 @@ def index():
                 "method": "GET"
             }
         },
-        "客户端代码": "使用 client_api.py 中的 api_call() 函数",
+        "批量endpoint": {
+            "路径": "POST /api/execute_batch",
+            "说明": "一次提交多个请求，全部经过同一个限流器，每完成一个立即以一行JSON (NDJSON) 返回",
+            "参数": {
+                "requests": f"请求列表，每个元素的格式与 /api/execute 相同（必填，最多{config.BATCH_MAX_REQUESTS}个）",
+                "max_wait": "每个请求在限流队列中最长等待秒数（可选）",
+                "priority": f"批量请求的优先级通道，默认 '{config.PRIORITY_BATCH_DEFAULT}'，单个请求可以用自己的 priority 覆盖（可选）"
+            },
+            "返回格式": "application/x-ndjson，每行为 {index: 请求序号, ...与/api/execute相同的字段}，按完成顺序返回"
+        },
+        "异步任务endpoint": {
+            "提交": "POST /api/jobs，参数与 /api/execute 相同，立即返回 {job_id, status_url}",
+            "查询": f"GET /api/jobs/<job_id>?wait=秒数，任务完成前最多等待wait秒（最长{config.JOB_MAX_LONG_POLL_THREADED}秒，"
+                    f"async_server 最长{config.JOB_MAX_LONG_POLL}秒）",
+            "说明": "任务保存在本地SQLite中，服务器重启后继续执行；结果字段与 /api/execute 相同"
+        },
+        "截止时间": {
+            "请求头": f"{config.DEADLINE_HEADER}: 调用方还愿意等待的秒数（/api/execute 和 /api/execute_batch，批量时对整个批次生效）",
+            "说明": "来不及在截止时间前完成的请求在排队中直接丢弃，不消耗令牌、不发往上游，"
+                    "返回504和 deadline_exceeded: true；上游请求的超时时间也不超过剩余时间"
+        },
+        "公平排队": {
+            "客户端识别": f"请求头 {config.FAIR_CLIENT_HEADER}，没有时按来源IP",
+            "说明": "同一优先级通道内按客户端加权公平排队，连续发请求的客户端不会挤占其他客户端；"
+                    "权重和进行中请求上限在 config.FAIR_CLIENTS 中配置，各客户端统计见 /api/status 的 clients 字段",
+            "作用范围": "只在同一个worker进程内生效，gunicorn多worker部署下基本不起作用，"
+                        "进行中请求上限按worker单独计数；需要公平排队时请使用 async_server.py"
+        },
+        "缓存endpoint": {
+            "路径": "POST /api/cache/invalidate",
+            "说明": "清除响应缓存，参数 url 可选（不填清空全部）"
+        },
+        "监控endpoint": {
+            "路径": "GET /metrics",
+            "说明": "Prometheus文本格式的指标（所有worker汇总）：上游请求数/延迟/繁忙次数、限流排队时间、缓存命中、Cookie年龄、任务队列长度等"
+        },
+        "客户端代码": "使用 client_api.py 中的 api_call() / api_call_batch() 函数",
         "注意事项": [
             "请求头中不要包含cookie，服务器会自动注入",
             "速率限制为8次/秒，超过会自动等待",
+            "设置max_wait后，预计排队超时的请求会立即返回429，响应头Retry-After给出建议重试时间",
+            "交互请求优先于批量请求获得令牌，批量任务请使用 priority='bulk'",
             "客户端遇到429状态码应自动重试"
         ]
     }
@@ -113,9 +250,17 @@ def execute_request():
         - data: POST请求数据
         - method: HTTP方法（'POST'或'GET'）
         - params: GET请求参数
+        - max_wait: 限流队列中最长等待时间（秒）
+        - priority: 优先级通道（也可以用请求头 X-Priority 指定）
+        - cache: 缓存控制指令（也可以用请求头 X-Cache 指定）
+        - raw: 原样返回模式（也可以用请求头 X-Raw-Response: 1 指定）
+        - select: 字段投影表达式，只返回选中的JSON字段
+        - account: 指定账号名（也可以用请求头 X-Account 指定）
+        - sticky: sticky键，相同的键总是使用同一个账号（也可以用请求头 X-Sticky-Key 指定）
 
     返回：
-        目标API的原始响应
+        目标API的原始响应；原样返回模式下响应体、状态码和Content-Type与上游完全相同，
+        queue_wait / cache 等元数据放在 X-Queue-Wait / X-Cache 等响应头中
     """
     try:
         # 获取请求参数
@@ -134,6 +279,12 @@ def execute_request():
         data = request_data.get('data')
         method = request_data.get('method', 'POST')
         params = request_data.get('params')
+        priority = request_data.get('priority') or request.headers.get('X-Priority')
+        cache = request_data.get('cache') or request.headers.get('X-Cache')
+        raw = wants_raw(request_data.get('raw') or request.headers.get('X-Raw-Response'))
+        select = request_data.get('select')
+        account = request_data.get('account') or request.headers.get('X-Account')
+        sticky = request_data.get('sticky') or request.headers.get('X-Sticky-Key')
 
         # 验证必填参数
         if not url:
@@ -151,6 +302,16 @@ def execute_request():
                 "message": "仅支持POST和GET方法"
             }), 400
 
+        # 验证排队等待上限
+        try:
+            max_wait = parse_max_wait(request_data.get('max_wait'))
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e),
+                "message": "max_wait 为限流队列中最长等待的秒数"
+            }), 400
+
         # 执行请求
         service = get_generic_api_service()
         result = service.execute_request(
@@ -158,16 +319,31 @@ def execute_request():
             headers=headers,
             data=data,
             method=method,
-            params=params
+            params=params,
+            max_wait=max_wait,
+            priority=priority,
+            cache=cache,
+            raw=raw,
+            select=select,
+            account=account,
+            sticky=sticky,
+            client=_request_client(),
+            deadline=parse_deadline(request.headers.get(config.DEADLINE_HEADER))
         )
 
         # 返回结果
+        if result.get('success') and raw:
+            # 原样返回上游响应体，不经过JSON解析和jsonify
+            return Response(result['body'], status=result['status_code'], headers=raw_response_headers(result))
         if result.get('success'):
             return jsonify(result), 200
         else:
             # 请求失败，返回错误信息
             status_code = result.get('status_code', 500)
-            return jsonify(result), status_code
+            response = jsonify(result)
+            if 'retry_after' in result:
+                response.headers['Retry-After'] = str(max(1, math.ceil(result['retry_after'])))
+            return response, status_code
 
     except Exception as e:
         # 捕获所有异常
@@ -182,6 +358,203 @@ def execute_request():
         }), 500
 
 
+def _validate_request_spec(spec):
+    """校验单个请求描述，返回错误信息，合法时返回None"""
+    if not isinstance(spec, dict):
+        return "请求描述必须是JSON对象"
+    if not spec.get('url'):
+        return "缺少必填参数: url"
+    method = spec.get('method', 'POST')
+    if not isinstance(method, str) or method.upper() not in ['POST', 'GET']:
+        return f"不支持的HTTP方法: {method}"
+    try:
+        parse_max_wait(spec.get('max_wait'))
+    except ValueError as e:
+        return str(e)
+    if spec.get('select') is not None:
+        try:
+            compile_select(spec['select'])
+        except ValueError as e:
+            return str(e)
+    return None
+
+
+@app.route('/api/execute_batch', methods=['POST'])
+def execute_batch():
+    """
+    批量HTTP请求执行器
+
+    接收参数：
+        - requests: 请求列表，每个元素包含 url/headers/data/method/params
+        - max_wait: 每个请求在限流队列中最长等待时间（秒）
+        - priority: 优先级通道，默认 config.PRIORITY_BATCH_DEFAULT
+
+    返回：
+        NDJSON流，每完成一个请求输出一行 {index, ...execute_request的结果}
+    """
+    request_data = request.json
+    specs = request_data.get('requests') if isinstance(request_data, dict) else None
+
+    if not isinstance(specs, list) or not specs:
+        return jsonify({
+            "success": False,
+            "error": "缺少必填参数: requests",
+            "message": "请提供非空的请求列表"
+        }), 400
+
+    if len(specs) > config.BATCH_MAX_REQUESTS:
+        return jsonify({
+            "success": False,
+            "error": f"请求数量超过上限: {len(specs)} > {config.BATCH_MAX_REQUESTS}",
+            "message": "请拆分成多个批次提交"
+        }), 400
+
+    try:
+        default_max_wait = parse_max_wait(request_data.get('max_wait'))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    default_priority = (request_data.get('priority') or request.headers.get('X-Priority')
+                        or config.PRIORITY_BATCH_DEFAULT)
+    default_cache = request_data.get('cache') or request.headers.get('X-Cache')
+    client = _request_client()
+    deadline = parse_deadline(request.headers.get(config.DEADLINE_HEADER))
+    service = get_generic_api_service()
+
+    def run(spec):
+        return service.execute_request(
+            url=spec['url'],
+            headers=spec.get('headers', {}),
+            data=spec.get('data'),
+            method=spec.get('method', 'POST'),
+            params=spec.get('params'),
+            max_wait=parse_max_wait(spec['max_wait']) if 'max_wait' in spec else default_max_wait,
+            priority=spec.get('priority') or default_priority,
+            cache=spec.get('cache') or default_cache,
+            select=spec.get('select'),
+            account=spec.get('account'),
+            sticky=spec.get('sticky'),
+            client=client,
+            deadline=deadline
+        )
+
+    def generate():
+        futures = {}
+        try:
+            for index, spec in enumerate(specs):
+                error = _validate_request_spec(spec)
+                if error:
+                    yield _ndjson_line({'index': index, 'success': False, 'status_code': 400, 'error': error})
+                    continue
+                futures[_batch_executor.submit(run, spec)] = index
+
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    result = {'success': False, 'error': f'未知错误: {str(e)}'}
+                yield _ndjson_line(dict(result, index=index))
+        finally:
+            # 客户端断开时，取消尚未开始的请求，不再消耗令牌
+            for future in futures:
+                future.cancel()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+def _ndjson_line(obj):
+    """序列化为一行NDJSON"""
+    return json.dumps(obj, ensure_ascii=False) + '\n'
+
+
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    提交异步任务
+
+    接收参数：
+        与 /api/execute 相同（url/headers/data/method/params/priority/cache）
+
+    返回：
+        202 {success, job_id, status, status_url}
+    """
+    request_data = request.get_json(silent=True)
+    error = _validate_request_spec(request_data)
+    if error:
+        return jsonify({
+            "success": False,
+            "error": error,
+            "message": "请提供JSON格式的请求参数"
+        }), 400
+
+    service = get_generic_api_service()
+    try:
+        lane = service.rate_limiter.resolve(request_data.get('priority') or request.headers.get('X-Priority'))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+
+    spec = {
+        'url': request_data['url'],
+        'headers': request_data.get('headers', {}),
+        'data': request_data.get('data'),
+        'method': request_data.get('method', 'POST'),
+        'params': request_data.get('params'),
+        'priority': lane,
+        'cache': request_data.get('cache') or request.headers.get('X-Cache'),
+        'select': request_data.get('select'),
+        'account': request_data.get('account') or request.headers.get('X-Account'),
+        'sticky': request_data.get('sticky') or request.headers.get('X-Sticky-Key'),
+        'client': _request_client()
+    }
+
+    dispatcher = get_job_dispatcher()
+    try:
+        job_id = dispatcher.store.submit(spec, service.rate_limiter.rank(lane), config.JOB_MAX_QUEUED)
+    except JobQueueFull as e:
+        response = jsonify({"success": False, "status_code": 429, "error": str(e)})
+        response.headers['Retry-After'] = str(max(1, math.ceil(config.JOB_MAX_QUEUED / service.rate_limiter.rate)))
+        return response, 429
+    dispatcher.notify()
+
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}"
+    }), 202
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """
+    查询异步任务
+
+    接收参数：
+        - wait: 任务未完成时最多等待的秒数（长轮询，可选）。长轮询占用请求线程，
+          最长 config.JOB_MAX_LONG_POLL_THREADED 秒，更长的等待请使用 async_server
+
+    返回：
+        {success, job_id, status, created_at, started_at, finished_at, result}
+        status 为 'done' 时 result 与 /api/execute 的返回相同
+    """
+    try:
+        wait = min(float(request.args.get('wait', 0)), config.JOB_MAX_LONG_POLL_THREADED)
+    except ValueError:
+        return jsonify({"success": False, "error": "wait必须是数字"}), 400
+
+    store = get_job_dispatcher().store
+    deadline = time.monotonic() + wait
+    while True:
+        job = store.get(job_id)
+        if job is None:
+            return jsonify({"success": False, "error": f"任务不存在: {job_id}"}), 404
+        if job['status'] == JOB_DONE or time.monotonic() >= deadline:
+            break
+        time.sleep(config.JOB_LONG_POLL_INTERVAL)
+
+    return jsonify(dict(job, success=True)), 200
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """健康检查endpoint"""
@@ -200,6 +573,77 @@ def health_check():
         }), 500
 
 
+@app.route('/api/status', methods=['GET'])
+def status():
+    """服务器状态endpoint - 限流器统计与排队等待直方图"""
+    service = get_generic_api_service()
+    return jsonify({
+        "server_status": "running",
+        "rate_limit": service.rate_limiter.stats(),
+        "connection_pool": service.connection_stats(),
+        "response_cache": service.response_cache.stats() if service.response_cache else None,
+        "single_flight": service.single_flight.stats() if service.single_flight else None,
+        "adaptive_rate": service.rate_controller.stats() if service.rate_controller else None,
+        "accounts": service.accounts.stats(),
+        "clients": get_fair_scheduler().stats() if get_fair_scheduler() else None,
+        "jobs": _job_dispatcher.stats() if _job_dispatcher else None
+    }), 200
+
+
+@app.route('/api/cache/invalidate', methods=['POST'])
+def invalidate_cache():
+    """
+    清除响应缓存（所有worker在下一次读缓存时同步清除，见 config.RESPONSE_CACHE_DB_PATH）
+
+    接收参数：
+        - url: 只清除这个URL的缓存（可选，不填清空全部）
+
+    返回：
+        {success, removed: 当前worker删除的条目数, scope: 'all_workers' 或 'worker'}
+    """
+    service = get_generic_api_service()
+    if service.response_cache is None:
+        return jsonify({"success": True, "removed": 0, "message": "响应缓存未启用"}), 200
+
+    request_data = request.get_json(silent=True) or {}
+    removed = service.response_cache.invalidate(request_data.get('url'))
+    return jsonify({"success": True, "removed": removed, "scope": service.response_cache.scope}), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus抓取endpoint（汇总所有worker的指标）"""
+    get_generic_api_service()
+    return Response(_metrics_collector.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.after_request
+def compress_response(response):
+    """按 Accept-Encoding 压缩响应（小响应和非文本内容不压缩，NDJSON流使用逐行flush的gzip）"""
+    if response.headers.get('Content-Encoding'):
+        return response
+    content_type = response.headers.get('Content-Type')
+
+    if response.is_streamed:
+        if should_compress(content_type) and choose_encoding(request.headers.get('Accept-Encoding'), streaming=True):
+            response.response = gzip_stream(response.response)
+            response.headers['Content-Encoding'] = 'gzip'
+            response.headers.add('Vary', 'Accept-Encoding')
+            response.headers.pop('Content-Length', None)
+        return response
+
+    body = response.get_data()
+    if not should_compress(content_type, len(body)):
+        return response
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    response.set_data(compress(body, encoding))
+    response.headers['Content-Encoding'] = encoding
+    response.headers.add('Vary', 'Accept-Encoding')
+    return response
+
+
 # ==================== 错误处理 ====================
 
 @app.errorhandler(404)
@@ -233,6 +677,10 @@ if __name__ == '__main__':
     print("=" * 60)
     print("\n启动服务器...")
 
+    # 继续执行上次退出时还在排队的任务（调试模式下只在reloader启动的子进程中执行）
+    if not config.DEBUG or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        get_job_dispatcher()
+
     app.run(
         host=config.API_HOST,
         port=config.API_PORT,
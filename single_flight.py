@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求合并 (single-flight) - 相同的只读请求同时只向上游发送一次
+
+多个机器人同时处理同一张单据时，会在同一秒内发出完全相同的 searchPackage.json 请求。
+第一个请求（leader）正常排队、限流、请求上游；在它完成之前到达的相同请求（follower）
+直接等待leader的结果，不消耗令牌，也不请求上游。
+
+- 只合并只读请求: GET，或URL匹配 config.RESPONSE_CACHE_RULES 的POST；
+  匹配 config.RESPONSE_CACHE_NEVER 的写接口永远不合并
+- 请求是否相同由 ResponseCache.make_key 判断（method、url、排序后的data和params），
+  不同优先级通道的请求不合并，交互请求不会挂在排队中的批量请求后面
+- follower收到的是leader结果的副本，带 coalesced=True；leader被限流拒绝（429）或超过截止时间（504）
+  的结果只对leader自己的参数有效，不共享，follower重新合并或自己排队
+- follower按自己的 max_wait 等待leader领到令牌，超过时和自己排队一样快速失败
+- 每个worker进程独立合并
+"""
+import re
+import time
+import asyncio
+import threading
+from urllib.parse import urlsplit
+
+import config
+
+
+def is_read_request(method, url):
+    """
+    判断请求是否是可以合并的只读请求
+
+    Args:
+        method: HTTP方法
+        url: 完整URL
+
+    Returns:
+        bool
+    """
+    method = method.upper()
+    path = urlsplit(url).path
+    if any(re.search(pattern, path) for pattern in config.RESPONSE_CACHE_NEVER):
+        return False
+    if method == 'GET':
+        return True
+    return method == 'POST' and any(re.search(pattern, path) for pattern, _ in config.RESPONSE_CACHE_RULES)
+
+
+def is_shareable(result):
+    """
+    leader的结果能否给follower使用
+
+    限流拒绝（带 retry_after）、截止时间丢弃（deadline_exceeded）和按截止时间缩短的上游超时
+    （deadline_timeout）是按leader自己的 max_wait / 截止时间得出的，对follower没有意义。
+    """
+    return not (result.get('deadline_exceeded') or result.get('deadline_timeout') or 'retry_after' in result)
+
+
+class FlightTimeout(Exception):
+    """follower在自己的时间限制内没有等到leader"""
+
+    def __init__(self, admitted):
+        """
+        Args:
+            admitted: leader是否已经领到令牌；False表示超过了follower的排队时间上限
+        """
+        self.admitted = admitted
+        super().__init__("等待进行中的相同请求超时" if admitted else "进行中的相同请求排队超时")
+
+
+class _Call:
+    """一次正在进行中的请求"""
+
+    def __init__(self):
+        self.admitted = threading.Event()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _timeout(until):
+    """距离期限（time.monotonic()）的秒数，None表示不限制"""
+    return None if until is None else max(0.0, until - time.monotonic())
+
+
+class SingleFlight:
+    """线程版请求合并（Flask / gunicorn gthread）"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key, fn, queue_by=None, finish_by=None):
+        """
+        执行fn，或者等待正在执行的相同请求
+
+        Args:
+            key: 请求标识（包含优先级通道）
+            fn: 函数 fn(admitted)，返回结果dict；admitted 是无参函数，leader领到令牌后调用
+            queue_by: follower等待leader领到令牌的期限（time.monotonic()），None表示不限制
+            finish_by: follower等待结果的期限（time.monotonic()），None表示不限制
+
+        Returns:
+            tuple: (result, shared)，shared 为True表示结果来自其他请求
+
+        Raises:
+            FlightTimeout: follower超过期限仍没有等到leader
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = _Call()
+                    self._calls[key] = call
+                    self.leaders += 1
+
+            if leader:
+                try:
+                    call.result = fn(call.admitted.set)
+                except Exception as e:
+                    call.error = e
+                    raise
+                finally:
+                    with self._lock:
+                        del self._calls[key]
+                    call.admitted.set()
+                    call.done.set()
+                return call.result, False
+
+            if not call.admitted.wait(_timeout(queue_by)):
+                raise FlightTimeout(admitted=False)
+            if not call.done.wait(_timeout(finish_by)):
+                raise FlightTimeout(admitted=True)
+            if call.error is not None:
+                raise call.error
+            if is_shareable(call.result):
+                with self._lock:
+                    self.coalesced += 1
+                return call.result, True
+            # leader被限流拒绝或超过了它自己的截止时间: 重新合并或者自己排队
+
+    def stats(self):
+        """合并统计: leaders 实际发出的请求数, coalesced 被合并的重复请求数, in_flight 进行中的请求数"""
+        with self._lock:
+            in_flight = len(self._calls)
+        return {
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'in_flight': in_flight
+        }
+
+
+class _Flight:
+    """一次正在排队或执行中的请求（协程版）"""
+
+    def __init__(self):
+        self.admitted = asyncio.Event()
+        self.task = None
+        self.waiters = 0
+
+
+class AsyncSingleFlight:
+    """
+    协程版请求合并（async_server.py）
+
+    leader在独立的任务中执行，某个调用方断开不会影响其他等待同一结果的调用方；
+    所有调用方都离开后（断开或超时）取消这个任务，排队中的请求不再消耗令牌。
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key, start, queue_by=None, finish_by=None):
+        """
+        执行start启动的请求，或者等待正在执行的相同请求
+
+        Args:
+            key: 请求标识（包含优先级通道）
+            start: 函数 start(admitted)，返回执行请求的协程；admitted 是无参函数，leader领到令牌后调用
+            queue_by: follower等待leader领到令牌的期限（time.monotonic()），None表示不限制
+            finish_by: follower等待结果的期限（time.monotonic()），None表示不限制
+
+        Returns:
+            tuple: (result, shared)
+
+        Raises:
+            FlightTimeout: follower超过期限仍没有等到leader
+        """
+        while True:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                flight.task = asyncio.ensure_future(start(flight.admitted.set))
+                flight.task.add_done_callback(lambda _, flight=flight: self._finish(key, flight))
+                self._flights[key] = flight
+                self.leaders += 1
+
+            flight.waiters += 1
+            try:
+                if not leader and not flight.admitted.is_set():
+                    try:
+                        await asyncio.wait_for(flight.admitted.wait(), _timeout(queue_by))
+                    except asyncio.TimeoutError:
+                        raise FlightTimeout(admitted=False)
+                try:
+                    result = await asyncio.wait_for(asyncio.shield(flight.task),
+                                                    None if leader else _timeout(finish_by))
+                except asyncio.TimeoutError:
+                    raise FlightTimeout(admitted=True)
+            finally:
+                flight.waiters -= 1
+                if flight.waiters == 0 and not flight.task.done():
+                    self._finish(key, flight)
+                    flight.task.cancel()
+
+            if leader:
+                return result, False
+            if is_shareable(result):
+                self.coalesced += 1
+                return result, True
+            # leader被限流拒绝或超过了它自己的截止时间: 重新合并或者自己排队
+
+    def _finish(self, key, flight):
+        """请求完成或被取消，后来的相同请求重新发起"""
+        flight.admitted.set()
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def stats(self):
+        """合并统计（字段同 SingleFlight.stats）"""
+        return {
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'in_flight': len(self._flights)
+        }
+
+
+def create_single_flight():
+    """
+    根据配置创建请求合并器
+
+    Returns:
+        SingleFlight 或 None（config.SINGLE_FLIGHT_ENABLED 为False时）
+    """
+    if not config.SINGLE_FLIGHT_ENABLED:
+        return None
+    return SingleFlight()
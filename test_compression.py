@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 compression 压缩协商、请求解压和流式gzip（不访问网络）
+
+运行方式：
+    python -m pytest -q test_compression.py
+"""
+import io
+import gzip
+import json
+import zlib
+
+import pytest
+
+import config
+import compression
+
+
+BODY = json.dumps({'data': [{'orderId': f'A-{i}', 'title': '测试商品'} for i in range(200)]},
+                  ensure_ascii=False).encode('utf-8')
+
+
+def test_choose_encoding():
+    """按 Accept-Encoding 协商，q=0 表示不接受，流式响应只用gzip"""
+    preferred = compression.supported_encodings()[0]
+    assert compression.choose_encoding('gzip, deflate, br, zstd') == preferred
+    assert compression.choose_encoding('GZIP;q=0.5') == 'gzip'
+    assert compression.choose_encoding('gzip;q=0') is None
+    assert compression.choose_encoding('gzip;q=abc') is None
+    assert compression.choose_encoding('br') is None
+    assert compression.choose_encoding(None) is None
+    assert compression.choose_encoding('zstd, gzip', streaming=True) == 'gzip'
+
+
+def test_should_compress():
+    """小响应和非文本内容不压缩，流式响应（大小未知）按类型判断"""
+    assert compression.should_compress('application/json; charset=utf-8', config.COMPRESSION_MIN_SIZE)
+    assert not compression.should_compress('application/json', config.COMPRESSION_MIN_SIZE - 1)
+    assert not compression.should_compress('image/png', 10 * config.COMPRESSION_MIN_SIZE)
+    assert compression.should_compress('application/x-ndjson')
+
+
+@pytest.mark.parametrize('encoding', compression.supported_encodings())
+def test_round_trip(encoding):
+    """压缩后解压得到原文"""
+    data = compression.compress(BODY, encoding)
+    assert len(data) < len(BODY)
+    assert compression.decompress(data, encoding) == BODY
+
+
+def test_identity_and_x_gzip():
+    assert compression.decompress(BODY, None) == BODY
+    assert compression.decompress(BODY, ' Identity ') == BODY
+    assert compression.decompress(gzip.compress(BODY), 'x-gzip') == BODY
+
+
+def test_decompression_size_cap():
+    """解压后超过上限时抛出 ValueError（压缩炸弹不会被完整解压）"""
+    bomb = gzip.compress(b'\0' * (1024 * 1024))
+    assert len(bomb) < 4096
+    with pytest.raises(ValueError, match='超过上限'):
+        compression.decompress(bomb, 'gzip', max_size=64 * 1024)
+    assert compression.decompress(bomb, 'gzip', max_size=1024 * 1024) == b'\0' * (1024 * 1024)
+
+
+def test_corrupt_and_unsupported():
+    with pytest.raises(ValueError, match='解压失败'):
+        compression.decompress(b'not gzip data', 'gzip')
+    with pytest.raises(ValueError, match='不支持'):
+        compression.decompress(BODY, 'br')
+
+
+def test_gzip_stream_flushes_each_chunk():
+    """每块压缩后立即flush: 接收方拿到每一块就能解压出对应的行"""
+    lines = [json.dumps({'index': i, 'result': '测试'}, ensure_ascii=False) + '\n' for i in range(3)]
+    stream = compression.GzipStream()
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for line in lines:
+        assert decoder.decompress(stream.compress(line)) == line.encode('utf-8')
+    assert decoder.decompress(stream.finish()) == b''
+    assert decoder.eof
+
+
+def test_gzip_stream_generator_closes_source():
+    """gzip_stream 输出完整的gzip流，结束后关闭原始生成器"""
+    closed = []
+
+    def chunks():
+        try:
+            yield 'a\n'
+            yield b'b\n'
+        finally:
+            closed.append(True)
+
+    data = b''.join(compression.gzip_stream(chunks()))
+    assert gzip.decompress(data) == b'a\nb\n'
+    assert closed == [True]
+
+
+def test_middleware():
+    """WSGI中间件解压请求体；损坏的请求体返回400"""
+    seen = {}
+
+    def app(environ, start_response):
+        seen['body'] = environ['wsgi.input'].read()
+        seen['length'] = environ['CONTENT_LENGTH']
+        seen['encoding'] = environ.get('HTTP_CONTENT_ENCODING')
+        return [b'ok']
+
+    middleware = compression.DecompressRequestMiddleware(app)
+    data = gzip.compress(BODY)
+    environ = {'HTTP_CONTENT_ENCODING': 'gzip', 'CONTENT_LENGTH': str(len(data)), 'wsgi.input': io.BytesIO(data)}
+    assert middleware(environ, None) == [b'ok']
+    assert seen == {'body': BODY, 'length': str(len(BODY)), 'encoding': None}
+
+    statuses = []
+    environ = {'HTTP_CONTENT_ENCODING': 'gzip', 'CONTENT_LENGTH': '4', 'wsgi.input': io.BytesIO(b'oops')}
+    body = middleware(environ, lambda status, headers: statuses.append(status))
+    assert statuses == ['400 BAD REQUEST']
+    assert json.loads(body[0])['success'] is False
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 fair_queue.FairScheduler（不访问网络）
+
+运行方式：
+    python -m pytest -q test_fair_queue.py
+"""
+import time
+import threading
+
+import pytest
+
+from fair_queue import FairScheduler
+from rate_limiter import RateLimitExceeded
+
+
+def make_scheduler(clients=None, max_in_flight=None):
+    return FairScheduler(clients=clients or {}, default_weight=1.0,
+                         default_max_in_flight=max_in_flight, max_clients=100)
+
+
+def wait_for(condition, timeout=2.0):
+    """等待其他线程进入排队状态"""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "等待超时"
+        time.sleep(0.005)
+
+
+def test_tag_order_favours_occasional_client():
+    """连续发请求的客户端标签越排越靠后，偶尔发一个请求的客户端排在前面"""
+    fair = make_scheduler()
+    busy = [fair.tag('normal', 'bot') for _ in range(3)]
+    assert busy == [0.0, 1.0, 2.0]
+    assert fair.tag('normal', 'script') == 0.0
+
+
+def test_tags_are_per_queue():
+    """不同队列（优先级通道）的标签互不影响"""
+    fair = make_scheduler()
+    fair.tag('normal', 'bot')
+    fair.tag('normal', 'bot')
+    assert fair.tag('high', 'bot') == 0.0
+
+
+def test_weight_and_cost():
+    """权重为2的客户端每个请求只推进一半的标签，代价按令牌数推进"""
+    fair = make_scheduler(clients={'key-a': {'name': 'heavy', 'weight': 2}})
+    client = fair.identify(api_key='key-a')
+    assert client == 'heavy'
+    assert [fair.tag('normal', client) for _ in range(3)] == [0.0, 0.5, 1.0]
+    assert fair.tag('normal', 'other', cost=3) == 0.0
+    assert fair.tag('normal', 'other') == 3.0
+
+
+def test_idle_client_does_not_bank_credit():
+    """空闲的客户端不会积攒额度: 标签不小于队列当前虚拟时间"""
+    fair = make_scheduler()
+    for _ in range(5):
+        start = fair.tag('normal', 'bot')
+        fair.admit('normal', 'bot', start)
+    assert fair.tag('normal', 'late') == 4.0
+
+
+def test_identify():
+    """未配置的API Key只保留哈希前缀，没有Key时按IP"""
+    fair = make_scheduler(clients={'10.0.0.1': {'name': 'office'}})
+    assert fair.identify(remote_addr='10.0.0.1') == 'office'
+    assert fair.identify(remote_addr='10.0.0.2') == 'ip:10.0.0.2'
+    hashed = fair.identify(api_key='secret', remote_addr='10.0.0.2')
+    assert hashed.startswith('key:') and 'secret' not in hashed
+    assert fair.identify() == 'anonymous'
+
+
+def test_max_in_flight():
+    """达到进行中上限的客户端暂停排队，finish 后恢复"""
+    fair = make_scheduler(max_in_flight=1)
+    start = fair.tag('normal', 'bot')
+    fair.admit('normal', 'bot', start)
+    assert not fair.can_admit('bot')
+    assert fair.can_admit('other')
+    fair.finish('bot')
+    assert fair.can_admit('bot')
+
+
+def test_acquire_serves_in_tag_order():
+    """线程版本: 队首释放后按标签顺序放行，达到进行中上限的客户端让给其他客户端"""
+    fair = make_scheduler(clients={'a': {'name': 'bot', 'max_in_flight': 2}})
+    order = []
+
+    def worker(client):
+        fair.acquire('normal', client, timeout=5)
+        order.append(client)
+        fair.release('normal')
+
+    # 队首占住队列，其他请求依次排队
+    fair.acquire('normal', 'holder', timeout=1)
+    threads = []
+    for client, waiting in (('bot', 1), ('bot', 2), ('bot', 3), ('script', 1)):
+        thread = threading.Thread(target=worker, args=(client,))
+        thread.start()
+        threads.append(thread)
+        wait_for(lambda: fair.stats()[client]['waiting'] == waiting)
+
+    fair.release('normal')
+    for thread in threads[:2] + threads[3:]:
+        thread.join(2)
+    time.sleep(0.1)
+
+    # bot的标签是0,1,2，script的标签是0: script排在bot的第二个请求之前；
+    # bot的第三个请求要等前面的请求 finish（max_in_flight=2）
+    assert order == ['bot', 'script', 'bot']
+    assert threads[2].is_alive()
+    fair.finish('bot')
+    threads[2].join(2)
+    assert order == ['bot', 'script', 'bot', 'bot']
+
+
+def test_acquire_timeout_rolls_back():
+    """排队超时: 抛出 RateLimitExceeded，计为拒绝，没有用掉的份额还给客户端"""
+    fair = make_scheduler()
+    fair.acquire('normal', 'holder', timeout=1)
+
+    with pytest.raises(RateLimitExceeded):
+        fair.acquire('normal', 'bot', timeout=0.05)
+
+    stats = fair.stats()['bot']
+    assert stats['waiting'] == 0
+    assert stats['rejected'] == 1
+    assert stats['in_flight'] == 0
+    # 被拒绝的请求没有推进标签
+    assert fair.tag('normal', 'bot') == 0.0
+
+
+def test_cancel_and_served_stats():
+    """cancel 减少排队数，served 记录排队时间"""
+    fair = make_scheduler()
+    fair.tag('normal', 'bot')
+    fair.cancel('bot', rejected=True)
+    fair.served('bot', 0.2)
+    stats = fair.stats()['bot']
+    assert stats['waiting'] == 0
+    assert stats['rejected'] == 1
+    assert stats['served'] == 1
+    assert fair.gauge('waiting') == {(('client', 'bot'),): 0}
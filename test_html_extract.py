@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 html_extract 商品列表解析（不访问网络）
+
+每个可用的解析引擎（selectolax / lxml / stdlib）都要得到相同的结果；
+没有安装的引擎自动跳过。
+
+运行方式：
+    python -m pytest -q test_html_extract.py
+"""
+import os
+
+import pytest
+
+from html_extract import (ProductRow, available_engines, extract_product_page, extract_product_rows, first_match,
+                          match_variant)
+from bench_html_extract import BeautifulSoup, legacy_search, synthetic_page
+
+
+ENGINES = available_engines()
+
+FIXTURE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'pageList_anonymised.htm')
+
+# (店铺编码, 变体) -> 首个匹配的SKU（ProductSearchResult.first 的结果）
+FIXTURE_FIRST = {
+    ('A01', 'Red / M'): 'A01-1001-RM',
+    ('A01', 'blue / l'): 'A01-1001-BL',
+    ('A01', 'Black / M'): 'X-A01-2001-KM',
+    ('A01', 'Green'): 'A01-4001',
+    ('B02', 'Red / M'): 'B02-3001-RM',
+    ('A01', 'Purple'): None,
+    ('C03', 'Red / M'): None,
+}
+
+
+def read_fixture():
+    with open(FIXTURE, encoding='utf-8') as f:
+        return f.read()
+
+
+SKU = '<span class="inline-block no-new-line maxW240 goodsSKUName white-space">{}</span>'
+
+# 商品行内嵌套变体表格；第二个商品的行没有闭合（html.parser 需要隐式关闭）；
+# 最后一个SKU不在任何行内
+PAGE = (
+    '<div title="页面">'
+    '<table><tbody>'
+    '<tr class="content" title="行自身">'
+    '<td><img title="商品图片A"/><a title="商品A 长标题">商品A</a>'
+    '<table><tbody>'
+    '<tr><td>' + SKU.format('A01-0001-Red') + '</td><td><span title="Red / M">Red / M</span></td></tr>'
+    '<tr><td>' + SKU.format('A01-<b>0001</b>-Blue') + '</td><td><span title="Blue / L">Blue / L</span>'
+    '<span title="">空title</span></td></tr>'
+    '</tbody></table></td>'
+    '<td><span title="已检查">✓</span></td>'
+    '</tr>'
+    '<tr class="content" title="行自身2"><td>' + SKU.format('X-A01-0002 &amp; co') + '</td>'
+    '<td><a title="Red / M 别的商品">B</a></td>'
+    '</tbody></table>'
+    + SKU.format('B02-0003') +
+    '</div>'
+)
+
+EXPECTED = [
+    ProductRow('A01-0001-Red', ['Red / M']),
+    ProductRow('A01-0001-Blue', ['Blue / L']),
+    ProductRow('X-A01-0002 & co', ['Red / M 别的商品']),
+    ProductRow('B02-0003', ['页面', '行自身', '商品图片A', '商品A 长标题', 'Red / M', 'Blue / L',
+                            '已检查', '行自身2', 'Red / M 别的商品']),
+]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_rows(engine):
+    """每个SKU属于最近的 <tr>（行自身的title不算），不在行内的SKU使用整个页面的title"""
+    assert [tuple(row) for row in extract_product_rows(PAGE, engine)] == [tuple(row) for row in EXPECTED]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_engines_agree_on_synthetic_page(engine):
+    """所有引擎在合成页面上的结果与标准库解析器一致"""
+    html = synthetic_page(5, 'A01')
+    rows = extract_product_rows(html, engine)
+    assert len(rows) == 5 * 6
+    assert rows == extract_product_rows(html, 'stdlib')
+    assert rows[0] == ProductRow('A01-0000-0M', ['Red / M', '库存', '价格'])
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_product_count(engine):
+    """商品数按外层商品行（tr.content）统计，不按SKU数（判断最后一页用）"""
+    assert extract_product_page(PAGE, engine).products == 2
+    assert extract_product_page(synthetic_page(5, 'A01'), engine).products == 5
+    page = extract_product_page(read_fixture(), engine)
+    assert (len(page.rows), page.products) == (9, 4)
+
+
+def test_empty_and_unknown_engine():
+    assert extract_product_rows('') == []
+    assert extract_product_page('') == ([], 0)
+    with pytest.raises(ValueError):
+        extract_product_rows(PAGE, 'bs4')
+
+
+def test_match_variant():
+    """只匹配SKU所在行的title（不区分大小写），精确匹配和模糊匹配分开返回"""
+    rows = extract_product_rows(PAGE)
+    exact, contains = match_variant(rows, 'A01', 'red / m')
+    assert exact == [{'sku_name': 'A01-0001-Red', 'title': 'Red / M'}]
+    assert contains == [{'sku_name': 'X-A01-0002 & co', 'title': 'Red / M 别的商品'}]
+
+    exact, contains = match_variant(rows, 'A01', 'Blue / L')
+    assert exact == [{'sku_name': 'A01-0001-Blue', 'title': 'Blue / L'}]
+    assert contains == []
+    assert match_variant(rows, 'C03', 'Red') == ([], [])
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_fixture_first_match(engine):
+    """保存的（匿名化）页面上首个匹配的SKU"""
+    rows = extract_product_rows(read_fixture(), engine)
+    assert len(rows) == 9
+    for (shop_code, variant), expected in FIXTURE_FIRST.items():
+        assert first_match(rows, shop_code, variant) == expected, (shop_code, variant)
+
+
+@pytest.mark.skipif(BeautifulSoup is None, reason="未安装 beautifulsoup4")
+def test_fixture_first_match_agrees_with_legacy():
+    """
+    与改造前的代码（逐层向上查找）比较首个匹配
+
+    结果只允许在原做法匹配错误时不同: 原做法在SKU所在行找不到变体时会继续向上，
+    把同一商品其他变体（甚至其他商品）的title算作匹配，这时它返回的SKU所在行并不包含该变体
+    """
+    html = read_fixture()
+    rows = extract_product_rows(html)
+    titles = {row.sku_name: row.titles for row in rows}
+    for shop_code, variant in FIXTURE_FIRST:
+        legacy = legacy_search(html, shop_code, variant)
+        legacy_first = legacy[0]['sku_name'] if legacy else None
+        new_first = first_match(rows, shop_code, variant)
+        if legacy_first != new_first:
+            assert not any(variant.lower() in title.lower() for title in titles[legacy_first]), (shop_code, variant)
+        else:
+            assert new_first == FIXTURE_FIRST[(shop_code, variant)]
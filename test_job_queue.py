@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 job_queue.JobStore 持久化任务队列（不访问网络）
+
+运行方式：
+    python -m pytest -q test_job_queue.py
+"""
+import os
+import sys
+import time
+import sqlite3
+import subprocess
+
+import pytest
+
+import config
+from job_queue import JOB_DONE, JOB_QUEUED, JOB_RUNNING, JobQueueFull, JobStore
+
+
+BASE = 'https://www.dianxiaomi.com'
+READ = {'url': BASE + '/package/detail.htm?id=1', 'method': 'GET'}
+WRITE = {'url': BASE + '/api/package/batchSetVoided.json', 'method': 'POST', 'data': {'packageIds': '1,2'}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.db'))
+
+
+def dead_pid():
+    """一个已经退出的进程的pid"""
+    proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+    proc.wait()
+    return proc.pid
+
+
+def hand_over(store, token, pid=None, heartbeat_at=None, owner_pid=None):
+    """把本进程领取的 running 任务改成另一个进程（token）名下，heartbeat_at为None时不写心跳记录"""
+    conn = store._get_conn()
+    conn.execute('UPDATE jobs SET owner_token = ?, owner_pid = ? WHERE status = ?',
+                 (token, owner_pid if owner_pid is not None else pid, JOB_RUNNING))
+    if heartbeat_at is not None:
+        conn.execute('INSERT INTO job_workers (token, pid, heartbeat_at) VALUES (?, ?, ?)', (token, pid, heartbeat_at))
+
+
+def claim_all(store, *specs):
+    job_ids = [store.submit(spec) for spec in specs]
+    for _ in specs:
+        assert store.claim() is not None
+    return job_ids
+
+
+def test_submit_claim_complete(store):
+    """按优先级、提交时间领取，完成后保存结果"""
+    low = store.submit(READ, priority=2)
+    high = store.submit(WRITE, priority=0)
+    assert store.claim() == (high, WRITE)
+    assert store.claim() == (low, READ)
+    assert store.claim() is None
+
+    store.complete(high, {'success': True})
+    job = store.get(high)
+    assert (job['status'], job['result']) == (JOB_DONE, {'success': True})
+    assert store.get(low)['status'] == JOB_RUNNING
+    assert store.get('missing') is None
+    assert store.counts() == {JOB_QUEUED: 0, JOB_RUNNING: 1, JOB_DONE: 1}
+
+
+def test_submit_queue_full(store):
+    """排队中的任务数达到上限时抛出 JobQueueFull，已领取的任务不计入"""
+    store.submit(READ, max_queued=2)
+    store.submit(READ, max_queued=2)
+    with pytest.raises(JobQueueFull):
+        store.submit(READ, max_queued=2)
+    store.claim()
+    store.submit(READ, max_queued=2)
+    assert store.counts()[JOB_QUEUED] == 2
+
+
+def test_dead_token_requeues_reads_and_interrupts_writes(store):
+    """进程退出（token没有心跳记录）: GET放回队列，batchSetVoided 标记为执行中断"""
+    read_id, write_id = claim_all(store, READ, WRITE)
+    hand_over(store, 'old', pid=os.getpid())
+
+    assert store.requeue_orphans() == (1, 1)
+    read = store.get(read_id)
+    assert (read['status'], read['started_at']) == (JOB_QUEUED, None)
+    write = store.get(write_id)
+    assert write['status'] == JOB_DONE
+    assert write['result']['interrupted'] is True
+    assert write['result']['request_info'] == {'url': WRITE['url'], 'method': 'POST'}
+
+    # 放回队列的任务可以再次领取
+    assert store.claim() == (read_id, READ)
+    assert store.requeue_orphans() == (0, 0)
+
+
+def test_own_and_live_workers_are_kept(store):
+    """当前进程的任务、心跳正常且进程存在的其他worker的任务不处理"""
+    claim_all(store, READ)
+    assert store.requeue_orphans() == (0, 0)
+
+    hand_over(store, 'other', pid=os.getppid(), heartbeat_at=time.time())
+    assert store.requeue_orphans() == (0, 0)
+    assert store.counts()[JOB_RUNNING] == 1
+
+
+def test_stale_heartbeat(store):
+    """心跳超过 JOB_WORKER_TIMEOUT 的worker视为已退出，即使pid仍然存在"""
+    claim_all(store, READ)
+    hand_over(store, 'other', pid=os.getppid(), heartbeat_at=time.time() - config.JOB_WORKER_TIMEOUT - 1)
+    assert store.requeue_orphans() == (1, 0)
+    assert store._get_conn().execute('SELECT COUNT(*) FROM job_workers WHERE token = ?', ('other',)).fetchone()[0] == 0
+
+
+def test_reused_pid(store):
+    """心跳记录的pid已经属于当前进程（容器重启后pid被重用）时视为已退出"""
+    claim_all(store, WRITE)
+    hand_over(store, 'before-restart', pid=os.getpid(), heartbeat_at=time.time())
+    assert store.requeue_orphans() == (0, 1)
+
+
+def test_heartbeat_keeps_worker_alive(store):
+    """heartbeat 写入当前进程的token，其他进程看到心跳正常"""
+    store.heartbeat()
+    row = store._get_conn().execute('SELECT pid, heartbeat_at FROM job_workers WHERE token = ?',
+                                    (store.token,)).fetchone()
+    assert row[0] == os.getpid()
+    assert time.time() - row[1] < 5
+    assert store._owner_alive(None, 'other', os.getppid(), row[1], time.time())
+    assert not store._owner_alive(None, 'other', dead_pid(), row[1], time.time())
+
+
+def test_legacy_pid_only_rows(store):
+    """旧版本领取的任务（没有token）按pid判断"""
+    read_id, write_id = claim_all(store, READ, WRITE)
+    conn = store._get_conn()
+    conn.execute('UPDATE jobs SET owner_token = NULL, owner_pid = ? WHERE id = ?', (os.getppid(), read_id))
+    conn.execute('UPDATE jobs SET owner_token = NULL, owner_pid = ? WHERE id = ?', (dead_pid(), write_id))
+
+    assert store.requeue_orphans() == (0, 1)
+    assert store.get(read_id)['status'] == JOB_RUNNING
+    assert store.get(write_id)['result']['interrupted'] is True
+
+
+def test_old_database_gets_token_column(tmp_path):
+    """旧版本创建的数据库自动增加 owner_token 列"""
+    db_path = str(tmp_path / 'jobs.db')
+    conn = sqlite3.connect(db_path)
+    conn.execute('CREATE TABLE jobs (id TEXT PRIMARY KEY, status TEXT NOT NULL, priority INTEGER NOT NULL,'
+                 ' spec TEXT NOT NULL, result TEXT, owner_pid INTEGER, created_at REAL NOT NULL,'
+                 ' started_at REAL, finished_at REAL)')
+    conn.close()
+    store = JobStore(db_path)
+    job_id = store.submit(READ)
+    assert store.claim() == (job_id, READ)
+
+
+def test_purge(store):
+    """只删除完成时间早于 older_than 秒前的任务"""
+    job_id, = claim_all(store, READ)
+    store.complete(job_id, {'success': True})
+    assert store.purge(60) == 0
+    store._get_conn().execute('UPDATE jobs SET finished_at = ?', (time.time() - 120,))
+    assert store.purge(60) == 1
+    assert store.get(job_id) is None
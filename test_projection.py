@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 projection 字段投影（不访问网络）
+
+运行方式：
+    python -m pytest -q test_projection.py
+"""
+import pytest
+
+import config
+from projection import apply_select, compile_select, project
+
+
+PAGE = {
+    'code': 0,
+    'data': {
+        'page': {
+            'totalSize': 2,
+            'list': [
+                {'id': 1, 'orderId': 'A-1', 'items': [{'sku': 'x', 'qty': 1}]},
+                {'id': 2, 'orderId': 'A-2', 'items': [{'sku': 'y', 'qty': 2}]},
+            ]
+        }
+    }
+}
+
+
+def test_nested_list_selection():
+    """[] 对列表中的每个元素继续选择，结果保持原来的嵌套结构"""
+    tree = compile_select('data.page.list[].id,data.page.totalSize')
+    assert project(PAGE, tree) == {'data': {'page': {'list': [{'id': 1}, {'id': 2}], 'totalSize': 2}}}
+
+
+def test_path_list_and_whitespace():
+    """select 可以是路径列表，空白和空路径被忽略"""
+    tree = compile_select([' code ', '', 'data.page.list[].items[].sku'])
+    assert project(PAGE, tree) == {
+        'code': 0,
+        'data': {'page': {'list': [{'items': [{'sku': 'x'}]}, {'items': [{'sku': 'y'}]}]}}
+    }
+
+
+def test_whole_value_wins_regardless_of_order():
+    """路径停在某一层时保留整个值，覆盖同一字段更深的路径（与书写顺序无关）"""
+    expected = {'data': {'page': PAGE['data']['page']}}
+    assert project(PAGE, compile_select('data.page.totalSize,data.page')) == expected
+    assert project(PAGE, compile_select('data.page,data.page.totalSize')) == expected
+
+
+def test_trailing_list_marker_keeps_whole_list():
+    """data.page.list[] 保留整个列表"""
+    assert project(PAGE, compile_select('data.page.list[]')) == {'data': {'page': {'list': PAGE['data']['page']['list']}}}
+
+
+def test_missing_and_mismatched_fields_are_omitted():
+    """不存在的字段省略；带[]的字段不是列表时省略；不是对象的值返回None"""
+    tree = compile_select('data.missing,data.page[].x,code.inner')
+    assert project(PAGE, tree) == {'data': {}, 'code': None}
+    assert project([1, 2], compile_select('a')) is None
+
+
+@pytest.mark.parametrize('select', ['', ' , ', 'a..b', 'a.b[', 'a[]x', 'a b', 123, ['a', 1]])
+def test_invalid_select(select):
+    """空表达式、格式错误和非字符串路径抛出 ValueError"""
+    with pytest.raises(ValueError):
+        compile_select(select)
+
+
+def test_conflicting_list_marker():
+    """同一字段在不同路径中带[]与不带[]冲突"""
+    with pytest.raises(ValueError):
+        compile_select('data.list[].id,data.list.id')
+
+
+def test_too_many_paths():
+    """路径数超过 config.SELECT_MAX_PATHS"""
+    with pytest.raises(ValueError):
+        compile_select(','.join(f'f{i}' for i in range(config.SELECT_MAX_PATHS + 1)))
+
+
+def test_apply_select():
+    """只裁剪成功的JSON结果，不修改原结果"""
+    tree = compile_select('code')
+    result = {'success': True, 'response_type': 'json', 'response': PAGE, 'status_code': 200}
+    projected = apply_select(result, tree)
+    assert projected == dict(result, response={'code': 0})
+    assert result['response'] is PAGE
+
+    text = {'success': True, 'response_type': 'text', 'response': '<html></html>'}
+    failed = {'success': False, 'error': '请求超时'}
+    assert apply_select(text, tree) is text
+    assert apply_select(failed, tree) is failed
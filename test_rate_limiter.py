@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 rate_limiter 令牌桶与优先级通道（不访问网络，使用假时钟）
+
+运行方式：
+    python -m pytest -q test_rate_limiter.py
+"""
+import types
+
+import pytest
+
+import config
+import rate_limiter
+from rate_limiter import PriorityLimiter, RateLimiter, RateLimitExceeded, SharedRateLimiter, create_rate_limiter
+
+
+class FakeClock:
+    """替换 rate_limiter.time，时间只在测试中推进，sleep 直接推进时间"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter, 'time',
+                        types.SimpleNamespace(monotonic=fake.monotonic, time=fake.time, sleep=fake.sleep))
+    return fake
+
+
+def make_limiter(rate=2.0, capacity=2.0):
+    limiter = RateLimiter(max_calls=rate, time_window=1.0)
+    limiter.capacity = limiter.tokens = capacity
+    return limiter
+
+
+def make_priority(limiter, families=None):
+    return PriorityLimiter(limiter, lanes=['interactive', 'bulk'], default_lane='interactive',
+                           horizon=0.05, poll_interval=0.25, families=families)
+
+
+def test_reservations_queue_behind_each_other(clock):
+    """令牌用完后余额记为负数，后来的调用方依次排在后面"""
+    limiter = make_limiter()
+    assert [limiter.reserve() for _ in range(4)] == [0.0, 0.0, 0.5, 1.0]
+    clock.now += 1.0
+    assert limiter.reserve() == 0.5
+
+
+def test_cost_weighted_reservation(clock):
+    """一次请求消耗 cost 个令牌，refund 归还"""
+    limiter = make_limiter(rate=2.0, capacity=4.0)
+    assert limiter.reserve(cost=3) == 0.0
+    assert limiter.reserve(cost=3) == pytest.approx(1.0)
+    limiter.refund(3)
+    assert limiter.tokens == pytest.approx(1.0)
+    clock.now += 10
+    assert limiter.reserve(cost=4) == 0.0
+
+
+def test_max_wait_rejects_without_consuming(clock):
+    """预计等待超过 max_wait 时抛出 RateLimitExceeded，不消耗令牌，计入拒绝数"""
+    limiter = make_limiter()
+    limiter.reserve(cost=2)
+    with pytest.raises(RateLimitExceeded) as info:
+        limiter.wait_if_needed(max_wait=0.4)
+    assert info.value.retry_after == pytest.approx(0.5)
+    assert limiter.rejected == 1
+    assert limiter.wait_if_needed(max_wait=0.5) == pytest.approx(0.5)
+    assert limiter.wait_histogram.snapshot()['count'] == 1
+
+
+def test_adjust_rate(clock):
+    """先按旧速率补充令牌再切换速率；decide 返回None时不调整"""
+    limiter = make_limiter(rate=2.0, capacity=10.0)
+    limiter.reserve(cost=10)
+    clock.now += 1.0
+    seen = []
+
+    def halve(rate, changed_at, now):
+        seen.append((rate, changed_at, now))
+        return rate / 2
+
+    assert limiter.adjust_rate(halve) == (1.0, clock.now)
+    assert seen == [(2.0, 0.0, 1001.0)]
+    assert limiter.tokens == pytest.approx(2.0)
+    assert limiter.base_rate == 2.0
+    assert limiter.adjust_rate(lambda rate, changed_at, now: None) == (1.0, 1001.0)
+    # 新速率下补充令牌
+    clock.now += 2.0
+    assert limiter.reserve(cost=4) == 0.0
+
+
+def test_create_local_limiter(clock, monkeypatch):
+    """本地后端保留小数速率，容量至少为1；速率不是正数时报配置错误"""
+    monkeypatch.setattr(config, 'RATE_LIMIT_BACKEND', 'local')
+    limiter = create_rate_limiter(rate=0.5)
+    assert (limiter.rate, limiter.capacity) == (0.5, 1.0)
+    assert limiter.reserve() == 0.0
+    assert limiter.reserve() == 2.0
+    assert create_rate_limiter(rate=2.5, capacity=5).rate == 2.5
+    for rate in (0, -1):
+        with pytest.raises(ValueError):
+            create_rate_limiter(rate=rate)
+
+
+def test_interactive_lane_goes_ahead_of_bulk(clock):
+    """令牌不足时批量通道不占位，交互请求预约未来的令牌，批量请求排在它们后面"""
+    limiter = make_limiter()
+    priority = make_priority(limiter)
+    limiter.reserve(cost=2)
+
+    sleep_time, retry_in = priority.attempt('bulk')
+    assert sleep_time is None
+    assert retry_in == 0.25
+    assert limiter.tokens == pytest.approx(0.0)
+
+    # 交互请求直接预约下一个令牌
+    assert priority.attempt('interactive') == (pytest.approx(0.5), None)
+
+    # 原本批量请求0.5秒后可以领到的令牌已经被交互请求预约
+    clock.now += 0.5
+    assert priority.attempt('bulk')[0] is None
+    clock.now += 0.5
+    assert priority.attempt('bulk') == (0.0, None)
+
+
+def test_bulk_horizon(clock):
+    """批量通道只领取 horizon 秒内能用上的令牌，重试间隔不超过 poll_interval"""
+    limiter = make_limiter()
+    priority = make_priority(limiter)
+    limiter.reserve(cost=2)
+
+    clock.now += 0.4
+    sleep_time, retry_in = priority.attempt('bulk')
+    assert sleep_time is None
+    assert retry_in == pytest.approx(0.05)
+
+    clock.now += 0.06
+    sleep_time, retry_in = priority.attempt('bulk')
+    assert sleep_time == pytest.approx(0.04)
+    assert retry_in is None
+
+
+def test_attempt_rejects_beyond_remaining(clock):
+    """预计等待时间超过剩余可等待时间时两个通道都抛出 RateLimitExceeded"""
+    limiter = make_limiter()
+    priority = make_priority(limiter)
+    limiter.reserve(cost=2)
+
+    with pytest.raises(RateLimitExceeded):
+        priority.attempt('interactive', remaining=0.4)
+    with pytest.raises(RateLimitExceeded):
+        priority.attempt('bulk', remaining=0.4)
+    assert priority.attempt('bulk', remaining=1.0)[0] is None
+    assert limiter.tokens == pytest.approx(0.0)
+
+
+def test_wait_if_needed_counts_lane_stats(clock):
+    """wait_if_needed 按通道统计放行和拒绝；未知优先级抛出 ValueError"""
+    limiter = make_limiter()
+    priority = make_priority(limiter)
+    assert priority.wait_if_needed(priority='bulk', cost=2) == 0.0
+    with pytest.raises(RateLimitExceeded):
+        priority.wait_if_needed(max_wait=0.1, priority='bulk')
+    assert priority.wait_if_needed(priority='BULK') == pytest.approx(0.5)
+
+    stats = priority.lane_stats()['bulk']
+    assert (stats['waiting'], stats['served'], stats['rejected']) == (0, 2, 1)
+    with pytest.raises(ValueError):
+        priority.resolve('urgent')
+
+
+def test_cost_clamped_and_family_refund(clock):
+    """代价按最小容量截断；端点族子预算领到而账号令牌桶领不到时归还子预算"""
+    limiter = make_limiter(rate=2.0, capacity=2.0)
+    family = make_limiter(rate=1.0, capacity=3.0)
+    priority = make_priority(limiter, families={'list': family})
+
+    assert priority.attempt('interactive', cost=10, family='list') == (0.0, None)
+    assert limiter.tokens == pytest.approx(0.0)
+    assert family.tokens == pytest.approx(1.0)
+
+    assert priority.attempt('bulk', family='list')[0] is None
+    assert family.tokens == pytest.approx(1.0)
+
+    # 两边都预约成功时等待较晚的那个
+    assert priority.attempt('interactive', family='list') == (pytest.approx(0.5), None)
+    assert priority.attempt('interactive', family='list') == (pytest.approx(1.0), None)
+
+
+def test_shared_limiter_shares_budget(tmp_path, clock):
+    """同一个数据库文件中的同名令牌桶由所有实例（worker）共用"""
+    db_path = str(tmp_path / 'rate_limiter.db')
+    first = SharedRateLimiter(db_path, name='shop-a', rate=2.0, capacity=2)
+    second = SharedRateLimiter(db_path, name='shop-a', rate=2.0, capacity=2)
+    other = SharedRateLimiter(db_path, name='shop-b', rate=2.0, capacity=2)
+
+    assert first.reserve() == 0.0
+    assert second.reserve() == 0.0
+    assert first.reserve() == 0.5
+    with pytest.raises(RateLimitExceeded):
+        second.reserve(max_wait=0.5)
+    assert other.reserve() == 0.0
+
+    second.refund()
+    assert second.reserve() == 0.5
+    clock.now += 10
+    assert first.reserve(cost=2) == 0.0
+
+
+def test_shared_limiter_adjust_rate_and_keep_rate(tmp_path, clock):
+    """调整后的速率对所有实例生效；keep_rate 时重启不重置，配置速率变化时回到配置值"""
+    db_path = str(tmp_path / 'rate_limiter.db')
+    first = SharedRateLimiter(db_path, rate=4.0, capacity=4, keep_rate=True)
+    second = SharedRateLimiter(db_path, rate=4.0, capacity=4, keep_rate=True)
+
+    assert first.adjust_rate(lambda rate, changed_at, now: rate / 2) == (2.0, clock.now)
+    second.reserve(cost=4)
+    assert second.rate == 2.0
+    assert second.reserve() == pytest.approx(0.5)
+
+    assert SharedRateLimiter(db_path, rate=4.0, capacity=4, keep_rate=True).rate == 2.0
+    assert SharedRateLimiter(db_path, rate=4.0, capacity=4, keep_rate=False).rate == 4.0
+    assert SharedRateLimiter(db_path, rate=3.0, capacity=4, keep_rate=True).rate == 3.0
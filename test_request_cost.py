@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 request_cost.CostTable（不访问网络）
+
+运行方式：
+    python -m pytest -q test_request_cost.py
+"""
+from request_cost import CostTable
+
+
+BASE = 'https://www.dianxiaomi.com'
+
+RULES = [
+    {'pattern': r'/api/package/list\.json$', 'cost': 1, 'field': 'pageSize', 'per': 100, 'family': 'list'},
+    {'pattern': r'/api/package/', 'cost': 2},
+]
+
+
+def make_table(max_cost=8):
+    return CostTable(rules=RULES, default=1, max_cost=max_cost)
+
+
+def test_scaled_by_form_field():
+    """每 per 条记录消耗 cost 个令牌，不足 per 条按 per 计"""
+    table = make_table()
+    url = BASE + '/api/package/list.json'
+    assert table.cost('POST', url, {'pageSize': '300'}) == (3.0, 'list')
+    assert table.cost('POST', url, {'pageSize': 301}) == (4.0, 'list')
+    assert table.cost('POST', url, {'pageSize': 50}) == (1.0, 'list')
+
+
+def test_field_sources():
+    """字段可以来自urlencoded表单、GET参数或URL查询串；GET请求不读表单"""
+    table = make_table()
+    url = BASE + '/api/package/list.json'
+    assert table.cost('post', url, 'pageSize=200&pageNo=1')[0] == 2.0
+    assert table.cost('POST', url, b'pageSize=500')[0] == 5.0
+    assert table.cost('GET', url, params={'pageSize': 200})[0] == 2.0
+    assert table.cost('GET', url + '?pageSize=400')[0] == 4.0
+    assert table.cost('GET', url, data={'pageSize': 400})[0] == 1.0
+
+
+def test_unusable_field_falls_back_to_base_cost():
+    """字段缺失、为空、不是有限的数字或不是正数时使用基础令牌数"""
+    table = make_table()
+    url = BASE + '/api/package/list.json'
+    for data in (None, {}, {'pageSize': ''}, {'pageSize': 'abc'}, {'pageSize': 0}, {'pageSize': -100},
+                 {'pageSize': 'inf'}, {'pageSize': float('inf')}, {'pageSize': 'nan'}):
+        assert table.cost('POST', url, data) == (1.0, 'list')
+
+
+def test_first_matching_rule_and_default():
+    """按顺序匹配第一条规则；不匹配时使用默认代价，没有端点族"""
+    table = make_table()
+    assert table.cost('POST', BASE + '/api/package/batchInvalid.json', {'pageSize': 900}) == (2.0, None)
+    assert table.cost('POST', BASE + '/api/order/list.json') == (1.0, None)
+
+
+def test_max_cost():
+    """单个请求最多消耗 max_cost 个令牌（默认代价同样受限）"""
+    url = BASE + '/api/package/list.json'
+    assert make_table(max_cost=8).cost('POST', url, {'pageSize': 5000}) == (8.0, 'list')
+    assert CostTable(rules=[], default=3, max_cost=2).cost('POST', url) == (2.0, None)
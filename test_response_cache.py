@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试 response_cache 响应缓存（不访问网络）
+
+运行方式：
+    python -m pytest -q test_response_cache.py
+"""
+import time
+import types
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, SharedInvalidations
+
+
+BASE = 'https://www.dianxiaomi.com'
+SEARCH = BASE + '/api/package/searchPackage.json'
+
+RULES = [(r'/api/package/searchPackage\.json$', 60), (r'/package/', 30)]
+NEVER = [r'batchInvalid']
+
+
+class FakeClock:
+    """替换 response_cache.time，monotonic 只在测试中推进"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    @staticmethod
+    def time():
+        return time.time()
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(response_cache, 'time', types.SimpleNamespace(monotonic=fake.monotonic, time=fake.time))
+    return fake
+
+
+def make_cache(max_entries=100, max_bytes=10000, shared=None):
+    return ResponseCache(rules=RULES, never=NEVER, max_entries=max_entries, max_bytes=max_bytes, shared=shared)
+
+
+def result(value):
+    return {'success': True, 'response_type': 'json', 'response': {'value': value}, 'status_code': 200}
+
+
+def test_ttl_for():
+    """按顺序匹配第一条规则；never 优先；只缓存GET/POST"""
+    cache = make_cache()
+    assert cache.ttl_for('POST', SEARCH + '?x=1') == 60
+    assert cache.ttl_for('get', BASE + '/package/pageList.htm') == 30
+    assert cache.ttl_for('POST', BASE + '/package/batchInvalid.json') is None
+    assert cache.ttl_for('DELETE', SEARCH) is None
+    assert cache.ttl_for('POST', BASE + '/api/order/list.json') is None
+
+
+def test_key_normalisation():
+    """参数顺序、URL查询参数与params的写法、主机名大小写不影响缓存键"""
+    key = ResponseCache.make_key('post', SEARCH, data={'b': 2, 'a': '1'}, params={'y': 1, 'x': 2})
+    assert key == ResponseCache.make_key('POST', SEARCH, data={'a': '1', 'b': 2}, params={'x': 2, 'y': 1})
+    assert key == ResponseCache.make_key('POST', SEARCH.replace('dianxiaomi', 'DianXiaoMi') + '?y=1',
+                                         data={'a': '1', 'b': 2}, params={'x': 2})
+    assert key != ResponseCache.make_key('POST', SEARCH, data={'a': '1', 'b': 3}, params={'x': 2, 'y': 1})
+    assert key != ResponseCache.make_key('POST', SEARCH, data={'b': 2, 'a': '1'}, params={'y': 1, 'x': 2}, raw=True)
+    assert key != ResponseCache.make_key('POST', SEARCH, data={'b': 2, 'a': '1'}, params={'y': 1, 'x': 2},
+                                         account='shop-b')
+
+
+def test_hit_returns_copy(clock):
+    """命中时返回带 cache='hit' 和 cache_age 的副本"""
+    cache = make_cache()
+    key = ResponseCache.make_key('POST', SEARCH, data={'orderId': 'A-1'})
+    assert cache.get(key) is None
+    cache.put(key, SEARCH, result(1), ttl=60, size=10)
+    clock.now += 2.5
+    cached = cache.get(key)
+    assert cached['response'] == {'value': 1}
+    assert (cached['cache'], cached['cache_age']) == ('hit', 2.5)
+    cached['response'] = None
+    assert cache.get(key)['response'] == {'value': 1}
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_ttl_expiry(clock):
+    """过期的条目在读取时删除并计为未命中"""
+    cache = make_cache()
+    cache.put('k', SEARCH, result(1), ttl=60, size=10)
+    clock.now += 59.9
+    assert cache.get('k') is not None
+    clock.now += 0.1
+    assert cache.get('k') is None
+    assert cache.stats()['entries'] == 0
+    assert cache.stats()['bytes'] == 0
+
+
+def test_lru_eviction_by_entries(clock):
+    """条目数超过上限时淘汰最久未使用的条目（读取会刷新使用顺序）"""
+    cache = make_cache(max_entries=2)
+    cache.put('a', SEARCH, result('a'), ttl=60, size=1)
+    cache.put('b', SEARCH, result('b'), ttl=60, size=1)
+    assert cache.get('a') is not None
+    cache.put('c', SEARCH, result('c'), ttl=60, size=1)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    assert cache.evictions == 1
+
+
+def test_byte_cap_eviction(clock):
+    """总字节数超过上限时从最旧的条目开始淘汰；单个响应超过上限时不缓存"""
+    cache = make_cache(max_bytes=100)
+    cache.put('a', SEARCH, result('a'), ttl=60, size=40)
+    cache.put('b', SEARCH, result('b'), ttl=60, size=40)
+    cache.put('c', SEARCH, result('c'), ttl=60, size=40)
+    assert cache.get('a') is None
+    assert cache.stats()['bytes'] == 80
+    cache.put('huge', SEARCH, result('huge'), ttl=60, size=101)
+    assert cache.get('huge') is None
+    assert cache.stats()['entries'] == 2
+
+    # 覆盖同一个键时先减去旧条目的大小
+    cache.put('b', SEARCH, result('b2'), ttl=60, size=10)
+    assert cache.stats()['bytes'] == 50
+
+
+def test_invalidate_by_url(clock):
+    """按URL失效时忽略查询参数，只删除该URL的条目"""
+    cache = make_cache()
+    other = BASE + '/package/pageList.htm'
+    cache.put('a', SEARCH + '?x=1', result('a'), ttl=60, size=1)
+    cache.put('b', SEARCH, result('b'), ttl=60, size=1)
+    cache.put('c', other, result('c'), ttl=60, size=1)
+    assert cache.invalidate(SEARCH + '?y=2') == 2
+    assert cache.get('c') is not None
+    assert cache.invalidate() == 1
+    assert cache.scope == 'worker'
+
+
+def test_shared_invalidation_applied_by_other_worker(tmp_path, clock):
+    """一个worker记录的失效由另一个worker在下次读缓存时执行，自己的记录不重复执行"""
+    db_path = str(tmp_path / 'response_cache.db')
+    first = make_cache(shared=SharedInvalidations(db_path))
+    second = make_cache(shared=SharedInvalidations(db_path))
+    other = BASE + '/package/pageList.htm'
+    for cache in (first, second):
+        cache.put('search', SEARCH, result('search'), ttl=60, size=1)
+        cache.put('page', other, result('page'), ttl=60, size=1)
+
+    assert first.invalidate(SEARCH + '?orderId=A-1') == 1
+    assert first.get('search') is None
+    assert first.remote_invalidations == 0
+
+    assert second.get('search') is None
+    assert second.get('page') is not None
+    assert second.remote_invalidations == 1
+    assert second.scope == 'all_workers'
+
+    # 清空全部同样同步到其他worker
+    second.invalidate()
+    assert first.get('page') is None
+    assert first.remote_invalidations == 1
+
+
+def test_shared_invalidations_skip_records_before_start(tmp_path):
+    """进程启动前的失效记录与本进程的缓存无关"""
+    db_path = str(tmp_path / 'response_cache.db')
+    SharedInvalidations(db_path).publish(None)
+    shared = SharedInvalidations(db_path)
+    assert shared.poll() == []
+    record_id = SharedInvalidations(db_path).publish(SEARCH)
+    assert shared.poll() == [(record_id, SEARCH)]